@@ -25,6 +25,10 @@ from oio.common.redis_conn import RedisConn
 
 
 EXPIRE_TIME = 60  # seconds
+# Number of containers summed by each step of an account refresh
+REFRESH_BATCH_SIZE = 1000
+# Lifetime of the partial sums of an interrupted refresh (seconds)
+REFRESH_EXPIRE_TIME = 86400
 
 account_fields = ['ns', 'name', 'ctime', 'containers', 'objects',
                   'bytes', 'storage_policy']
@@ -47,7 +51,22 @@ class AccountBackend(RedisConn):
                end;
                """
 
-    lua_update_container = (lua_is_sup + """
+    # Compare strings in byte order, like ZRANGEBYLEX does: the comparison
+    # operators of Lua depend on the locale of the Redis server.
+    lua_bytes_le = """
+               local bytes_le = function(a,b)
+                 for i = 1, math.min(string.len(a), string.len(b)) do
+                   local byte_a = string.byte(a, i);
+                   local byte_b = string.byte(b, i);
+                   if byte_a ~= byte_b then
+                     return byte_a < byte_b;
+                   end;
+                 end;
+                 return string.len(a) <= string.len(b);
+               end;
+               """
+
+    lua_update_container = (lua_is_sup + lua_bytes_le + """
                local account_id = redis.call('HGET', KEYS[4], 'id');
                if not account_id then
                  if ARGV[6] == 'True' then
@@ -131,27 +150,135 @@ class AccountBackend(RedisConn):
                if inc_bytes ~= 0 then
                  redis.call('HINCRBY', KEYS[4], 'bytes', inc_bytes);
                end;
+
+               -- If a refresh of the account has already summed this
+               -- container, also apply the change to its partial sums.
+               local refresh_key = 'refresh:' .. KEYS[1];
+               local cursor = redis.call('HGET', refresh_key, 'cursor');
+               if cursor and bytes_le(name, cursor) then
+                 redis.call('HINCRBY', refresh_key, 'objects', inc_objects);
+                 redis.call('HINCRBY', refresh_key, 'bytes', inc_bytes);
+               end;
                """)
 
-    lua_refresh_account = """
+    # Sum the counters of the next batch of containers into a temporary
+    # key, and swap them in the account when all containers have been
+    # walked. Returns the number of containers summed by this batch,
+    # whether the refresh is done, the number of containers summed so far
+    # and the number of containers of the account when it started.
+    lua_refresh_account_batch = """
         local account_id = redis.call('HGET', KEYS[1], 'id');
         if not account_id then
             return redis.error_reply('no_account');
         end;
 
-        local containers = redis.call('ZRANGE', KEYS[2], 0, -1);
-        local container_key = ''
+        local cursor = redis.call('HGET', KEYS[4], 'cursor');
+        if not cursor then
+            cursor = '';
+            redis.call('HMSET', KEYS[4], 'cursor', cursor,
+                       'bytes', 0, 'objects', 0, 'scanned', 0,
+                       'total', redis.call('ZCARD', KEYS[2]),
+                       'start', ARGV[2]);
+            redis.call('SADD', KEYS[5], ARGV[3]);
+        end;
+
+        local min = '-';
+        if cursor ~= '' then
+            min = '(' .. cursor;
+        end;
+        local batch_size = tonumber(ARGV[1]);
+        local containers = redis.call('ZRANGEBYLEX', KEYS[2], min, '+',
+                                      'LIMIT', 0, batch_size);
         local bytes_sum = 0;
         local objects_sum = 0;
         for _,container in ipairs(containers) do
-            container_key = KEYS[3] .. container;
-            bytes_sum = bytes_sum + redis.call('HGET', container_key, 'bytes')
-            objects_sum = objects_sum + redis.call('HGET', container_key,
-                                                   'objects')
+            local counters = redis.call('HMGET', KEYS[3] .. container,
+                                        'bytes', 'objects');
+            bytes_sum = bytes_sum + (tonumber(counters[1]) or 0);
+            objects_sum = objects_sum + (tonumber(counters[2]) or 0);
         end;
 
-        redis.call('HMSET', KEYS[1], 'bytes', bytes_sum,
-                   'objects', objects_sum)
+        if #containers > 0 then
+            redis.call('HSET', KEYS[4], 'cursor', containers[#containers]);
+            redis.call('HINCRBY', KEYS[4], 'bytes', bytes_sum);
+            redis.call('HINCRBY', KEYS[4], 'objects', objects_sum);
+        end;
+        local total = tonumber(redis.call('HGET', KEYS[4], 'total'));
+        local scanned = redis.call('HINCRBY', KEYS[4], 'scanned',
+                                   #containers);
+
+        if #containers < batch_size then
+            local sums = redis.call('HMGET', KEYS[4], 'bytes', 'objects');
+            redis.call('HMSET', KEYS[1], 'bytes', sums[1],
+                       'objects', sums[2]);
+            redis.call('DEL', KEYS[4]);
+            redis.call('SREM', KEYS[5], ARGV[3]);
+            return {#containers, 1, scanned, total};
+        end;
+        redis.call('EXPIRE', KEYS[4], tonumber(ARGV[4]));
+        return {#containers, 0, scanned, total};
+        """
+
+    # Build a page of the listing of an account's containers: skip to
+    # the prefix, roll containers up on the delimiter, and fetch the
+    # counters of the containers that are listed. Each entry is
+    # {name, objects, bytes, 1 for a prefix or 0 for a container, mtime}.
+    lua_list_containers = """
+        local limit = tonumber(ARGV[1]);
+        local marker = ARGV[2];
+        local end_marker = ARGV[3];
+        local prefix = ARGV[4];
+        local delimiter = ARGV[5];
+
+        local min = '-';
+        local max = '+';
+        if end_marker ~= '' then
+            max = '(' .. end_marker;
+        end;
+        if marker ~= '' and marker >= prefix then
+            min = '(' .. marker;
+        elseif prefix ~= '' then
+            min = '[' .. prefix;
+        end;
+
+        local results = {};
+        while #results < limit do
+            local wanted = limit - #results;
+            local containers = redis.call('ZRANGEBYLEX', KEYS[1], min, max,
+                                          'LIMIT', 0, wanted);
+            local rolled_up = false;
+            for _,container in ipairs(containers) do
+                if string.sub(container, 1, #prefix) ~= prefix then
+                    return results;
+                end;
+                local dir_end = nil;
+                if delimiter ~= '' then
+                    dir_end = string.find(container, delimiter, #prefix + 1,
+                                          true);
+                end;
+                if dir_end then
+                    local dir_name = string.sub(container, 1, dir_end);
+                    if dir_name ~= marker then
+                        table.insert(results, {dir_name, 0, 0, 1, 0});
+                    end;
+                    -- Skip all containers sharing this prefix
+                    min = '[' .. string.sub(container, 1, dir_end - 1) ..
+                          string.char(string.byte(delimiter) + 1);
+                    rolled_up = true;
+                    break;
+                end;
+                local counters = redis.call('HMGET', KEYS[2] .. container,
+                                            'objects', 'bytes', 'mtime');
+                table.insert(results, {container, counters[1] or 0,
+                                       counters[2] or 0, 0,
+                                       counters[3] or 0});
+                min = '(' .. container;
+            end;
+            if not rolled_up and #containers < wanted then
+                break;
+            end;
+        end;
+        return results;
         """
 
     lua_flush_account = """
@@ -176,10 +303,12 @@ class AccountBackend(RedisConn):
         super(AccountBackend, self).__init__(conf, connection)
         self.script_update_container = self.register_script(
             self.lua_update_container)
-        self.script_refresh_account = self.register_script(
-            self.lua_refresh_account)
+        self.script_refresh_account_batch = self.register_script(
+            self.lua_refresh_account_batch)
         self.script_flush_account = self.register_script(
             self.lua_flush_account)
+        self.script_list_containers = self.register_script(
+            self.lua_list_containers)
 
     @staticmethod
     def ckey(account, name):
@@ -296,10 +425,11 @@ class AccountBackend(RedisConn):
         accounts = conn.hkeys('accounts:')
         return accounts
 
-    def update_container(self, account_id, name, mtime, dtime, object_count,
-                         bytes_used, autocreate_account=None,
-                         autocreate_container=True):
-        conn = self.conn
+    def _update_container_script_args(self, account_id, name, mtime, dtime,
+                                      object_count, bytes_used,
+                                      autocreate_account=None,
+                                      autocreate_container=True):
+        """Build the keys and arguments of the container update script."""
         if not account_id or not name:
             raise BadRequest("Missing account or container")
 
@@ -325,125 +455,185 @@ class AccountBackend(RedisConn):
         args = [name, mtime, dtime, object_count, bytes_used,
                 str(autocreate_account), Timestamp(time()).normal, EXPIRE_TIME,
                 str(autocreate_container)]
+        return keys, args
+
+    @staticmethod
+    def _update_container_error(account_id, name, exc):
+        """
+        Convert an error returned by the container update script
+        to an HTTP exception, or return None if it is unknown.
+        """
+        if str(exc) == "no_account":
+            return NotFound("Account %s not found" % account_id)
+        if str(exc) == "no_container":
+            return NotFound("Container %s not found" % name)
+        elif str(exc) == "no_update_needed":
+            return Conflict("No update needed, "
+                            "event older than last container update")
+        return None
+
+    def update_container(self, account_id, name, mtime, dtime, object_count,
+                         bytes_used, autocreate_account=None,
+                         autocreate_container=True):
+        conn = self.conn
+        keys, args = self._update_container_script_args(
+            account_id, name, mtime, dtime, object_count, bytes_used,
+            autocreate_account=autocreate_account,
+            autocreate_container=autocreate_container)
         try:
             self.script_update_container(keys=keys, args=args, client=conn)
         except redis.exceptions.ResponseError as exc:
-            if str(exc) == "no_account":
-                raise NotFound("Account %s not found" % account_id)
-            if str(exc) == "no_container":
-                raise NotFound("Container %s not found" % name)
-            elif str(exc) == "no_update_needed":
-                raise Conflict("No update needed, "
-                               "event older than last container update")
-            else:
+            error = self._update_container_error(account_id, name, exc)
+            if error is None:
                 raise
+            raise error
 
         return name
 
-    def _raw_listing(self, account_id, limit, marker, end_marker, delimiter,
-                     prefix):
-        """Fetch tuple list of containers matching options.
-           Tuple is [(container|prefix),
-                     0 *reserved for objects*,
-                     0 *reserved for size*,
-                     0 for container, 1 for prefix]"""
-        conn = self.conn
-        if delimiter and not prefix:
-            prefix = ''
-        orig_marker = marker
-
-        results = []
-        while len(results) < limit:
-            min = '-'
-            max = '+'
-            if end_marker:
-                max = '(' + end_marker
-            if marker and marker >= prefix:
-                min = '(' + marker
-            elif prefix:
-                min = '[' + prefix
-
-            offset = 0
-
-            container_ids = conn.zrangebylex('containers:%s' % account_id, min,
-                                             max, offset, limit - len(results))
-            container_ids = [cid.decode('utf8', errors='ignore')
-                             for cid in container_ids]
-
-            if prefix is None:
-                containers = [[c_id, 0, 0, 0, 0] for c_id in container_ids]
-                return containers
-            if not delimiter:
-                if not prefix:
-                    containers = [[c_id, 0, 0, 0, 0] for c_id in container_ids]
-                    return containers
-                else:
-                    containers = [[c_id, 0, 0, 0, 0] for c_id in container_ids
-                                  if c_id.startswith(prefix)]
-                    return containers
-
-            count = 0
-            for container_id in container_ids:
-                count += 1
-                marker = container_id
-                if len(results) >= limit\
-                        or not container_id.startswith(prefix):
-                    return results
-                end = container_id.find(delimiter, len(prefix))
-                if end > 0:
-                    marker = container_id[:end] + chr(ord(delimiter) + 1)
-                    dir_name = container_id[:end + 1]
-                    if dir_name != orig_marker:
-                        results.append([dir_name, 0, 0, 1, 0])
-                    break
-                results.append([container_id, 0, 0, 0, 0])
-            if not count:
-                break
+    def update_containers(self, account_id, updates, autocreate_account=None,
+                          autocreate_container=True):
+        """
+        Apply several container updates in one pipelined execution
+        of the container update script.
+
+        :param updates: list of dictionaries with "name", "mtime", "dtime",
+            "objects" and "bytes" keys, like the body of a single update
+        :returns: a list of dictionaries with the "name" and the HTTP
+            "status" of each update, plus a "message" in case of error
+        """
+        if not account_id:
+            raise BadRequest("Missing account")
+
+        results = list()
+        pipeline = self.conn.pipeline(transaction=False)
+        for update in updates:
+            name = update.get('name')
+            result = {'name': name}
+            results.append(result)
+            try:
+                keys, args = self._update_container_script_args(
+                    account_id, name, update.get('mtime'),
+                    update.get('dtime'), update.get('objects'),
+                    update.get('bytes'),
+                    autocreate_account=autocreate_account,
+                    autocreate_container=autocreate_container)
+            except (BadRequest, TypeError, ValueError) as exc:
+                result['status'] = 400
+                result['message'] = str(exc)
+                continue
+            self.script_update_container(keys=keys, args=args,
+                                         client=pipeline)
+            result['status'] = None
+
+        replies = iter(pipeline.execute(raise_on_error=False))
+        for result in results:
+            if result['status'] is not None:
+                continue
+            reply = next(replies)
+            if not isinstance(reply, Exception):
+                result['status'] = 200
+                continue
+            error = None
+            if isinstance(reply, redis.exceptions.ResponseError):
+                error = self._update_container_error(
+                    account_id, result['name'], reply)
+            if error is None:
+                result['status'] = 500
+                result['message'] = str(reply)
+            else:
+                result['status'] = error.code
+                result['message'] = error.description
         return results
 
     def list_containers(self, account_id, limit=1000, marker=None,
                         end_marker=None, prefix=None, delimiter=None):
-        raw_list = self._raw_listing(account_id, limit=limit, marker=marker,
-                                     end_marker=end_marker, prefix=prefix,
-                                     delimiter=delimiter)
-        pipeline = self.conn.pipeline(True)
-        # skip prefix
-        for container in [entry for entry in raw_list if not entry[3]]:
-            pipeline.hmget(AccountBackend.ckey(account_id, container[0]),
-                           'objects', 'bytes', 'mtime')
-        res = pipeline.execute()
-
-        i = 0
-        for container in raw_list:
-            if not container[3]:
-                container[1] = int_value(res[i][0], 0)
-                container[2] = int_value(res[i][1], 0)
-                container[4] = float_value(res[i][2], 0.0)
-                i += 1
-
-        return raw_list
+        """
+        Get a page of the listing of the containers of an account.
+
+        :returns: a list of [name, objects, bytes, is_prefix, mtime],
+            where is_prefix is 1 for a prefix rolled up on the delimiter
+            and 0 for a container
+        """
+        keys = ["containers:%s" % account_id,
+                "container:%s:" % account_id]
+        args = [limit, marker or '', end_marker or '', prefix or '',
+                delimiter or '']
+        raw_list = self.script_list_containers(keys=keys, args=args,
+                                               client=self.conn)
+        return [[name.decode('utf8', errors='ignore'),
+                 int_value(objects, 0), int_value(bytes_used, 0),
+                 int(is_prefix), float_value(mtime, 0.0)]
+                for name, objects, bytes_used, is_prefix, mtime in raw_list]
 
     def status(self):
         conn = self.conn
         account_count = conn.hlen('accounts:')
         status = {'account_count': account_count}
+
+        refreshing = sorted(conn.smembers('refreshing:'))
+        pipeline = conn.pipeline(False)
+        for account_id in refreshing:
+            pipeline.hmget('refresh:%s' % account_id,
+                           'scanned', 'total', 'start')
+        refreshes = dict()
+        for account_id, progress in zip(refreshing, pipeline.execute()):
+            if progress[0] is None:
+                # Interrupted refresh, whose partial sums have expired
+                conn.srem('refreshing:', account_id)
+                continue
+            refreshes[account_id] = {
+                'scanned': int_value(progress[0], 0),
+                'total': int_value(progress[1], 0),
+                'start': float_value(progress[2], 0.0)}
+        status['refreshing'] = refreshes
         return status
 
-    def refresh_account(self, account_id):
+    def refresh_account_batch(self, account_id,
+                              batch_size=REFRESH_BATCH_SIZE):
+        """
+        Run one step of the refresh of an account's counters, summing
+        the counters of at most `batch_size` containers. An interrupted
+        refresh is resumed where it stopped.
+
+        :returns: a dictionary with the number of containers summed by
+            this step ("batch"), summed since the beginning of the refresh
+            ("scanned"), the number of containers of the account when
+            the refresh started ("total"), and whether the refresh
+            is complete ("done")
+        """
         if not account_id:
             raise BadRequest("Missing account")
+        if batch_size < 1:
+            raise BadRequest("Batch size must be positive")
 
         keys = ["account:%s" % account_id,
                 "containers:%s" % account_id,
-                "container:%s:" % account_id]
+                "container:%s:" % account_id,
+                "refresh:%s" % account_id,
+                "refreshing:"]
+        args = [batch_size, Timestamp(time()).normal, account_id,
+                REFRESH_EXPIRE_TIME]
 
         try:
-            self.script_refresh_account(keys=keys, client=self.conn)
+            batch, done, scanned, total = self.script_refresh_account_batch(
+                keys=keys, args=args, client=self.conn)
         except redis.exceptions.ResponseError as exc:
             if str(exc) == "no_account":
                 raise NotFound(account_id)
             else:
                 raise
+        return {'batch': batch, 'done': bool(done),
+                'scanned': scanned, 'total': total}
+
+    def refresh_account(self, account_id, batch_size=REFRESH_BATCH_SIZE):
+        """
+        Recompute the counters of an account from its containers,
+        in steps of `batch_size` containers so that Redis is never
+        blocked for long.
+        """
+        while not self.refresh_account_batch(account_id,
+                                             batch_size=batch_size)['done']:
+            pass
 
     def flush_account(self, account_id):
         if not account_id:
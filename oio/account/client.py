@@ -195,6 +195,24 @@ class AccountClient(HttpApi):
                                            data=json.dumps(metadata), **kwargs)
         return body
 
+    def container_update_many(self, account, updates, **kwargs):
+        """
+        Update account with the metadata of several containers,
+        in one request.
+
+        :param account: name of the account to update
+        :type account: `str`
+        :param updates: list of container metadata dictionaries
+            ("name", "bytes", "objects", "mtime", "dtime")
+        :type updates: `list`
+        :returns: a list of dictionaries with the "name" and the
+            "status" of each update, and a "message" in case of error
+        """
+        _resp, body = self.account_request(account, 'POST',
+                                           'container/update_many',
+                                           data=json.dumps(updates), **kwargs)
+        return body
+
     def container_reset(self, account, container, mtime, **kwargs):
         """
         Reset container of an account
@@ -211,14 +229,24 @@ class AccountClient(HttpApi):
         self.account_request(account, 'POST', 'container/reset',
                              data=json.dumps(metadata), **kwargs)
 
-    def account_refresh(self, account, **kwargs):
+    def account_refresh(self, account, batch_size=None, **kwargs):
         """
         Refresh counters of an account
 
         :param account: name of the account to refresh
         :type account: `str`
+        :param batch_size: if set, run only one step of the refresh,
+            summing at most this number of containers
+        :type batch_size: `int`
+        :returns: the progress of the refresh if `batch_size` is set
+            (a dictionary with "batch", "scanned", "total" and "done")
         """
-        self.account_request(account, 'POST', 'refresh', **kwargs)
+        params = None
+        if batch_size is not None:
+            params = {'batch_size': batch_size}
+        _resp, body = self.account_request(account, 'POST', 'refresh',
+                                           params=params, **kwargs)
+        return body
 
     def account_flush(self, account, **kwargs):
         """
@@ -60,6 +60,8 @@ class Account(WerkzeugApp):
             Rule('/v1.0/account/flush', endpoint='account_flush'),
             Rule('/v1.0/account/container/update',
                  endpoint='account_container_update'),
+            Rule('/v1.0/account/container/update_many',
+                 endpoint='account_container_update_many'),
             Rule('/v1.0/account/container/reset',
                  endpoint='account_container_reset')
         ])
@@ -77,7 +79,8 @@ class Account(WerkzeugApp):
     # ~~~~~~~~~~~
     # Return a summary of the target account service. The body of the reply
     # will present a count of the objects in the databse, formatted as a JSON
-    # object.
+    # object, and the progress of the account refreshes that are running
+    # (or have been interrupted).
     #
     # Sample request:
     #
@@ -97,9 +100,10 @@ class Account(WerkzeugApp):
     #    Date: Wed, 22 Nov 2017 09:45:03 GMT
     #    Connection: keep-alive
     #    Content-Type: text/json; charset=utf-8
-    #    Content-Length: 20
+    #    Content-Length: 107
     #
-    #    {"account_count": 0}
+    #    {"account_count": 1, "refreshing": {"myaccount": {"scanned": 2000,
+    #     "total": 15000, "start": 1533125845.08765}}}
     #
     # }}ACCT
     def on_status(self, req):
@@ -414,6 +418,70 @@ class Account(WerkzeugApp):
         result = json.dumps(info)
         return Response(result)
 
+    # ACCT{{
+    # POST /v1.0/account/container/update_many?id=<account_name>
+    # ~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
+    #
+    # Update account with the metadata of several containers at once.
+    # Each item of the list is applied like the body of a single
+    # container update, and gets its own status in the response.
+    #
+    # .. code-block:: json
+    #
+    #    [
+    #      {
+    #        "mtime": "123456789",
+    #        "name": "container name",
+    #        "objects": 0,
+    #        "bytes": 0
+    #      },
+    #      {
+    #        "mtime": "123456789",
+    #        "dtime": "1223456789",
+    #        "name": "another container"
+    #      }
+    #    ]
+    #
+    # Request example:
+    #
+    # .. code-block:: http
+    #
+    #    POST /v1.0/account/container/update_many?id=myaccount HTTP/1.1
+    #    Host: 127.0.0.1:6013
+    #    User-Agent: curl/7.47.0
+    #    Accept: */*
+    #    Content-Length: 171
+    #    Content-Type: application/x-www-form-urlencoded
+    #
+    # Response example:
+    #
+    # .. code-block:: http
+    #
+    #    HTTP/1.1 200 OK
+    #    Server: gunicorn/19.9.0
+    #    Date: Wed, 01 Aug 2018 12:17:25 GMT
+    #    Connection: keep-alive
+    #    Content-Type: text/json; charset=utf-8
+    #    Content-Length: 146
+    #
+    # .. code-block:: json
+    #
+    #    [
+    #      {"name": "container name", "status": 200},
+    #      {"name": "another container", "status": 409,
+    #       "message": "No update needed, event older than last ..."}
+    #    ]
+    #
+    # }}ACCT
+    def on_account_container_update_many(self, req):
+        account_id = self._get_account_id(req)
+        updates = json.loads(req.get_data())
+        if not isinstance(updates, list):
+            raise BadRequest('Expected a list of container updates')
+        # Exceptions are catched by dispatch_request
+        results = self.backend.update_containers(account_id, updates)
+        return Response(json.dumps(results), mimetype='text/json')
+
     # ACCT{{
     # POST /v1.0/account/container/reset?id=<account_name>
     # ~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
@@ -465,10 +533,26 @@ class Account(WerkzeugApp):
         return Response(status=204)
 
     # ACCT{{
-    # POST /v1.0/account/refresh?id=<account_name>
-    # ~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
+    # POST /v1.0/account/refresh?id=<account_name>[&batch_size=<count>]
+    # ~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
     # Refresh counter of an account named account_name
     #
+    # Containers are summed in several steps. When batch_size is set,
+    # only one step is run, summing at most batch_size containers,
+    # and its progress is returned. The next request resumes the refresh
+    # where the previous one stopped:
+    #
+    # .. code-block:: http
+    #
+    #    HTTP/1.1 200 OK
+    #    Content-Type: text/json; charset=utf-8
+    #
+    # .. code-block:: json
+    #
+    #    {"batch": 1000, "scanned": 2000, "total": 15000, "done": false}
+    #
+    # Otherwise the whole account is refreshed:
+    #
     # .. code-block:: http
     #
     #    POST /v1.0/account/refresh?id=myaccount HTTP/1.1
@@ -487,8 +571,17 @@ class Account(WerkzeugApp):
     # }}ACCT
     def on_account_refresh(self, req):
         account_id = self._get_account_id(req)
-        self.backend.refresh_account(account_id)
-        return Response(status=204)
+        batch_size = req.args.get('batch_size')
+        if batch_size is None:
+            self.backend.refresh_account(account_id)
+            return Response(status=204)
+        try:
+            batch_size = int(batch_size)
+        except ValueError:
+            raise BadRequest('Invalid batch_size')
+        progress = self.backend.refresh_account_batch(
+            account_id, batch_size=batch_size)
+        return Response(json.dumps(progress), mimetype='text/json')
 
     # ACCT{{
     # POST /v1.0/account/flush?id=<account_name>
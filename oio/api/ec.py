@@ -15,7 +15,6 @@
 
 from oio.common.green import Queue, Timeout, GreenPile
 
-import collections
 import math
 import hashlib
 import logging
@@ -34,6 +33,12 @@ from oio.common import green
 
 logger = logging.getLogger(__name__)
 
+# Number of segments a fragment source can be late before it is dropped
+# (when there are more sources than required to decode segments)
+EC_MAX_FRAGMENT_LAG = 4
+# Number of fragments read in advance from each source while rebuilding
+REBUILD_READ_AHEAD = 2
+
 
 def segment_range_to_fragment_range(segment_start, segment_end, segment_size,
                                     fragment_size):
@@ -95,10 +100,23 @@ class ECChunkDownloadHandler(object):
 
     def __init__(self, storage_method, chunks, meta_start, meta_end, headers,
                  connection_timeout=None, read_timeout=None,
+                 ec_coding_threads=None, perfdata=None,
+                 ec_extra_fragments=None, latency=io.RAWX_LATENCY,
                  **_kwargs):
         """
         :param connection_timeout: timeout to establish the connections
         :param read_timeout: timeout to read a buffer of data
+        :param ec_coding_threads: number of segments to decode in parallel
+            in OS threads (disabled if not set)
+        :param perfdata: optional `dict` in which connection pool hits
+            and misses will be counted
+        :param ec_extra_fragments: number of fragments to read in addition
+            to the ones required to decode the data. Each segment is
+            decoded with the first fragments to arrive, and the sources
+            that are constantly late are dropped. Fragments are then
+            read from the rawx services with the lowest response times.
+        :param latency: the `oio.api.io.LatencyTracker` recording
+            response times of rawx services
         """
         self.storage_method = storage_method
         self.chunks = chunks
@@ -110,6 +128,10 @@ class ECChunkDownloadHandler(object):
         self.headers = headers
         self.connection_timeout = connection_timeout
         self.read_timeout = read_timeout
+        self.coding_pool = get_coding_pool(ec_coding_threads)
+        self.perfdata = perfdata
+        self.extra_fragments = int(ec_extra_fragments or 0)
+        self.latency = latency
 
     def _get_range_infos(self):
         """
@@ -155,18 +177,33 @@ class ECChunkDownloadHandler(object):
         reader = io.ChunkReader(chunk_iter, storage_method.ec_fragment_size,
                                 headers, self.connection_timeout,
                                 self.read_timeout,
-                                align=True)
+                                align=True, perfdata=self.perfdata)
         return (reader, reader.get_iter())
 
+    def _ranked_chunks(self):
+        """
+        Sort the chunks by mean response time of their rawx service.
+        Services never measured are ranked with the median response time.
+        The order of the chunks with the same rank is kept.
+        """
+        return sorted(
+            self.chunks,
+            key=lambda x: self.latency.estimate(io.chunk_host(x)))
+
     def get_stream(self):
         range_infos = self._get_range_infos()
-        chunk_iter = iter(self.chunks)
+        if self.extra_fragments:
+            chunk_iter = iter(self._ranked_chunks())
+        else:
+            chunk_iter = iter(self.chunks)
+        nb_readers = min(self.storage_method.ec_nb_data +
+                         self.extra_fragments, len(self.chunks))
 
         # we use eventlet GreenPool to manage readers
-        with green.ContextPool(self.storage_method.ec_nb_data) as pool:
+        with green.ContextPool(nb_readers) as pool:
             pile = GreenPile(pool)
             # we use eventlet GreenPile to spawn readers
-            for _j in range(self.storage_method.ec_nb_data):
+            for _j in range(nb_readers):
                 pile.spawn(self._get_fragment, chunk_iter, range_infos,
                            self.storage_method)
 
@@ -184,7 +221,8 @@ class ECChunkDownloadHandler(object):
             fragment_length = int(resp_headers.get('Content-Length'))
             read_iterators = [it for _, it in readers]
             stream = ECStream(self.storage_method, read_iterators, range_infos,
-                              self.meta_length, fragment_length)
+                              self.meta_length, fragment_length,
+                              coding_pool=self.coding_pool)
             # start the stream
             stream.start()
             return stream
@@ -201,12 +239,13 @@ class ECStream(object):
     Handles the different readers.
     """
     def __init__(self, storage_method, readers, range_infos, meta_length,
-                 fragment_length):
+                 fragment_length, coding_pool=None):
         self.storage_method = storage_method
         self.readers = readers
         self.range_infos = range_infos
         self.meta_length = meta_length
         self.fragment_length = fragment_length
+        self.coding_pool = coding_pool
         self._iter = None
 
     def start(self):
@@ -269,24 +308,32 @@ class ECStream(object):
 
     def _decode_segments(self, fragment_iterators):
         """
-        Reads from fragments and yield full segments
-        """
-        # we use eventlet Queue to read fragments
-        queues = []
-        # each iterators has its queue
-        for _j in range(len(fragment_iterators)):
-            queues.append(Queue(1))
+        Reads from fragments and yield full segments.
 
-        def put_in_queue(fragment_iterator, queue):
+        Each segment is decoded as soon as enough of its fragments
+        have been read, whatever their source.
+        """
+        nb_data = self.storage_method.ec_nb_data
+        # number of segments decoded at once
+        batch_size = self.coding_pool.size if self.coding_pool else 1
+        # number of fragments a source can read in advance
+        window = 2 * batch_size
+        nb_sources = len(fragment_iterators)
+        # fragments from all the sources, as tuples
+        # (source index, segment index, fragment)
+        arrivals = Queue()
+        slots = [green.Semaphore(window) for _j in range(nb_sources)]
+
+        def read_fragments(index, fragment_iterator):
             """
             Coroutine to read the fragments from the iterator
             """
             try:
-                for fragment in fragment_iterator:
-                    # put the read fragment in the queue
-                    queue.put(fragment)
-                    # the queues are of size 1 so this coroutine blocks
-                    # until we decode a full segment
+                for segment_index, fragment in enumerate(fragment_iterator):
+                    # blocks until the decoding loop has used the fragments
+                    # previously read from this source
+                    slots[index].acquire()
+                    arrivals.put((index, segment_index, fragment))
             except GreenletExit:
                 # ignore
                 pass
@@ -295,41 +342,87 @@ class ECStream(object):
             except Exception:
                 logger.exception("Exception on reading")
             finally:
-                queue.resize(2)
-                # put None to indicate the decoding loop
-                # this is over
-                queue.put(None)
+                # tell the decoding loop this source is over
+                arrivals.put((index, None, None))
                 # close the iterator
                 fragment_iterator.close()
 
         # we use eventlet GreenPool to manage the read of fragments
-        with green.ContextPool(len(fragment_iterators)) as pool:
+        with green.ContextPool(nb_sources) as pool:
             # spawn coroutines to read the fragments
-            for fragment_iterator, queue in zip(fragment_iterators, queues):
-                pool.spawn(put_in_queue, fragment_iterator, queue)
+            readers = [pool.spawn(read_fragments, index, fragment_iterator)
+                       for index, fragment_iterator
+                       in enumerate(fragment_iterators)]
+            alive = set(range(nb_sources))
+            # index of the last fragment read from each source
+            last_read = [-1] * nb_sources
+            # fragments waiting to be decoded, by segment index
+            pending = dict()
+            next_segment = 0
 
             # main decoding loop
             while True:
-                data = []
-                # get the fragments from the queues
-                for queue in queues:
-                    fragment = queue.get()
-                    queue.task_done()
-                    data.append(fragment)
-
-                if not all(data):
-                    # one of the readers returned None
+                batch = []
+                while (len(batch) < batch_size and
+                       len(pending.get(next_segment + len(batch), ())) >=
+                       nb_data):
+                    batch.append(pending.pop(next_segment + len(batch)))
+
+                if batch:
+                    next_segment += len(batch)
+                    for frags in batch:
+                        for index in frags:
+                            slots[index].release()
+                    # actually decode the fragments into segments
+                    data = [frags.values() for frags in batch]
+                    try:
+                        if self.coding_pool:
+                            segments = self.coding_pool.map(
+                                self.storage_method.driver.decode, data)
+                        else:
+                            segments = [
+                                self.storage_method.driver.decode(frags)
+                                for frags in data]
+                    except exceptions.ECError:
+                        # something terrible happened
+                        logger.exception("ERROR decoding fragments")
+                        raise
+
+                    for segment in segments:
+                        yield segment
+
+                    # drop the sources that are constantly late
+                    for index in sorted(alive, key=lambda x: last_read[x]):
+                        if len(alive) <= nb_data:
+                            break
+                        if next_segment - 1 - last_read[index] > \
+                                EC_MAX_FRAGMENT_LAG:
+                            readers[index].kill()
+                            alive.discard(index)
+                    continue
+
+                # check the next segment can still be decoded
+                sources = pending.get(next_segment, dict())
+                if len(sources) + len(alive.difference(sources)) < nb_data:
                     # impossible to read segment
                     break
-                # actually decode the fragments into a segment
-                try:
-                    segment = self.storage_method.driver.decode(data)
-                except exceptions.ECError:
-                    # something terrible happened
-                    logger.exception("ERROR decoding fragments")
-                    raise
 
-                yield segment
+                # wait for a fragment, and take all the fragments
+                # that have already been read
+                arrived = [arrivals.get()]
+                while not arrivals.empty():
+                    arrived.append(arrivals.get_nowait())
+                for index, segment_index, fragment in arrived:
+                    if segment_index is None:
+                        alive.discard(index)
+                        continue
+                    last_read[index] = segment_index
+                    if segment_index < next_segment:
+                        # too late, the segment has already been decoded
+                        slots[index].release()
+                        continue
+                    pending.setdefault(segment_index, dict())[index] = \
+                        fragment
 
     def _convert_range(self, req_start, req_end, length):
         try:
@@ -458,73 +551,174 @@ class ECStream(object):
         return self
 
 
-def ec_encode(storage_method, n):
+class ECCodingPool(object):
     """
-    Encode EC segments
+    Encode or decode batches of EC segments in OS threads.
+
+    liberasurecode releases the GIL while it computes, thus the segments
+    of a batch are processed in parallel, and the eventlet hub keeps
+    serving the other green threads in the meantime. The threads are
+    taken from eventlet's thread pool (see EVENTLET_THREADPOOL_SIZE).
     """
-    segment_size = storage_method.ec_segment_size
 
-    buf = collections.deque()
-    total_len = 0
+    def __init__(self, size):
+        """
+        :param size: number of segments to process in parallel
+        """
+        self.size = size
+
+    def map(self, func, items):
+        """
+        Call `func` on each item of `items` in an OS thread.
+
+        :returns: the list of results, in the order of `items`
+        """
+        if len(items) < 2:
+            return [green.tpool.execute(func, item) for item in items]
+        pile = GreenPile(len(items))
+        for item in items:
+            pile.spawn(green.tpool.execute, func, item)
+        return list(pile)
+
+
+def get_coding_pool(ec_coding_threads=None):
+    """
+    Build an `ECCodingPool` from the `ec_coding_threads` configuration
+    parameter.
+
+    :returns: an `ECCodingPool`, or None if `ec_coding_threads`
+        is not set or lower than 2
+    """
+    try:
+        size = int(ec_coding_threads or 0)
+    except (TypeError, ValueError):
+        raise ValueError('Invalid ec_coding_threads: %r' % ec_coding_threads)
+    if size < 2:
+        return None
+    return ECCodingPool(size)
+
+
+class ECSegmenter(object):
+    """
+    Cut a stream of data into EC segments and encode them.
+
+    Incoming data is copied at most once, into a preallocated segment
+    buffer, and the EC driver is given read-only views on this buffer
+    (or directly on the input data when it spans whole segments).
+    Encoded fragments are returned as per-chunk lists, they are never
+    concatenated.
+
+    When a `coding_pool` is given, segments are encoded by batches
+    of `coding_pool.size`, in parallel.
+    """
+
+    def __init__(self, storage_method, nb_chunks, coding_pool=None):
+        self.storage_method = storage_method
+        self.nb_chunks = nb_chunks
+        self.coding_pool = coding_pool
+        self.segment_size = storage_method.ec_segment_size
+        batch_size = coding_pool.size if coding_pool else 1
+        self._buf_size = self.segment_size * batch_size
+        self._buf = bytearray(self._buf_size)
+        self._view = memoryview(self._buf)
+        self._filled = 0
+
+    def _encode(self, segments):
+        if self.coding_pool:
+            return self.coding_pool.map(self.storage_method.driver.encode,
+                                        segments)
+        return [self.storage_method.driver.encode(segment)
+                for segment in segments]
+
+    def _buffered_segments(self):
+        return [buffer(self._buf, start,
+                       min(self.segment_size, self._filled - start))
+                for start in range(0, self._filled, self.segment_size)]
+
+    def _transpose(self, encode_result):
+        # transform the result
+        #
+        # from:
+        # [[fragment_0_0, fragment_1_0, fragment_2_0, ...],
+        #  [fragment_0_1, fragment_1_1, fragment_2_1, ...], ...]
+        #
+        # to:
+        #
+        # [[fragment_0_0, fragment_0_1, ...], # write to chunk 0
+        #  [fragment_1_0, fragment_1_1, ...], # write to chunk 1
+        #  [fragment_2_0, fragment_2_1, ...], # write to chunk 2
+        #  ...]
+        return [list(frags) for frags in zip(*encode_result)]
+
+    def feed(self, data):
+        """
+        Add `data` to the segment buffer and encode all full segments
+        (or batches of segments).
+
+        :returns: a list of fragment lists (one per chunk),
+            or None if there was not enough data to encode
+        """
+        encode_result = []
+        segments = []
+        offset = 0
+        length = len(data)
+        if not self._filled:
+            # nothing pending: encode full segments directly
+            # from the input data
+            while length - offset >= self._buf_size:
+                segments.extend(
+                    buffer(data, start, self.segment_size)
+                    for start in range(offset, offset + self._buf_size,
+                                       self.segment_size))
+                offset += self._buf_size
+
+        # copy what is left into the segment buffer
+        while offset < length:
+            amount = min(self._buf_size - self._filled, length - offset)
+            self._view[self._filled:self._filled + amount] = \
+                memoryview(data)[offset:offset + amount]
+            self._filled += amount
+            offset += amount
+            if self._filled == self._buf_size:
+                # the buffer will be reused, encode it now
+                segments.extend(self._buffered_segments())
+                encode_result.extend(self._encode(segments))
+                segments = []
+                self._filled = 0
+
+        if segments:
+            encode_result.extend(self._encode(segments))
+        if not encode_result:
+            return None
+        return self._transpose(encode_result)
+
+    def flush(self):
+        """
+        Encode what is left in the segment buffer.
+
+        :returns: a list of fragment lists (one per chunk)
+        """
+        if not self._filled:
+            return [[] for _ in range(self.nb_chunks)]
+        encode_result = self._encode(self._buffered_segments())
+        self._filled = 0
+        return self._transpose(encode_result)
+
+
+def ec_encode(storage_method, n, coding_pool=None):
+    """
+    Encode EC segments
+    """
+    segmenter = ECSegmenter(storage_method, n, coding_pool=coding_pool)
 
     data = yield
     while data:
-        buf.append(data)
-        total_len += len(data)
-
-        if total_len >= segment_size:
-            data_to_encode = []
-
-            while total_len >= segment_size:
-                # take data from buf
-                amount = segment_size
-                # the goal here is to encode a full segment
-                parts = []
-                while amount > 0:
-                    part = buf.popleft()
-                    if len(part) > amount:
-                        # too much data taken
-                        # put the extra data back into the buf
-                        buf.appendleft(part[amount:])
-                        part = part[:amount]
-                    parts.append(part)
-                    amount -= len(part)
-                    total_len -= len(part)
-                data_to_encode.append(''.join(parts))
-
-            # let's encode!
-            encode_result = []
-            for d in data_to_encode:
-                encode_result.append(storage_method.driver.encode(d))
-
-            # transform the result
-            #
-            # from:
-            # [[fragment_0_0, fragment_1_0, fragment_2_0, ...],
-            #  [fragment_0_1, fragment_1_1, fragment_2_1, ...], ...]
-            #
-            # to:
-            #
-            # [(fragment_0_0 + fragment_0_1 + ...), # write to chunk 0
-            # [(fragment_1_0 + fragment_1_1 + ...), # write to chunk 1
-            # [(fragment_2_0 + fragment_2_1 + ...), # write to chunk 2
-            #  ...]
-
-            result = [''.join(p) for p in zip(*encode_result)]
-            data = yield result
-        else:
-            # not enough data to encode
-            data = yield None
+        data = yield segmenter.feed(data)
 
     # empty input data
     # which means end of stream
     # encode what is left in the buf
-    whats_left = ''.join(buf)
-    if whats_left:
-        last_fragments = storage_method.driver.encode(whats_left)
-    else:
-        last_fragments = [''] * n
-    yield last_fragments
+    yield segmenter.flush()
 
 
 class EcChunkWriter(object):
@@ -555,7 +749,8 @@ class EcChunkWriter(object):
 
     @classmethod
     def connect(cls, chunk, sysmeta, reqid=None,
-                connection_timeout=None, write_timeout=None, **kwargs):
+                connection_timeout=None, write_timeout=None, perfdata=None,
+                **kwargs):
         raw_url = chunk.get("real_url", chunk["url"])
         parsed = urlparse(raw_url)
         chunk_path = parsed.path.split('/')[-1]
@@ -576,7 +771,7 @@ class EcChunkWriter(object):
         with green.ConnectionTimeout(
                 connection_timeout or io.CONNECTION_TIMEOUT):
             conn = io.http_connect(
-                parsed.netloc, 'PUT', parsed.path, hdrs)
+                parsed.netloc, 'PUT', parsed.path, hdrs, perfdata=perfdata)
             conn.chunk = chunk
         return cls(chunk, conn, write_timeout=write_timeout, **kwargs)
 
@@ -592,12 +787,16 @@ class EcChunkWriter(object):
             # use HTTP transfer encoding chunked
             # to write data to RAWX
             if not self.failed:
-                # format the chunk
-                to_send = "%x\r\n%s\r\n" % (len(data), data)
+                # data is a list of fragments, send them one after
+                # the other in a single HTTP chunk, without joining them
+                size = sum(len(frag) for frag in data)
                 try:
                     with green.ChunkWriteTimeout(self.write_timeout):
-                        self.conn.send(to_send)
-                        self.bytes_transferred += len(data)
+                        self.conn.send("%x\r\n" % size)
+                        for frag in data:
+                            self.conn.send(frag)
+                        self.conn.send("\r\n")
+                        self.bytes_transferred += size
                 except (Exception, green.ChunkWriteTimeout) as exc:
                     self.failed = True
                     msg = str(exc)
@@ -615,9 +814,14 @@ class EcChunkWriter(object):
             self.queue.join()
 
     def send(self, data):
+        """
+        Queue a list of fragments to be sent.
+
+        :type data: `list` of `str`
+        """
         # do not send empty data because
         # this will end the chunked body
-        if not data:
+        if not any(data):
             return
         # put the data to send into the queue
         # it will be processed by the send coroutine
@@ -651,7 +855,7 @@ class EcChunkWriter(object):
 class EcMetachunkWriter(io.MetachunkWriter):
     def __init__(self, sysmeta, meta_chunk, global_checksum, storage_method,
                  reqid=None, connection_timeout=None, write_timeout=None,
-                 read_timeout=None, **kwargs):
+                 read_timeout=None, coding_pool=None, **kwargs):
         super(EcMetachunkWriter, self).__init__(
             storage_method=storage_method, **kwargs)
         self.sysmeta = sysmeta
@@ -664,6 +868,7 @@ class EcMetachunkWriter(io.MetachunkWriter):
         self.connection_timeout = connection_timeout or io.CONNECTION_TIMEOUT
         self.write_timeout = write_timeout or io.CHUNK_TIMEOUT
         self.read_timeout = read_timeout or io.CLIENT_TIMEOUT
+        self.coding_pool = coding_pool
 
     def stream(self, source, size):
         writers = self._get_writers()
@@ -690,16 +895,19 @@ class EcMetachunkWriter(io.MetachunkWriter):
     def _stream(self, source, size, writers):
         bytes_transferred = 0
 
-        # create EC encoding generator
-        ec_stream = ec_encode(self.storage_method, len(self.meta_chunk))
-        # init generator
-        ec_stream.send(None)
+        # create EC segmenter
+        segmenter = ECSegmenter(self.storage_method, len(self.meta_chunk),
+                                coding_pool=self.coding_pool)
 
         def send(data):
-            self.checksum.update(data)
-            self.global_checksum.update(data)
-            # get the encoded fragments
-            fragments = ec_stream.send(data)
+            if data:
+                self.checksum.update(data)
+                self.global_checksum.update(data)
+                # get the encoded fragments
+                fragments = segmenter.feed(data)
+            else:
+                # end of stream, encode what is left
+                fragments = segmenter.flush()
             if fragments is None:
                 # not enough data given
                 return
@@ -707,11 +915,12 @@ class EcMetachunkWriter(io.MetachunkWriter):
             current_writers = list(writers)
             failed_chunks = list()
             for writer in current_writers:
-                fragment = fragments[chunk_index[writer]]
+                fragment_list = fragments[chunk_index[writer]]
                 if not writer.failed:
                     if writer.checksum:
-                        writer.checksum.update(fragment)
-                    writer.send(fragment)
+                        for fragment in fragment_list:
+                            writer.checksum.update(fragment)
+                    writer.send(fragment_list)
                 else:
                     current_writers.remove(writer)
                     failed_chunks.append(writer.chunk)
@@ -809,7 +1018,8 @@ class EcMetachunkWriter(io.MetachunkWriter):
                 chunk, self.sysmeta, self.reqid,
                 connection_timeout=self.connection_timeout,
                 write_timeout=self.write_timeout,
-                chunk_checksum_algo=self.chunk_checksum_algo)
+                chunk_checksum_algo=self.chunk_checksum_algo,
+                perfdata=self.perfdata)
             return writer, chunk
         except (Exception, Timeout) as exc:
             msg = str(exc)
@@ -888,8 +1098,15 @@ class ECWriteHandler(io.WriteHandler):
     """
     Handles writes to an EC content.
     For initialization parameters, see oio.api.io.WriteHandler.
+
+    :keyword ec_coding_threads: number of segments to encode in parallel
+        in OS threads (disabled if not set)
     """
 
+    def __init__(self, *args, **kwargs):
+        super(ECWriteHandler, self).__init__(*args, **kwargs)
+        self.coding_pool = get_coding_pool(kwargs.get('ec_coding_threads'))
+
     def stream(self):
         # the checksum context for the content
         global_checksum = hashlib.md5()
@@ -915,8 +1132,7 @@ class ECWriteHandler(io.WriteHandler):
         #  ..}
         #
         # iterate through the meta chunks
-        bytes_transferred = -1
-        for meta_chunk in self.chunk_prep():
+        def _stream_metachunk(meta_chunk, source):
             handler = EcMetachunkWriter(
                 self.sysmeta, meta_chunk,
                 global_checksum, self.storage_method,
@@ -924,8 +1140,10 @@ class ECWriteHandler(io.WriteHandler):
                 connection_timeout=self.connection_timeout,
                 write_timeout=self.write_timeout,
                 read_timeout=self.read_timeout,
-                chunk_checksum_algo=self.chunk_checksum_algo)
-            bytes_transferred, checksum, chunks = handler.stream(self.source,
+                chunk_checksum_algo=self.chunk_checksum_algo,
+                coding_pool=self.coding_pool,
+                perfdata=self.perfdata)
+            bytes_transferred, checksum, chunks = handler.stream(source,
                                                                  max_size)
 
             # chunks checksum is the metachunk hash
@@ -933,16 +1151,16 @@ class ECWriteHandler(io.WriteHandler):
             for chunk in chunks:
                 chunk['hash'] = checksum
                 chunk['size'] = bytes_transferred
-                # add the chunks whose upload succeeded
-                # to the content chunk list
+            return bytes_transferred, chunks
+
+        for bytes_transferred, chunks in self._stream_metachunks(
+                _stream_metachunk, max_size):
+            # add the chunks whose upload succeeded
+            # to the content chunk list
+            for chunk in chunks:
                 if not chunk.get('error'):
                     content_chunks.append(chunk)
-
             total_bytes_transferred += bytes_transferred
-            if bytes_transferred < max_size:
-                break
-            if len(self.source.peek()) == 0:
-                break
 
         # compute the final content checksum
         content_checksum = global_checksum.hexdigest()
@@ -950,15 +1168,88 @@ class ECWriteHandler(io.WriteHandler):
         return content_chunks, total_bytes_transferred, content_checksum
 
 
+class FragmentReader(object):
+    """
+    Read the fragments of a chunk, one at a time, into preallocated
+    buffers. `read_ahead` buffers are used in turn, so the next fragments
+    are read while the previous ones are processed.
+    """
+
+    def __init__(self, resp, fragment_size, read_ahead=REBUILD_READ_AHEAD):
+        self.resp = resp
+        self.fragment_size = fragment_size
+        self.free = Queue()
+        for _ in range(read_ahead):
+            self.free.put(bytearray(fragment_size))
+        self.ready = Queue()
+
+    def _read_into(self, buf):
+        view = memoryview(buf)
+        offset = 0
+        while offset < self.fragment_size:
+            if hasattr(self.resp, 'readinto'):
+                length = self.resp.readinto(view[offset:])
+            else:
+                data = self.resp.read(self.fragment_size - offset)
+                length = len(data)
+                view[offset:offset + length] = data
+            if not length:
+                break
+            offset += length
+        return offset
+
+    def run(self):
+        """Read fragments until the end of the chunk."""
+        try:
+            while True:
+                buf = self.free.get()
+                length = self._read_into(buf)
+                self.ready.put((buf, length))
+                if not length:
+                    break
+        except GreenletExit:
+            pass
+        except Exception as exc:
+            self.ready.put(exc)
+
+    def get(self):
+        """
+        :returns: a tuple with the buffer holding the next fragment,
+            and the length of this fragment (0 at the end of the chunk)
+        """
+        res = self.ready.get()
+        if isinstance(res, Exception):
+            raise res
+        return res
+
+    def release(self, buf):
+        """Give back a buffer obtained by `get()`."""
+        self.free.put(buf)
+
+
 class ECRebuildHandler(object):
+    """
+    Rebuild missing fragments of a metachunk from the remaining ones.
+
+    :param missing: index of the fragment to rebuild, or `list` of indexes
+        of fragments to rebuild at once, reading the sources only once
+    :param coding_pool: optional `ECCodingPool`, to reconstruct the
+        fragments in OS threads while the next ones are being read
+    """
+
     def __init__(self, meta_chunk, missing, storage_method,
                  connection_timeout=None, read_timeout=None,
-                 **_kwargs):
+                 coding_pool=None, **_kwargs):
         self.meta_chunk = meta_chunk
         self.missing = missing
+        if isinstance(missing, (list, tuple)):
+            self._missing = list(missing)
+        else:
+            self._missing = [missing]
         self.storage_method = storage_method
         self.connection_timeout = connection_timeout or io.CONNECTION_TIMEOUT
         self.read_timeout = read_timeout or io.CHUNK_TIMEOUT
+        self.coding_pool = coding_pool
 
     def _get_response(self, chunk, headers):
         resp = None
@@ -981,6 +1272,11 @@ class ECRebuildHandler(object):
         return resp
 
     def rebuild(self):
+        """
+        :returns: an iterator over the rebuilt data of the missing fragment,
+            or over `list`s of data blocks (one per missing fragment,
+            in the same order as `missing`) if `missing` is a `list`
+        """
         pile = GreenPile(len(self.meta_chunk))
 
         nb_data = self.storage_method.ec_nb_data
@@ -1005,36 +1301,56 @@ class ECRebuildHandler(object):
         return rebuild_iter
 
     def _make_rebuild_iter(self, resps):
-        def _get_frag(resp):
-            buf = ''
-            remaining = self.storage_method.ec_fragment_size
-            while remaining:
-                data = resp.read(remaining)
-                if not data:
-                    break
-                remaining -= len(data)
-                buf += data
-            return buf
+        readers = [FragmentReader(resp, self.storage_method.ec_fragment_size)
+                   for resp in resps]
 
         def frag_iter():
-            pile = GreenPile(len(resps))
-            while True:
-                for resp in resps:
-                    pile.spawn(_get_frag, resp)
-                try:
-                    with Timeout(self.read_timeout):
-                        frag = [frag for frag in pile]
-                except Timeout as to:
-                    logger.error('ERROR while rebuilding: %s', to)
-                except Exception:
-                    logger.exception('ERROR while rebuilding')
-                    break
-                if not all(frag):
-                    break
-                rebuilt_frag = self._reconstruct(frag)
-                yield rebuilt_frag
+            with green.ContextPool(len(readers)) as pool:
+                for reader in readers:
+                    pool.spawn(reader.run)
+                while True:
+                    try:
+                        with Timeout(self.read_timeout):
+                            frags = [reader.get() for reader in readers]
+                    except Timeout as to:
+                        logger.error('ERROR while rebuilding: %s', to)
+                        raise exceptions.OioTimeout(
+                            'Timeout while reading fragments: %s' % to)
+                    except Exception:
+                        logger.exception('ERROR while rebuilding')
+                        raise
+                    lengths = set(length for _, length in frags)
+                    if lengths == set([0]):
+                        break
+                    if len(lengths) > 1:
+                        # httplib returns an empty string instead of
+                        # raising when the connection is closed early
+                        raise exceptions.SourceReadError(
+                            'Fragments of different lengths (%s) '
+                            'while rebuilding' %
+                            ', '.join(str(length) for _, length in frags))
+                    # The EC driver only accepts strings
+                    data = [memoryview(buf)[:length].tobytes()
+                            for buf, length in frags]
+                    # Let the readers fetch the next fragments
+                    # while these ones are reconstructed
+                    for reader, (buf, _) in zip(readers, frags):
+                        reader.release(buf)
+                    if self.coding_pool:
+                        rebuilt_frag = self.coding_pool.map(
+                            self._reconstruct, [data])[0]
+                    else:
+                        rebuilt_frag = self._reconstruct(data)
+                    yield rebuilt_frag
 
         return frag_iter()
 
     def _reconstruct(self, frag):
-        return self.storage_method.driver.reconstruct(frag, [self.missing])[0]
+        # The driver sorts the list of indexes (in place), and returns
+        # the fragments in that order.
+        rebuilt = self.storage_method.driver.reconstruct(
+            frag, list(self._missing))
+        if isinstance(self.missing, (list, tuple)):
+            by_index = dict(zip(sorted(self._missing), rebuilt))
+            return [by_index[index] for index in self._missing]
+        return rebuilt[0]
@@ -18,8 +18,13 @@ from __future__ import absolute_import
 from oio.common.green import sleep, Timeout
 
 from io import BufferedReader, RawIOBase, IOBase
+from collections import deque
 import itertools
 import logging
+import math
+import mmap
+import os
+import stat
 from urlparse import urlparse
 from socket import error as SocketError
 from oio.common import exceptions as exc
@@ -27,7 +32,7 @@ from oio.common.http import parse_content_type,\
     parse_content_range, ranges_from_http_header, http_header_from_ranges
 from oio.common.http_eventlet import http_connect
 from oio.common.utils import GeneratorIO, group_chunk_errors, \
-    deadline_to_timeout
+    deadline_to_timeout, monotonic_time
 from oio.common import green
 from oio.common.storage_method import STORAGE_METHODS
 
@@ -45,11 +50,22 @@ CLIENT_TIMEOUT = 60.0
 
 PUT_QUEUE_DEPTH = 10
 
+# Number of response times kept for each rawx service
+LATENCY_WINDOW = 100
+# Minimum number of response times to compute a percentile
+LATENCY_MIN_SAMPLES = 10
+# Hedge delay used until enough response times have been collected
+HEDGE_DEFAULT_DELAY = 0.1
+
 
 def close_source(source):
-    """Safely close the connection behind `source`."""
+    """
+    Safely release the connection behind `source`: it goes back
+    to the connection pool if the response has been entirely read,
+    and is closed otherwise.
+    """
     try:
-        source.conn.close()
+        source.conn.release()
     except Exception:
         logger.exception("Failed to close %s", source)
 
@@ -78,12 +94,81 @@ class IOBaseWrapper(RawIOBase):
         return len(read_data)
 
 
+class MappedFile(object):
+    """
+    Read a regular file through a memory mapping. `read` returns
+    `buffer` objects pointing to the mapped pages: the data is not copied
+    when it is hashed or sent to sockets.
+    """
+
+    def __init__(self, fileobj):
+        self._map = mmap.mmap(fileobj.fileno(), 0, prot=mmap.PROT_READ)
+        self.offset = fileobj.tell()
+        self.size = len(self._map)
+
+    @classmethod
+    def from_source(cls, source):
+        """
+        :returns: a `MappedFile` reading `source` from its current position
+            if it is a non-empty regular file, None otherwise
+        """
+        try:
+            if not stat.S_ISREG(os.fstat(source.fileno()).st_mode):
+                return None
+            return cls(source)
+        except (AttributeError, EnvironmentError, ValueError):
+            return None
+
+    @property
+    def remaining(self):
+        return max(self.size - self.offset, 0)
+
+    def read(self, size=-1):
+        if size < 0 or size > self.remaining:
+            size = self.remaining
+        data = buffer(self._map, self.offset, size)
+        self.offset += size
+        return data
+
+    def peek(self, size=1):
+        return buffer(self._map, self.offset, min(size, self.remaining))
+
+    def close(self):
+        self._map.close()
+
+
+class MetachunkSource(object):
+    """
+    Give a metachunk writer access to the data source, and tell
+    when all the data of the metachunk has been read.
+    """
+
+    def __init__(self, source, size):
+        self.source = source
+        self.size = size
+        self.bytes_read = 0
+        self.done = green.Event()
+
+    def read(self, size=-1):
+        data = self.source.read(size)
+        self.bytes_read += len(data)
+        if (size != 0 and not data) or \
+                (self.size is not None and self.bytes_read >= self.size):
+            self.finish()
+        return data
+
+    def finish(self):
+        """Declare the metachunk as entirely read."""
+        if not self.done.ready():
+            self.done.send(self.bytes_read)
+
+
 class WriteHandler(object):
     def __init__(self, source, sysmeta, chunk_preparer,
                  storage_method, headers=None,
                  connection_timeout=None, write_timeout=None,
                  read_timeout=None, deadline=None, chunk_checksum_algo='md5',
-                 **_kwargs):
+                 metachunks_in_flight=None, perfdata=None, **_kwargs):
         """
         :param connection_timeout: timeout to establish the connection
         :param write_timeout: timeout to send a buffer of data
@@ -91,6 +176,13 @@ class WriteHandler(object):
         :param chunk_checksum_algo: algorithm to use to compute chunk
             checksums locally. Can be `None` to disable local checksum
             computation and let the rawx compute it (will be md5).
+        :param metachunks_in_flight: maximum number of metachunks being
+            uploaded at the same time. As soon as the data of a metachunk
+            has been read from the source, the upload of the next one
+            starts, while the previous ones are drained to the rawx
+            services. Defaults to 1 (no pipelining).
+        :param perfdata: optional `dict` in which connection pool hits
+            and misses will be counted
         """
         if isinstance(source, IOBase):
             self.source = BufferedReader(source)
@@ -111,6 +203,8 @@ class WriteHandler(object):
         self._read_timeout = read_timeout or CLIENT_TIMEOUT
         self._write_timeout = write_timeout or CHUNK_TIMEOUT
         self.chunk_checksum_algo = chunk_checksum_algo
+        self.metachunks_in_flight = int(metachunks_in_flight or 1)
+        self.perfdata = perfdata
 
     @property
     def read_timeout(self):
@@ -136,6 +230,48 @@ class WriteHandler(object):
         """
         raise NotImplementedError()
 
+    def _stream_metachunks(self, stream_metachunk, size):
+        """
+        Upload the metachunks yielded by the chunk preparer, keeping up to
+        `metachunks_in_flight` of them being uploaded at the same time.
+        The data source is read sequentially: the upload of a metachunk
+        starts when all the data of the previous one has been read.
+
+        :param stream_metachunk: function uploading one metachunk,
+            taking the metachunk and a source to read from as parameters,
+            and returning a tuple (bytes_transferred, chunks)
+        :param size: maximum size of a metachunk
+        :returns: the list of results of `stream_metachunk`,
+            in metachunk order
+        """
+        def _stream(meta_chunk, mc_source):
+            try:
+                return stream_metachunk(meta_chunk, mc_source)
+            finally:
+                mc_source.finish()
+
+        uploads = []
+        pool = green.GreenPool(self.metachunks_in_flight)
+        try:
+            for meta_chunk in self.chunk_prep():
+                mc_source = MetachunkSource(self.source, size)
+                # blocks if there are already too many uploads in flight
+                uploads.append(pool.spawn(_stream, meta_chunk, mc_source))
+                bytes_read = mc_source.done.wait()
+                # stop early if a previous upload failed
+                for upload in uploads:
+                    if upload.dead:
+                        upload.wait()
+                if bytes_read < size:
+                    break
+                if len(self.source.peek()) == 0:
+                    break
+            return [upload.wait() for upload in uploads]
+        except BaseException:
+            for upload in uploads:
+                upload.kill()
+            raise
+
 
 def consume(it):
     for _x in it:
@@ -192,6 +328,81 @@ def discard_bytes(buf_size, start):
     return (buf_size - (start % buf_size)) % buf_size
 
 
+class LatencyTracker(object):
+    """
+    Keep track of the last response times of each service.
+    """
+
+    def __init__(self, window=LATENCY_WINDOW):
+        self.window = window
+        self._samples = dict()
+
+    def record(self, host, latency):
+        """Save the response time of a request to `host`, in seconds."""
+        samples = self._samples.get(host)
+        if samples is None:
+            samples = deque(maxlen=self.window)
+            self._samples[host] = samples
+        samples.append(latency)
+
+    def mean(self, host):
+        """
+        :returns: the mean response time of `host`,
+            or None if it has never been measured
+        """
+        samples = self._samples.get(host)
+        if not samples:
+            return None
+        return sum(samples) / len(samples)
+
+    def estimate(self, host):
+        """
+        Estimate the response time of `host`, to rank services.
+
+        :returns: the mean response time of `host`, or the median of
+            the mean response times of the other services if it has never
+            been measured (0.0 if no service has been measured)
+        """
+        mean = self.mean(host)
+        if mean is not None:
+            return mean
+        means = sorted(sum(samples) / len(samples)
+                       for samples in self._samples.values() if samples)
+        if not means:
+            return 0.0
+        return means[len(means) // 2]
+
+    def percentile(self, pct, host=None):
+        """
+        Get the `pct` percentile of the response times of `host`,
+        or of all services if `host` is not set.
+
+        :returns: a number of seconds, or None if there are not
+            enough samples
+        """
+        if host is None:
+            samples = list(itertools.chain(*self._samples.values()))
+        else:
+            samples = list(self._samples.get(host, ()))
+        if len(samples) < LATENCY_MIN_SAMPLES:
+            return None
+        samples.sort()
+        index = int(math.ceil(pct / 100.0 * len(samples))) - 1
+        return samples[min(max(index, 0), len(samples) - 1)]
+
+    def clear(self):
+        self._samples.clear()
+
+
+# Response times of rawx services, as seen by this process
+RAWX_LATENCY = LatencyTracker()
+
+
+def chunk_host(chunk):
+    """Get the network location of the service hosting `chunk`."""
+    return urlparse(chunk.get("real_url", chunk["url"])).netloc
+
+
 class ChunkReader(object):
     """
     Reads a chunk.
@@ -199,7 +410,8 @@ class ChunkReader(object):
 
     def __init__(self, chunk_iter, buf_size, headers,
                  connection_timeout=None, read_timeout=None,
-                 align=False, **_kwargs):
+                 align=False, perfdata=None, hedge_percentile=None,
+                 latency=RAWX_LATENCY, **_kwargs):
         """
         :param chunk_iter:
         :param buf_size: size of the read buffer
@@ -208,6 +420,14 @@ class ChunkReader(object):
         :param read_timeout: timeout to read a buffer of data
         :param align: if True, the reader will skip some bytes to align
                       on `buf_size`
+        :param perfdata: optional `dict` in which connection pool hits
+                         and misses will be counted
+        :param hedge_percentile: if set, when a chunk has not answered
+                         after this percentile of the response times of
+                         all rawx services, also request the next chunk,
+                         and keep the first response (hedged read).
+                         All chunks must hold the same data.
+        :param latency: the `LatencyTracker` recording response times
         """
         self.chunk_iter = chunk_iter
         self.source = None
@@ -223,6 +443,9 @@ class ChunkReader(object):
         self.connection_timeout = connection_timeout or CONNECTION_TIMEOUT
         self.read_timeout = read_timeout or CHUNK_TIMEOUT
         self._resp_by_chunk = dict()
+        self.perfdata = perfdata
+        self.hedge_percentile = hedge_percentile
+        self.latency = latency
 
     @property
     def reqid(self):
@@ -274,49 +497,144 @@ class ChunkReader(object):
             # just add an offset to the request
             self.request_headers['Range'] = 'bytes=%d-' % nb_bytes
 
-    def _get_request(self, chunk):
+    def _connect(self, chunk, min_cancelled_latency=0.0):
         """
-        Connect to a chunk, fetch headers but don't read data.
-        Save the response object in `self.sources` list.
+        Connect to a chunk, fetch headers but don't read data,
+        and record the response time of the rawx service.
+
+        :param min_cancelled_latency: response time to record (at least)
+            if the request is cancelled before the service answers
+        :returns: the response object, or None
         """
+        host = chunk_host(chunk)
+        start = monotonic_time()
+        conn = None
         try:
             with green.ConnectionTimeout(self.connection_timeout):
                 raw_url = chunk.get("real_url", chunk["url"])
                 parsed = urlparse(raw_url)
                 conn = http_connect(parsed.netloc, 'GET', parsed.path,
-                                    self.request_headers)
+                                    self.request_headers,
+                                    perfdata=self.perfdata)
             with green.OioTimeout(self.read_timeout):
                 source = conn.getresponse()
                 source.conn = conn
+        except green.GreenletExit:
+            # Cancelled (hedged read): the service has been slower than
+            # the one which answered, record it as such.
+            self.latency.record(host, max(monotonic_time() - start,
+                                          min_cancelled_latency))
+            if conn is not None:
+                conn.close()
+            raise
         except (SocketError, Timeout) as err:
+            self.latency.record(host, monotonic_time() - start)
             logger.error('Connection failed to %s (reqid=%s): %s',
                          chunk, self.reqid, err)
             self._resp_by_chunk[chunk["url"]] = (0, str(err))
-            return False
+            return None
         except Exception as err:
             logger.exception('Connection failed to %s (reqid=%s)',
                              chunk, self.reqid)
             self._resp_by_chunk[chunk["url"]] = (0, str(err))
-            return False
+            return None
+        self.latency.record(host, monotonic_time() - start)
 
         if source.status in (200, 206):
-            self.status = source.status
-            self._headers = source.getheaders()
-            self.sources.append((source, chunk))
-            return True
+            return source
         else:
             logger.warn("Invalid response from %s (reqid=%s): %d %s",
                         chunk, self.reqid, source.status, source.reason)
             self._resp_by_chunk[chunk["url"]] = (source.status,
                                                  str(source.reason))
             close_source(source)
+        return None
+
+    def _get_request(self, chunk):
+        """
+        Connect to a chunk, fetch headers but don't read data.
+        Save the response object in `self.sources` list.
+        """
+        source = self._connect(chunk)
+        if source is not None:
+            self._use_source(source)
+            self.sources.append((source, chunk))
+            return True
         return False
 
+    def _use_source(self, source):
+        self.status = source.status
+        self._headers = source.getheaders()
+
+    @property
+    def hedge_delay(self):
+        """
+        Time to wait for a chunk to answer before
+        requesting the next one.
+        """
+        delay = self.latency.percentile(self.hedge_percentile)
+        if delay is None:
+            return HEDGE_DEFAULT_DELAY
+        return delay
+
+    def _get_source_hedged(self):
+        """
+        Like `_get_source`, but do not wait more than `hedge_delay`
+        for a chunk to answer before requesting the next one.
+        The first valid response is kept, the other requests
+        are cancelled.
+        """
+        results = green.Queue()
+        requests = list()
+
+        delay = self.hedge_delay
+
+        def _request(chunk):
+            results.put((self._connect(chunk, min_cancelled_latency=delay),
+                         chunk))
+
+        source, chunk = None, None
+        try:
+            in_flight = 0
+            for next_chunk in self.chunk_iter:
+                requests.append(green.greenthread.spawn(_request, next_chunk))
+                in_flight += 1
+                while in_flight:
+                    try:
+                        source, chunk = results.get(timeout=delay)
+                    except green.Empty:
+                        # too slow, hedge with the next chunk
+                        break
+                    in_flight -= 1
+                    if source is not None:
+                        self._use_source(source)
+                        return source, chunk
+                    # failed, try the next chunk immediately
+                    break
+            while in_flight:
+                source, chunk = results.get()
+                in_flight -= 1
+                if source is not None:
+                    self._use_source(source)
+                    return source, chunk
+            return None, None
+        finally:
+            for request in requests:
+                request.kill()
+            # a request may have finished while we were choosing
+            while not results.empty():
+                other, _ = results.get_nowait()
+                if other is not None and other is not source:
+                    close_source(other)
+
     def _get_source(self):
         """
         Iterate on chunks until one answers,
         and return the response object.
         """
+        if self.hedge_percentile:
+            return self._get_source_hedged()
+
         for chunk in self.chunk_iter:
             # continue to iterate until we find a valid source
             if self._get_request(chunk):
@@ -535,12 +853,13 @@ class MetachunkWriter(object):
     """Base class for metachunk writers"""
 
     def __init__(self, storage_method=None, quorum=None,
-                 chunk_checksum_algo='md5', **_kwargs):
+                 chunk_checksum_algo='md5', perfdata=None, **_kwargs):
         self.storage_method = storage_method
         self._quorum = quorum
         if storage_method is None and quorum is None:
             raise ValueError('Missing storage_method or quorum')
         self.chunk_checksum_algo = chunk_checksum_algo
+        self.perfdata = perfdata
 
     @property
     def quorum(self):
@@ -587,15 +906,20 @@ class MetachunkPreparer(object):
     """Get metadata for a new object and continuously yield new metachunks."""
 
     def __init__(self, container_client, account, container, obj_name,
-                 policy=None, **kwargs):
+                 policy=None, metachunk_prefetch=None, **kwargs):
+        """
+        :param metachunk_prefetch: number of metachunks to allocate
+            with each request to the meta2 service (after the first one).
+            Defaults to 1.
+        """
         self.account = account
         self.container = container
         self.obj_name = obj_name
         self.policy = policy
         self.container_client = container_client
+        self.metachunk_prefetch = int(metachunk_prefetch or 1)
         self.extra_kwargs = kwargs
 
-        # TODO: optimize by asking more than one metachunk at a time
         self.obj_meta, self.first_body = self.container_client.content_prepare(
             account, container, obj_name, size=1, stgpol=policy,
             **kwargs)
@@ -614,20 +938,43 @@ class MetachunkPreparer(object):
             else:
                 chunk['pos'] = str(mc_pos)
 
+    def _prepare_size(self):
+        """Get the size to ask to meta2 to allocate the next metachunks."""
+        if self.metachunk_prefetch <= 1:
+            return 1
+        metachunk_size = int(self.obj_meta['chunk_size'])
+        if self.stg_method.ec:
+            metachunk_size *= self.stg_method.ec_nb_data
+        return metachunk_size * self.metachunk_prefetch
+
+    def _prepare_next(self):
+        """
+        Ask meta2 for the next metachunks.
+
+        :returns: a list of metachunks (lists of chunks)
+        """
+        meta, body = self.container_client.content_prepare(
+                self.account, self.container, self.obj_name,
+                self._prepare_size(), stgpol=self.policy,
+                **self.extra_kwargs)
+        self.obj_meta['properties'].update(meta.get('properties', {}))
+        by_pos = dict()
+        for chunk in body:
+            by_pos.setdefault(int(chunk['pos'].split('.')[0]), []).append(
+                chunk)
+        return [by_pos[pos] for pos in sorted(by_pos.keys())]
+
     def __call__(self):
         mc_pos = self.extra_kwargs.get('meta_pos', 0)
         self._fix_mc_pos(self.first_body, mc_pos)
         self._all_chunks.extend(self.first_body)
         yield self.first_body
         while True:
-            mc_pos += 1
-            meta, next_body = self.container_client.content_prepare(
-                    self.account, self.container, self.obj_name, 1,
-                    stgpol=self.policy, **self.extra_kwargs)
-            self.obj_meta['properties'].update(meta.get('properties', {}))
-            self._fix_mc_pos(next_body, mc_pos)
-            self._all_chunks.extend(next_body)
-            yield next_body
+            for next_body in self._prepare_next():
+                mc_pos += 1
+                self._fix_mc_pos(next_body, mc_pos)
+                self._all_chunks.extend(next_body)
+                yield next_body
 
     def all_chunks_so_far(self):
         """Get the list of all chunks yielded so far."""
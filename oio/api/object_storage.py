@@ -24,7 +24,7 @@ import random
 from urllib import unquote
 from oio.common import exceptions as exc
 from oio.api.ec import ECWriteHandler
-from oio.api.io import MetachunkPreparer
+from oio.api.io import MetachunkPreparer, RAWX_LATENCY
 from oio.api.replication import ReplicatedWriteHandler
 from oio.api.backblaze_http import BackblazeUtilsException, BackblazeUtils
 from oio.api.backblaze import BackblazeWriteHandler, \
@@ -72,7 +72,11 @@ class ObjectStorageApi(object):
         - `write_timeout`: `float`
     """
     TIMEOUT_KEYS = ('connection_timeout', 'read_timeout', 'write_timeout')
-    EXTRA_KEYWORDS = ('chunk_checksum_algo', 'autocreate')
+    EXTRA_KEYWORDS = ('chunk_checksum_algo', 'autocreate',
+                      'ec_coding_threads', 'metachunk_prefetch',
+                      'metachunks_in_flight', 'hedge_percentile',
+                      'metachunk_readahead', 'readahead_max_bytes',
+                      'ec_extra_fragments')
 
     def __init__(self, namespace, logger=None, **kwargs):
         """
@@ -97,6 +101,33 @@ class ObjectStorageApi(object):
         :keyword autocreate: if set, container will be created automatically.
             Default value is True.
         :type autocreate: `bool`
+        :keyword ec_coding_threads: number of EC segments to encode or decode
+            in parallel, in OS threads. Disabled by default.
+        :type ec_coding_threads: `int`
+        :keyword metachunk_prefetch: number of metachunks to allocate with
+            each request to meta2, when uploading large objects.
+        :type metachunk_prefetch: `int`
+        :keyword metachunks_in_flight: maximum number of metachunks being
+            uploaded at the same time.
+        :type metachunks_in_flight: `int`
+        :keyword hedge_percentile: when downloading a replicated object,
+            if a chunk has not answered after this percentile of the
+            response times of the rawx services, also request another
+            copy, and keep the first response. Copies are tried from the
+            fastest service to the slowest.
+        :type hedge_percentile: `int`
+        :keyword metachunk_readahead: number of metachunks to start
+            downloading while the current one is being consumed.
+            Disabled by default.
+        :type metachunk_readahead: `int`
+        :keyword readahead_max_bytes: maximum amount of data buffered
+            by the metachunks being downloaded in advance (64MiB).
+        :type readahead_max_bytes: `int`
+        :keyword ec_extra_fragments: number of fragments to read in
+            addition to the ones required to decode an EC object. Each
+            segment is decoded with the first fragments to arrive, and
+            fragments are read from the fastest rawx services.
+        :type ec_extra_fragments: `int`
         """
         self.namespace = namespace
         conf = {"namespace": self.namespace}
@@ -607,7 +638,9 @@ class ObjectStorageApi(object):
 
         :keyword perfdata: optional `dict` that will be filled with metrics
             of time spent to resolve the meta2 address, to do the meta2
-            requests, and to upload chunks to rawx services.
+            requests, and to upload chunks to rawx services, and with
+            the number of rawx connections reused from the connection
+            pool ('rawx_pool_hits') or newly opened ('rawx_pool_misses').
         :keyword deadline: deadline for the request, in monotonic time
             (`oio.common.utils.monotonic_time`). This supersedes `timeout`
             or `read_timeout` keyword arguments.
@@ -997,7 +1030,10 @@ class ObjectStorageApi(object):
         :type properties: `bool`
         :keyword perfdata: optional `dict` that will be filled with metrics
             of time spent to resolve the meta2 address, to do the meta2
-            request, and the time-to-first-byte, as seen by this API.
+            request, and the time-to-first-byte, as seen by this API,
+            and with the number of rawx connections reused from the
+            connection pool ('rawx_pool_hits') or newly opened
+            ('rawx_pool_misses').
 
         :returns: a dictionary of object metadata and
             a stream of object data
@@ -1006,6 +1042,7 @@ class ObjectStorageApi(object):
         perfdata = kwargs.get('perfdata', self.container.perfdata)
         if perfdata is not None:
             req_start = monotonic_time()
+            kwargs['perfdata'] = perfdata
 
         # Check cid format
         cid_arg = kwargs.get('cid')
@@ -1023,7 +1060,8 @@ class ObjectStorageApi(object):
             account, container, obj, version=version, **kwargs)
         chunk_method = meta['chunk_method']
         storage_method = STORAGE_METHODS.load(chunk_method)
-        chunks = _sort_chunks(raw_chunks, storage_method.ec)
+        latency = RAWX_LATENCY if kwargs.get('hedge_percentile') else None
+        chunks = _sort_chunks(raw_chunks, storage_method.ec, latency=latency)
         meta['container_id'] = (
             cid_arg or cid_from_name(account, container).upper())
         meta['ns'] = self.namespace
@@ -1174,6 +1212,7 @@ class ObjectStorageApi(object):
                                         backblaze_info=backblaze_info)
         else:
             write_handler_cls = ReplicatedWriteHandler
+        kwargs.setdefault('perfdata', self.container.perfdata)
         handler = write_handler_cls(
                 source, obj_meta, chunk_prep, storage_method, **kwargs)
 
@@ -1318,24 +1357,38 @@ class ObjectStorageApi(object):
     @handle_account_not_found
     @ensure_headers
     @ensure_request_id
-    def account_refresh(self, account=None, **kwargs):
+    def account_refresh(self, account=None, batch_size=None, **kwargs):
         """
         Refresh counters of an account.
 
         :param account: name of the account to refresh,
             or None to refresh all accounts (slow)
         :type account: `str`
+        :param batch_size: number of containers summed by each request
+            to the account service (by default, the account service
+            refreshes the whole account in one request)
+        :type batch_size: `int`
         """
         if account is None:
             accounts = self.account_list(**kwargs)
             for account in accounts:
                 try:
-                    self.account_refresh(account, **kwargs)
+                    self.account_refresh(account, batch_size=batch_size,
+                                         **kwargs)
                 except exc.NoSuchAccount:  # account remove in the meantime
                     pass
             return
 
-        self.account.account_refresh(account, **kwargs)
+        if batch_size is None:
+            self.account.account_refresh(account, **kwargs)
+        else:
+            progress = {'done': False}
+            while not progress['done']:
+                progress = self.account.account_refresh(
+                    account, batch_size=batch_size, **kwargs)
+                self.logger.info("Refreshing account %s: %d/%d containers",
+                                 account, progress['scanned'],
+                                 progress['total'])
 
         containers = self.container_list(account, **kwargs)
         for container in containers:
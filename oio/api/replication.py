@@ -58,7 +58,16 @@ class ReplicatedMetachunkWriter(io.MetachunkWriter):
         self.read_timeout = read_timeout or io.CLIENT_TIMEOUT
         self.headers = headers or {}
 
-    def stream(self, source, size=None):
+    def stream(self, source, size=None, content_length=None):
+        """
+        Upload the data of a metachunk.
+
+        :param size: maximum amount of data to read from `source`
+        :param content_length: if set, upload exactly this amount of data
+            with a Content-Length header instead of chunked transfer
+            encoding. Data blocks read from `source` are sent as they are
+            (`buffer` objects are not copied).
+        """
         bytes_transferred = 0
         meta_chunk = self.meta_chunk
         if self.chunk_checksum_algo:
@@ -70,7 +79,7 @@ class ReplicatedMetachunkWriter(io.MetachunkWriter):
         current_conns = []
 
         for chunk in meta_chunk:
-            pile.spawn(self._connect_put, chunk)
+            pile.spawn(self._connect_put, chunk, content_length)
 
         for conn, chunk in [d for d in pile]:
             if not conn:
@@ -80,6 +89,8 @@ class ReplicatedMetachunkWriter(io.MetachunkWriter):
 
         self.quorum_or_fail([co.chunk for co in current_conns], failed_chunks)
 
+        if content_length is not None:
+            size = content_length
         bytes_transferred = 0
         try:
             with green.ContextPool(len(meta_chunk)) as pool:
@@ -103,6 +114,13 @@ class ReplicatedMetachunkWriter(io.MetachunkWriter):
                         except (ValueError, IOError) as e:
                             raise SourceReadError(str(e))
                         if len(data) == 0:
+                            if content_length is not None:
+                                if bytes_transferred < content_length:
+                                    raise SourceReadError(
+                                        "Source is shorter than expected "
+                                        "(%d/%d)" % (bytes_transferred,
+                                                     content_length))
+                                break
                             for conn in current_conns:
                                 if not conn.failed:
                                     conn.queue.put('0\r\n\r\n')
@@ -112,9 +130,11 @@ class ReplicatedMetachunkWriter(io.MetachunkWriter):
                         meta_checksum.update(data)
                     bytes_transferred += len(data)
                     # copy current_conns to be able to remove a failed conn
+                    if content_length is None:
+                        data = '%x\r\n%s\r\n' % (len(data), data)
                     for conn in current_conns[:]:
                         if not conn.failed:
-                            conn.queue.put('%x\r\n%s\r\n' % (len(data), data))
+                            conn.queue.put(data)
                         else:
                             current_conns.remove(conn)
                             failed_chunks.append(conn.chunk)
@@ -160,10 +180,12 @@ class ReplicatedMetachunkWriter(io.MetachunkWriter):
 
         return bytes_transferred, success_chunks[0]['hash'], success_chunks
 
-    def _connect_put(self, chunk):
+    def _connect_put(self, chunk, content_length=None):
         """
         Create a connection in order to PUT `chunk`.
 
+        :param content_length: size of the chunk, if known in advance
+            (otherwise chunked transfer encoding is used)
         :returns: a tuple with the connection object and `chunk`
         """
         raw_url = chunk.get("real_url", chunk["url"])
@@ -174,10 +196,14 @@ class ReplicatedMetachunkWriter(io.MetachunkWriter):
             hdrs[CHUNK_HEADERS["chunk_pos"]] = chunk["pos"]
             hdrs[CHUNK_HEADERS["chunk_id"]] = chunk_path
             hdrs.update(self.headers)
+            if content_length is not None:
+                hdrs.pop('transfer-encoding', None)
+                hdrs['Content-Length'] = content_length
 
             with green.ConnectionTimeout(self.connection_timeout):
                 conn = io.http_connect(
-                    parsed.netloc, 'PUT', parsed.path, hdrs)
+                    parsed.netloc, 'PUT', parsed.path, hdrs,
+                    perfdata=self.perfdata)
                 conn.chunk = chunk
             return conn, chunk
         except (SocketError, Timeout) as err:
@@ -229,7 +255,7 @@ class ReplicatedMetachunkWriter(io.MetachunkWriter):
         `failures` list.
         Otherwise put `conn.chunk` in `successes` list.
 
-        And then close `conn`.
+        And then release `conn`.
         """
         if resp:
             if isinstance(resp, (Exception, Timeout)):
@@ -256,37 +282,58 @@ class ReplicatedMetachunkWriter(io.MetachunkWriter):
                 else:
                     conn.chunk['hash'] = checksum or rawx_checksum
                     successes.append(conn.chunk)
-        conn.close()
+        conn.release()
 
 
 class ReplicatedWriteHandler(io.WriteHandler):
     """
     Handles writes to a replicated content.
     For initialization parameters, see oio.api.io.WriteHandler.
+
+    Regular files are read through a memory mapping, and uploaded
+    with a Content-Length, without copying their data.
     """
 
+    def __init__(self, source, *args, **kwargs):
+        super(ReplicatedWriteHandler, self).__init__(source, *args, **kwargs)
+        self.mapped_source = io.MappedFile.from_source(source)
+        if self.mapped_source is not None:
+            self.source = self.mapped_source
+
     def stream(self):
+        try:
+            return self._stream()
+        finally:
+            if self.mapped_source is not None:
+                self.mapped_source.close()
+
+    def _stream(self):
         global_checksum = hashlib.md5()
         total_bytes_transferred = 0
         content_chunks = []
+        size = self.sysmeta['chunk_size']
 
-        for meta_chunk in self.chunk_prep():
-            size = self.sysmeta['chunk_size']
+        def _stream_metachunk(meta_chunk, source):
             handler = ReplicatedMetachunkWriter(
                 self.sysmeta, meta_chunk, global_checksum, self.storage_method,
                 connection_timeout=self.connection_timeout,
                 write_timeout=self.write_timeout,
                 read_timeout=self.read_timeout,
                 headers=self.headers,
-                chunk_checksum_algo=self.chunk_checksum_algo)
-            bytes_transferred, _h, chunks = handler.stream(self.source, size)
+                chunk_checksum_algo=self.chunk_checksum_algo,
+                perfdata=self.perfdata)
+            content_length = None
+            if self.mapped_source is not None:
+                # the size of the metachunk is known in advance
+                content_length = min(size, self.mapped_source.remaining)
+            bytes_transferred, _h, chunks = handler.stream(
+                source, size, content_length=content_length)
+            return bytes_transferred, chunks
+
+        for bytes_transferred, chunks in self._stream_metachunks(
+                _stream_metachunk, size):
             content_chunks += chunks
-
             total_bytes_transferred += bytes_transferred
-            if bytes_transferred < size:
-                break
-            if len(self.source.peek()) == 0:
-                break
 
         content_checksum = global_checksum.hexdigest()
 
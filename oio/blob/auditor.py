@@ -14,24 +14,118 @@
 # along with this program.  If not, see <http://www.gnu.org/licenses/>.
 
 
-from oio.common.green import ratelimit
+from oio.common.green import ratelimit, tpool, GreenPool, Semaphore
 
 from contextlib import closing
 from string import hexdigits
 import hashlib
+import os
+import sqlite3
 import time
 
 from oio.blob.utils import check_volume, read_chunk_metadata
 from oio.container.client import ContainerClient
 from oio.common.daemon import Daemon
 from oio.common import exceptions as exc
-from oio.common.utils import paths_gen
-from oio.common.easy_value import int_value
+from oio.common.utils import posix_fadvise, \
+    POSIX_FADV_SEQUENTIAL, POSIX_FADV_DONTNEED
+from oio.common.volume_scanner import VolumeScanner
+from oio.common.easy_value import int_value, float_value
 from oio.common.logger import get_logger
 from oio.common.constants import STRLEN_CHUNKID
+from oio.content.cache import LocateCache
 
 
 SLEEP_TIME = 30
+AUDIT_CONCURRENCY = 4
+READ_BUFFER_SIZE = 1024 * 1024
+FULL_AUDIT_FRACTION = 0.1
+AUDIT_STATE_COMMIT_INTERVAL = 1000
+
+
+class AuditState(object):
+    """
+    Size and times of the chunks of a volume, as they were the last time
+    the chunks have been read and found healthy. Kept in a sqlite database
+    outside of the volume, so recording them does not touch the chunks.
+
+    At each pass, the chunks of a rotating slice of the volume are fully
+    audited whatever their state, so that every chunk is read again
+    at least once every 1/`full_audit_fraction` passes (never if
+    `full_audit_fraction` is zero).
+    """
+
+    def __init__(self, path, full_audit_fraction=FULL_AUDIT_FRACTION):
+        self.path = path
+        self.slices = 0
+        if full_audit_fraction > 0:
+            self.slices = max(1, int(round(1.0 / full_audit_fraction)))
+        self.pass_number = 0
+        self.pending = 0
+        self.db = sqlite3.connect(path)
+        self.db.execute('CREATE TABLE IF NOT EXISTS chunks ('
+                        'id TEXT PRIMARY KEY, size INTEGER, '
+                        'mtime REAL, ctime REAL, pass INTEGER)')
+        self.db.execute('CREATE TABLE IF NOT EXISTS admin ('
+                        'k TEXT PRIMARY KEY, v INTEGER)')
+        self.db.commit()
+
+    def start_pass(self):
+        row = self.db.execute(
+            "SELECT v FROM admin WHERE k = 'pass'").fetchone()
+        self.pass_number = (row[0] if row else 0) + 1
+        self.db.execute("INSERT OR REPLACE INTO admin VALUES ('pass', ?)",
+                        (self.pass_number, ))
+        self.db.commit()
+
+    def end_pass(self):
+        """Forget the chunks which have not been seen during the pass."""
+        self.db.execute('DELETE FROM chunks WHERE pass < ?',
+                        (self.pass_number, ))
+        self.db.commit()
+        self.pending = 0
+
+    def close(self):
+        self.db.commit()
+        self.db.close()
+
+    def must_read(self, chunk_id, stat):
+        """
+        Tell if the chunk must be read and hashed, because it belongs to
+        the slice fully audited by the current pass, or because it has
+        changed since the last time it has been read. If not, mark
+        the chunk as seen by the current pass.
+        """
+        if self.slices and int(chunk_id[:8], 16) % self.slices == \
+                self.pass_number % self.slices:
+            return True
+        row = self.db.execute(
+            'SELECT size, mtime, ctime FROM chunks WHERE id = ?',
+            (chunk_id, )).fetchone()
+        if row is None or \
+                tuple(row) != (stat.st_size, stat.st_mtime, stat.st_ctime):
+            return True
+        self.db.execute('UPDATE chunks SET pass = ? WHERE id = ?',
+                        (self.pass_number, chunk_id))
+        self._written()
+        return False
+
+    def verified(self, chunk_id, stat):
+        """Record the state of a chunk which has been read successfully."""
+        self.db.execute(
+            'INSERT OR REPLACE INTO chunks VALUES (?, ?, ?, ?, ?)',
+            (chunk_id, stat.st_size, stat.st_mtime, stat.st_ctime,
+             self.pass_number))
+        self._written()
+
+    def _written(self):
+        self.pending += 1
+        if self.pending >= AUDIT_STATE_COMMIT_INTERVAL:
+            self.db.commit()
+            self.pending = 0
+
+    def forget(self, chunk_id):
+        self.db.execute('DELETE FROM chunks WHERE id = ?', (chunk_id, ))
 
 
 class BlobAuditorWorker(object):
@@ -51,17 +145,46 @@ class BlobAuditorWorker(object):
         self.bytes_processed = 0
         self.total_bytes_processed = 0
         self.total_chunks_processed = 0
+        self.total_chunks_skipped = 0
         self.report_interval = int_value(
             conf.get('report_interval'), 3600)
         self.max_chunks_per_second = int_value(
             conf.get('chunks_per_second'), 30)
         self.max_bytes_per_second = int_value(
             conf.get('bytes_per_second'), 10000000)
+        self.concurrency = int_value(
+            conf.get('concurrency'), AUDIT_CONCURRENCY)
+        self.read_buffer_size = int_value(
+            conf.get('read_buffer_size'), READ_BUFFER_SIZE)
+        self.audit_state_file = conf.get('audit_state_file')
+        self.full_audit_fraction = float_value(
+            conf.get('full_audit_fraction'), FULL_AUDIT_FRACTION)
+        self.audit_state = None
+        self.resumed_from = None
         self.container_client = ContainerClient(conf, logger=self.logger)
+        self.locate_cache = LocateCache.from_conf(conf, self.container_client)
+        self._bytes_lock = Semaphore()
 
     def audit_pass(self):
         self.namespace, self.address = check_volume(self.volume)
-
+        if self.audit_state_file:
+            # Incremental mode: only read the chunks which have changed
+            # since the last time they were read, plus a rotating slice.
+            self.audit_state = AuditState(self.audit_state_file,
+                                          self.full_audit_fraction)
+            self.audit_state.start_pass()
+        try:
+            self._audit_pass()
+            # A pass resumed from a scan checkpoint has not seen
+            # the chunks of the directories before the checkpoint.
+            if self.audit_state is not None and self.resumed_from is None:
+                self.audit_state.end_pass()
+        finally:
+            if self.audit_state is not None:
+                self.audit_state.close()
+                self.audit_state = None
+
+    def _audit_pass(self):
         start_time = report_time = time.time()
 
         total_errors = 0
@@ -70,11 +193,17 @@ class BlobAuditorWorker(object):
         total_faulty = 0
         audit_time = 0
 
-        paths = paths_gen(self.volume)
+        scanner = VolumeScanner.from_conf(self.volume, self.conf,
+                                          logger=self.logger)
+        self.resumed_from = None
+        paths = iter(scanner)
+        # Chunks are read in native threads while other green threads
+        # wait for meta2, so disk and network latencies overlap.
+        pool = GreenPool(self.concurrency)
 
         for path in paths:
             loop_time = time.time()
-            self.safe_chunk_audit(path)
+            pool.spawn_n(self.safe_chunk_audit, path)
             self.chunks_run_time = ratelimit(
                 self.chunks_run_time,
                 self.max_chunks_per_second
@@ -121,6 +250,8 @@ class BlobAuditorWorker(object):
                 self.bytes_processed = 0
                 self.last_reported = now
             audit_time += (now - loop_time)
+        pool.waitall()
+        self.resumed_from = scanner.resumed_from
         elapsed = (time.time() - start_time) or 0.000001
         self.logger.info(
             '%(elapsed).02f '
@@ -131,7 +262,8 @@ class BlobAuditorWorker(object):
             '%(chunk_rate).2f '
             '%(bytes_rate).2f '
             '%(audit_time).2f '
-            '%(audit_rate).2f' % {
+            '%(audit_rate).2f '
+            '%(skipped)d' % {
                 'elapsed': elapsed,
                 'corrupted': total_corrupted + self.corrupted_chunks,
                 'faulty': total_faulty + self.faulty_chunks,
@@ -140,9 +272,14 @@ class BlobAuditorWorker(object):
                 'chunk_rate': self.total_chunks_processed / elapsed,
                 'bytes_rate': self.total_bytes_processed / elapsed,
                 'audit_time': audit_time,
-                'audit_rate': audit_time / elapsed
+                'audit_rate': audit_time / elapsed,
+                'skipped': self.total_chunks_skipped
             }
         )
+        self.logger.info(
+            'locate cache: hits=%(hits)d misses=%(misses)d '
+            'hit_rate=%(hit_rate).2f contents=%(size)d chunks=%(chunks)d',
+            self.locate_cache.stats())
 
     def safe_chunk_audit(self, path):
         chunk_id = path.rsplit('/', 1)[-1]
@@ -154,13 +291,27 @@ class BlobAuditorWorker(object):
                 self.logger.warn('WARN Not a chunk %s' % path)
                 return
         try:
-            self.chunk_audit(path, chunk_id)
+            must_read, stat = self._must_read(path, chunk_id)
+            if must_read:
+                # Wait for the bytes/s budget before reading, so that
+                # concurrent reads do not exceed it.
+                self._account_bytes(self._chunk_file_size(path, stat))
+                meta = tpool.execute(self.chunk_read, path, chunk_id)
+            else:
+                # Unchanged since it was last found healthy
+                meta = self.chunk_read_metadata(path, chunk_id)
+                self.total_chunks_skipped += 1
+            self.chunk_check(meta, self._cached_content_locate)
+            if must_read and stat is not None:
+                self.audit_state.verified(chunk_id, stat)
         except exc.FaultyChunk as err:
             self.faulty_chunks += 1
             self.logger.error('ERROR faulty chunk %s: %s', path, err)
+            self._forget(chunk_id)
         except exc.CorruptedChunk as err:
             self.corrupted_chunks += 1
             self.logger.error('ERROR corrupted chunk %s: %s', path, err)
+            self._forget(chunk_id)
         except exc.OrphanChunk as err:
             self.orphan_chunks += 1
             self.logger.error('ERROR orphan chunk %s: %s', path, err)
@@ -170,57 +321,133 @@ class BlobAuditorWorker(object):
 
         self.passes += 1
 
+    def _must_read(self, path, chunk_id):
+        """
+        :returns: a tuple telling if the chunk data must be read,
+            and the stat of the chunk file (in incremental mode only)
+        """
+        if self.audit_state is None:
+            return True, None
+        stat = os.stat(path)
+        return self.audit_state.must_read(chunk_id, stat), stat
+
+    @staticmethod
+    def _chunk_file_size(path, stat=None):
+        if stat is None:
+            stat = os.stat(path)
+        return stat.st_size
+
+    def _forget(self, chunk_id):
+        if self.audit_state is not None:
+            self.audit_state.forget(chunk_id)
+
     def chunk_audit(self, path, chunk_id):
-        with open(path) as f:
-            try:
-                meta, _ = read_chunk_metadata(f, chunk_id)
-            except exc.MissingAttribute as e:
-                raise exc.FaultyChunk(
-                    'Missing extended attribute %s' % e)
+        self._account_bytes(self._chunk_file_size(path))
+        meta = self.chunk_read(path, chunk_id)
+        self.chunk_check(meta, self.content_locate)
+
+    def chunk_read(self, path, chunk_id):
+        """
+        Read the chunk at `path` and check its size and checksum
+        against its extended attributes.
+
+        Does not yield to other green threads, so it can be run
+        in the native thread pool.
+
+        :returns: the metadata of the chunk
+        """
+        with open(path, 'rb') as f:
+            meta = self._read_metadata(f, chunk_id)
             size = int(meta['chunk_size'])
             md5_checksum = meta['chunk_hash'].lower()
-            reader = ChunkReader(f, size, md5_checksum)
+            reader = ChunkReader(f, size, md5_checksum,
+                                 buffer_size=self.read_buffer_size)
             with closing(reader):
-                for buf in reader:
-                    buf_len = len(buf)
-                    self.bytes_running_time = ratelimit(
-                        self.bytes_running_time,
-                        self.max_bytes_per_second,
-                        increment=buf_len)
-                    self.bytes_processed += buf_len
-                    self.total_bytes_processed += buf_len
-
-            try:
-                container_id = meta['container_id']
-                content_id = meta['content_id']
-                _obj_meta, data = self.container_client.content_locate(
-                    cid=container_id, content=content_id, properties=False)
-
-                # Check chunk data
-                chunk_data = None
-                metachunks = set()
-                for c in data:
-                    if c['url'].endswith(meta['chunk_id']):
-                        metachunks.add(c['pos'].split('.', 2)[0])
-                        chunk_data = c
-                if not chunk_data:
-                    raise exc.OrphanChunk('Not found in content')
-
-                metachunk_size = meta.get('metachunk_size')
-                if metachunk_size is not None \
-                        and chunk_data['size'] != int(metachunk_size):
-                    raise exc.FaultyChunk('Invalid metachunk size found')
-
-                metachunk_hash = meta.get('metachunk_hash')
-                if metachunk_hash is not None \
-                        and chunk_data['hash'] != meta['metachunk_hash']:
-                    raise exc.FaultyChunk('Invalid metachunk hash found')
-
-                if chunk_data['pos'] != meta['chunk_pos']:
-                    raise exc.FaultyChunk('Invalid chunk position found')
-
-            except exc.NotFound:
-                raise exc.OrphanChunk('Chunk not found in container')
+                for _ in reader:
+                    pass
+        return meta
+
+    def chunk_read_metadata(self, path, chunk_id):
+        """
+        Read the extended attributes of the chunk at `path`,
+        without reading its data.
+        """
+        with open(path, 'rb') as f:
+            return self._read_metadata(f, chunk_id)
+
+    def _read_metadata(self, f, chunk_id):
+        try:
+            meta, _ = read_chunk_metadata(f, chunk_id)
+        except exc.MissingAttribute as e:
+            raise exc.FaultyChunk(
+                'Missing extended attribute %s' % e)
+        return meta
+
+    def _account_bytes(self, bytes_read):
+        with self._bytes_lock:
+            self.bytes_running_time = ratelimit(
+                self.bytes_running_time,
+                self.max_bytes_per_second,
+                increment=bytes_read)
+        self.bytes_processed += bytes_read
+        self.total_bytes_processed += bytes_read
+
+    def content_locate(self, container_id, content_id):
+        """
+        :returns: the list of chunks of the content
+        """
+        try:
+            _obj_meta, data = self.container_client.content_locate(
+                cid=container_id, content=content_id, properties=False)
+        except exc.NotFound:
+            raise exc.OrphanChunk('Chunk not found in container')
+        return data
+
+    def _cached_content_locate(self, container_id, content_id):
+        """
+        Like `content_locate`, but share the request (and its result)
+        between all the chunks of a content, which are usually stored
+        on the same volume.
+        """
+        try:
+            _obj_meta, data = self.locate_cache.content_locate(
+                container_id, content_id)
+        except exc.NotFound:
+            raise exc.OrphanChunk('Chunk not found in container')
+        return data
+
+    def chunk_check(self, meta, content_locate):
+        """
+        Check the chunk is referenced by its content, at the position
+        and with the size and hash declared in its extended attributes.
+
+        :param content_locate: function returning the list of chunks
+            of a content, from a container ID and a content ID
+        """
+        data = content_locate(meta['container_id'], meta['content_id'])
+
+        # Check chunk data
+        chunk_data = None
+        metachunks = set()
+        for c in data:
+            if c['url'].endswith(meta['chunk_id']):
+                metachunks.add(c['pos'].split('.', 2)[0])
+                chunk_data = c
+        if not chunk_data:
+            raise exc.OrphanChunk('Not found in content')
+
+        metachunk_size = meta.get('metachunk_size')
+        if metachunk_size is not None \
+                and chunk_data['size'] != int(metachunk_size):
+            raise exc.FaultyChunk('Invalid metachunk size found')
+
+        metachunk_hash = meta.get('metachunk_hash')
+        if metachunk_hash is not None \
+                and chunk_data['hash'] != meta['metachunk_hash']:
+            raise exc.FaultyChunk('Invalid metachunk hash found')
+
+        if chunk_data['pos'] != meta['chunk_pos']:
+            raise exc.FaultyChunk('Invalid chunk position found')
 
 
 class BlobAuditor(Daemon):
@@ -250,23 +477,29 @@ class BlobAuditor(Daemon):
 
 
 class ChunkReader(object):
-    def __init__(self, fp, size, md5_checksum):
+    def __init__(self, fp, size, md5_checksum,
+                 buffer_size=READ_BUFFER_SIZE):
         self.fp = fp
         self.size = size
         self.md5_checksum = md5_checksum
+        self.buffer_size = buffer_size
         self.bytes_read = 0
         self.iter_md5 = None
 
     def __iter__(self):
         self.iter_md5 = hashlib.md5()
+        fd = self.fp.fileno()
+        posix_fadvise(fd, 0, 0, POSIX_FADV_SEQUENTIAL)
         while True:
-            buf = self.fp.read()
+            buf = self.fp.read(self.buffer_size)
             if buf:
                 self.iter_md5.update(buf)
                 self.bytes_read += len(buf)
                 yield buf
             else:
                 break
+        # The chunk won't be read again soon, don't keep it in cache
+        posix_fadvise(fd, 0, 0, POSIX_FADV_DONTNEED)
 
     def close(self):
         if self.fp:
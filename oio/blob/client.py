@@ -16,6 +16,7 @@
 
 from oio.common.green import GreenPile
 
+import hashlib
 import random
 from functools import wraps
 from urllib import unquote
@@ -50,6 +51,78 @@ def extract_headers_meta(headers):
     return meta
 
 
+class ChecksumReader(object):
+    """
+    File-like object reading the data blocks yielded by an iterator
+    (e.g. the stream returned by `BlobClient.chunk_get`) without
+    buffering more than one block, and computing a running checksum.
+
+    When the iterator is exhausted, the checksum and the size of
+    what has been read are compared to `checksum` and `size` (if set),
+    and `exc.CorruptedChunk` is raised on mismatch. This happens before
+    the writer sends the end of the upload, thus corrupted data never
+    makes it to a complete chunk.
+    """
+
+    def __init__(self, source, checksum=None, size=None):
+        self.source = iter(source)
+        self.checksum = checksum.lower() if checksum else None
+        self.size = int(size) if size is not None else None
+        self.hasher = hashlib.md5()
+        self.bytes_read = 0
+        self._buf = ''
+        self._offset = 0
+        self._eof = False
+
+    def _check(self):
+        if self.size is not None and self.bytes_read != self.size:
+            raise exc.CorruptedChunk(
+                'Size mismatch: %d bytes read, %d expected' %
+                (self.bytes_read, self.size))
+        # Only MD5 checksums can be verified
+        if self.checksum and len(self.checksum) == 32:
+            actual = self.hasher.hexdigest()
+            if actual != self.checksum:
+                raise exc.CorruptedChunk(
+                    'Checksum mismatch: %s computed, %s expected' %
+                    (actual, self.checksum))
+
+    def _fill(self):
+        while self._offset >= len(self._buf):
+            self._offset = 0
+            try:
+                self._buf = next(self.source)
+            except StopIteration:
+                self._buf = ''
+                if not self._eof:
+                    self._eof = True
+                    self._check()
+                return
+            self.hasher.update(self._buf)
+            self.bytes_read += len(self._buf)
+
+    def read(self, size=-1):
+        """
+        Read at most `size` bytes (only one data block of the source
+        is read at a time, thus less bytes may be returned).
+        """
+        if size is None or size < 0:
+            parts = list()
+            self._fill()
+            while self._buf:
+                parts.append(self._buf[self._offset:])
+                self._offset = len(self._buf)
+                self._fill()
+            return ''.join(parts)
+        self._fill()
+        if self._offset == 0 and len(self._buf) <= size:
+            data = self._buf
+        else:
+            data = self._buf[self._offset:self._offset + size]
+        self._offset += len(data)
+        return data
+
+
 def update_rawx_perfdata(func):
     @wraps(func)
     def _update_rawx_perfdata(self, *args, **kwargs):
@@ -78,10 +151,23 @@ class BlobClient(object):
         return self.cache.resolve(url)
 
     @update_rawx_perfdata
-    def chunk_put(self, url, meta, data, **kwargs):
+    def chunk_put(self, url, meta, data, size=None, **kwargs):
+        """
+        Upload a chunk to one or several rawx services.
+
+        :param url: URL of the chunk, or `list` of URLs
+        :param data: a file-like object, or an iterator of data blocks
+        :param size: expected size of the data, checked before
+            the end of the upload when `data` is an iterator
+        :returns: the `list` of uploaded chunks (`dict` with 'url',
+            'pos', 'size' and 'hash' keys)
+        """
         if not hasattr(data, 'read'):
-            data = utils.GeneratorIO(data)
-        chunk = {'url': self.resolve_url(url), 'pos': meta['chunk_pos']}
+            data = ChecksumReader(data, size=size)
+        if isinstance(url, basestring):
+            url = [url]
+        chunks = [{'url': self.resolve_url(url_), 'pos': meta['chunk_pos']}
+                  for url_ in url]
         # FIXME: ugly
         chunk_method = meta.get('chunk_method',
                                 meta.get('content_chunkmethod'))
@@ -89,9 +175,10 @@ class BlobClient(object):
         checksum = meta['metachunk_hash' if storage_method.ec
                         else 'chunk_hash']
         writer = ReplicatedMetachunkWriter(
-            meta, [chunk], FakeChecksum(checksum),
+            meta, chunks, FakeChecksum(checksum),
             storage_method, quorum=1)
-        writer.stream(data, None)
+        _, _, success_chunks = writer.stream(data, None)
+        return success_chunks
 
     @update_rawx_perfdata
     def chunk_delete(self, url, **kwargs):
@@ -174,11 +261,24 @@ class BlobClient(object):
     def chunk_copy(self, from_url, to_url, chunk_id=None, fullpath=None,
                    cid=None, path=None, version=None, content_id=None,
                    **kwargs):
+        """
+        Copy a chunk to one or several rawx services. The data is read
+        only once from the source, and streamed to the destinations
+        through bounded buffers. The checksum and the size of the data
+        are verified on the fly: the copies are aborted if they do not
+        match the metadata of the source chunk.
+
+        :param to_url: URL of the copy, or `list` of URLs
+        :returns: the `list` of copied chunks
+        :raises exc.CorruptedChunk: if the source chunk is corrupted
+        """
         stream = None
+        if isinstance(to_url, basestring):
+            to_url = [to_url]
         try:
             meta, stream = self.chunk_get(from_url, **kwargs)
             meta['oio_version'] = OIO_VERSION
-            meta['chunk_id'] = chunk_id or to_url.split('/')[-1]
+            meta['chunk_id'] = chunk_id or to_url[0].split('/')[-1]
             meta['full_path'] = fullpath or meta['full_path']
             meta['container_id'] = cid or meta['container_id']
             meta['content_path'] = path or meta['content_path']
@@ -188,8 +288,9 @@ class BlobClient(object):
             meta['id'] = content_id or meta['content_id']
             meta['chunk_method'] = meta['content_chunkmethod']
             meta['policy'] = meta['content_policy']
-            copy_meta = self.chunk_put(to_url, meta, stream, **kwargs)
-            return copy_meta
+            source = ChecksumReader(stream, checksum=meta.get('chunk_hash'),
+                                    size=meta.get('chunk_size'))
+            return self.chunk_put(to_url, meta, source, **kwargs)
         finally:
             if stream:
                 stream.close()
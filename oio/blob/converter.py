@@ -400,7 +400,8 @@ class BlobConverter(object):
         if input_file:
             return self._fetch_chunks_from_file(input_file)
         else:
-            return paths_gen(self.volume)
+            return paths_gen(self.volume, conf=self.conf,
+                             logger=self.logger)
 
     def converter_pass(self, input_file=None):
         def report(tag, now=None):
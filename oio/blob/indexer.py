@@ -22,7 +22,7 @@ from random import random
 from string import hexdigits
 
 from oio.blob.utils import check_volume, read_chunk_metadata
-from oio.rdir.client import RdirClient
+from oio.rdir.client import RdirClient, RDIR_BATCH_SIZE
 from oio.common.daemon import Daemon
 from oio.common import exceptions as exc
 from oio.common.utils import paths_gen, request_id
@@ -54,6 +54,7 @@ class BlobIndexer(Daemon):
             conf.get('report_interval'), 3600)
         self.max_chunks_per_second = int_value(
             conf.get('chunks_per_second'), 30)
+        self.batch_size = int_value(conf.get('batch_size'), RDIR_BATCH_SIZE)
         pm = get_pool_manager(pool_connections=10)
         self.index_client = RdirClient(conf, logger=self.logger,
                                        pool_manager=pm)
@@ -77,23 +78,38 @@ class BlobIndexer(Daemon):
                     self.logger.warn('WARN Not a chunk %s' % path)
                     return
             try:
-                self.update_index(path, chunk_id)
-                self.successes += 1
-                self.logger.debug('Updated %s', path)
-            except OioNetworkException as exc:
-                self.errors += 1
-                self.logger.warn('ERROR while updating %s: %s', path, exc)
-            except VolumeException as exc:
-                self.errors += 1
-                self.logger.error('Cannot index %s: %s', path, exc)
-                # All chunks of this volume are indexed in the same service,
-                # no need to try another chunk, it will generate the same
-                # error. Let the upper level retry later.
-                raise
+                entries.append(self.chunk_entry(path, chunk_id))
             except Exception:
                 self.errors += 1
+                self.total_since_last_reported += 1
                 self.logger.exception('ERROR while updating %s', path)
-            self.total_since_last_reported += 1
+                return
+            if len(entries) >= self.batch_size:
+                flush_entries()
+
+        def flush_entries():
+            headers = {'X-oio-req-id': 'blob-indexer-' + request_id()[:-13]}
+            failures = self.index_client.chunk_push_many(
+                entries, batch_size=self.batch_size, headers=headers)
+            self.total_since_last_reported += len(entries)
+            self.successes += len(entries) - len(failures)
+            self.errors += len(failures)
+            del entries[:]
+            for entry, err in failures:
+                if isinstance(err, VolumeException):
+                    self.logger.error('Cannot index %s: %s',
+                                      entry['chunk_id'], err)
+                    # All chunks of this volume are indexed in the same
+                    # service, no need to try another chunk, it will
+                    # generate the same error. Let the upper level retry
+                    # later.
+                    raise err
+                elif isinstance(err, OioNetworkException):
+                    self.logger.warn('ERROR while updating %s: %s',
+                                     entry['chunk_id'], err)
+                else:
+                    self.logger.error('ERROR while updating %s: %s',
+                                      entry['chunk_id'], err)
 
         def report(tag):
             total = self.errors + self.successes
@@ -123,8 +139,9 @@ class BlobIndexer(Daemon):
         self.last_reported = start_time
         self.errors = 0
         self.successes = 0
+        entries = list()
 
-        paths = paths_gen(self.volume)
+        paths = paths_gen(self.volume, conf=self.conf, logger=self.logger)
         report('started')
         for path in paths:
             safe_update_index(path)
@@ -135,9 +152,15 @@ class BlobIndexer(Daemon):
             now = time.time()
             if now - self.last_reported >= self.report_interval:
                 report('running')
+        if entries:
+            flush_entries()
         report('ended')
 
-    def update_index(self, path, chunk_id):
+    def chunk_entry(self, path, chunk_id):
+        """
+        Read the metadata of a chunk, and build the entry
+        to reference it in the rdir service.
+        """
         with open(path) as f:
             try:
                 meta = None
@@ -149,14 +172,20 @@ class BlobIndexer(Daemon):
                 raise exc.FaultyChunk(
                     'Missing extended attribute %s' % e)
 
-            data = {'mtime': int(time.time())}
-            headers = {'X-oio-req-id': 'blob-indexer-' + request_id()[:-13]}
-            self.index_client.chunk_push(self.volume_id,
-                                         meta['container_id'],
-                                         meta['content_id'],
-                                         meta['chunk_id'],
-                                         headers=headers,
-                                         **data)
+            return {'volume_id': self.volume_id,
+                    'container_id': meta['container_id'],
+                    'content_id': meta['content_id'],
+                    'chunk_id': meta['chunk_id'],
+                    'mtime': int(time.time())}
+
+    def update_index(self, path, chunk_id):
+        entry = self.chunk_entry(path, chunk_id)
+        headers = {'X-oio-req-id': 'blob-indexer-' + request_id()[:-13]}
+        self.index_client.chunk_push(entry.pop('volume_id'),
+                                     entry.pop('container_id'),
+                                     entry.pop('content_id'),
+                                     entry.pop('chunk_id'),
+                                     headers=headers, **entry)
 
     def run(self, *args, **kwargs):
         time.sleep(random() * self.interval)
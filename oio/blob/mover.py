@@ -14,9 +14,12 @@
 # along with this program.  If not, see <http://www.gnu.org/licenses/>.
 
 
-from oio.common.green import ratelimit
+from oio.common.green import ratelimit, tpool, GreenPool, Semaphore
 
+from contextlib import contextmanager
+from itertools import islice
 from string import hexdigits
+import os
 import time
 
 from oio.blob.client import BlobClient
@@ -30,10 +33,27 @@ from oio.common.easy_value import int_value, true_value
 from oio.common.logger import get_logger
 from oio.common.constants import STRLEN_CHUNKID
 from oio.common.fullpath import decode_fullpath
+from oio.content.cache import LocateCache
 from oio.content.factory import ContentFactory
 
 SLEEP_TIME = 30
 READ_BUFFER_SIZE = 65535
+MOVER_CONCURRENCY = 10
+SORT_WINDOW = 1000
+
+
+def _chunk_sizes(paths):
+    """
+    :returns: a list of (path, size) tuples, skipping the chunks
+        which have disappeared.
+    """
+    sized = list()
+    for path in paths:
+        try:
+            sized.append((path, os.stat(path).st_size))
+        except OSError:
+            pass
+    return sized
 
 
 class BlobMoverWorker(object):
@@ -63,10 +83,23 @@ class BlobMoverWorker(object):
         self.max_bytes_per_second = int_value(
             conf.get('bytes_per_second'), 10000000)
         self.limit = int_value(conf.get('limit'), 0)
+        self.concurrency = int_value(
+            conf.get('concurrency'), MOVER_CONCURRENCY)
+        self.sort_window = int_value(conf.get('sort_window'), SORT_WINDOW)
+        # Usage estimation
+        self.volume_size = 0
+        self.usage = 100.0
+        self.bytes_scheduled = 0
+        self.bytes_at_usage_check = 0
+        self._content_locks = dict()
         self.allow_links = true_value(conf.get('allow_links', True))
         self.blob_client = BlobClient(conf)
         self.container_client = ContainerClient(conf, logger=self.logger)
-        self.content_factory = ContentFactory(conf)
+        self.locate_cache = LocateCache.from_conf(
+            conf, self.container_client, properties=True)
+        self.content_factory = ContentFactory(
+            conf, container_client=self.container_client,
+            logger=self.logger, locate_cache=self.locate_cache)
 
     def mover_pass(self, **kwargs):
         start_time = report_time = time.time()
@@ -74,23 +107,32 @@ class BlobMoverWorker(object):
         total_errors = 0
         mover_time = 0
 
-        paths = paths_gen(self.volume)
+        paths = paths_gen(self.volume, conf=self.conf, logger=self.logger)
+        # Several chunks are moved at the same time, the bytes/s budget
+        # being consumed when a move is scheduled.
+        pool = GreenPool(self.concurrency)
+        self.check_usage()
 
-        for path in paths:
+        for path, size in self.sized_paths(paths):
             loop_time = time.time()
 
-            now = time.time()
-            if now - self.last_usage_check >= self.usage_check_interval:
-                free_ratio = statfs(self.volume)
-                usage = (1-float(free_ratio)) * 100
-                if usage <= self.usage_target:
-                    self.logger.info(
-                        'current usage %.2f%%: target reached (%.2f%%)', usage,
-                        self.usage_target)
-                    self.last_usage_check = now
-                    break
-
-            self.safe_chunk_move(path)
+            usage = self.estimated_usage()
+            if usage <= self.usage_target and pool.running():
+                # Some of the scheduled moves may fail
+                pool.waitall()
+                usage = self.estimated_usage()
+            if usage <= self.usage_target:
+                self.logger.info(
+                    'current usage %.2f%%: target reached (%.2f%%)', usage,
+                    self.usage_target)
+                break
+
+            self.bytes_running_time = ratelimit(
+                self.bytes_running_time,
+                self.max_bytes_per_second,
+                increment=size)
+            self.bytes_scheduled += size
+            pool.spawn_n(self.safe_chunk_move, path, size)
             self.chunks_run_time = ratelimit(
                 self.chunks_run_time,
                 self.max_chunks_per_second
@@ -126,6 +168,7 @@ class BlobMoverWorker(object):
             mover_time += (now - loop_time)
             if self.limit != 0 and self.total_chunks_processed >= self.limit:
                 break
+        pool.waitall()
         elapsed = (time.time() - start_time) or 0.000001
         self.logger.info(
             '%(elapsed).02f '
@@ -142,40 +185,124 @@ class BlobMoverWorker(object):
                 'mover_rate': mover_time / elapsed
             }
         )
+        self.logger.info(
+            'locate cache: hits=%(hits)d misses=%(misses)d '
+            'hit_rate=%(hit_rate).2f contents=%(size)d chunks=%(chunks)d',
+            self.locate_cache.stats())
+
+    def sized_paths(self, paths):
+        """
+        Yield (path, size) tuples, the largest chunks first in each
+        window of `sort_window` paths, so the usage decreases quickly.
+        Files which are not chunks are skipped.
+        """
+        paths = (path for path in paths if self._chunk_id(path))
+        window = max(self.sort_window, 1)
+        batch = list(islice(paths, window))
+        while batch:
+            sized = tpool.execute(_chunk_sizes, batch)
+            sized.sort(key=lambda item: item[1], reverse=True)
+            for item in sized:
+                yield item
+            batch = list(islice(paths, window))
+
+    def check_usage(self):
+        """Get the real usage of the volume."""
+        st = os.statvfs(self.volume)
+        self.volume_size = st.f_blocks * st.f_frsize
+        self.usage = (1 - float(statfs(self.volume))) * 100
+        self.bytes_at_usage_check = self.bytes_scheduled
+        self.last_usage_check = time.time()
 
-    def safe_chunk_move(self, path):
+    def estimated_usage(self):
+        """
+        Estimate the usage of the volume (in percent) from the last
+        real usage check and the size of the chunks moved since then.
+        The real usage is checked every `usage_check_interval` seconds.
+        """
+        if time.time() - self.last_usage_check >= self.usage_check_interval:
+            self.check_usage()
+        moved = self.bytes_scheduled - self.bytes_at_usage_check
+        return self.usage - 100.0 * moved / (self.volume_size or 1)
+
+    def _chunk_id(self, path):
+        """:returns: the ID of the chunk at `path`, or None"""
         chunk_id = path.rsplit('/', 1)[-1]
         if len(chunk_id) != STRLEN_CHUNKID:
             self.logger.warn('WARN Not a chunk %s' % path)
-            return
+            return None
         for c in chunk_id:
             if c not in hexdigits:
                 self.logger.warn('WARN Not a chunk %s' % path)
-                return
+                return None
+        return chunk_id
+
+    def safe_chunk_move(self, path, size=0):
+        chunk_id = self._chunk_id(path)
+        if chunk_id is None:
+            self.bytes_scheduled -= size
+            return
         try:
             self.chunk_move(path, chunk_id)
+            self.bytes_processed += size
+            self.total_bytes_processed += size
         except Exception as e:
             self.errors += 1
+            self.bytes_scheduled -= size
             self.logger.error('ERROR while moving chunk %s: %s', path, e)
         self.passes += 1
 
+    @contextmanager
+    def _content_lock(self, container_id, content_id):
+        """
+        Prevent concurrent moves of chunks of the same content,
+        which would ask for spare chunks without knowing each other.
+        """
+        key = (container_id, content_id)
+        lock = self._content_locks.get(key)
+        if lock is None:
+            lock = self._content_locks[key] = [Semaphore(), 0]
+        lock[1] += 1
+        try:
+            with lock[0]:
+                yield
+        finally:
+            lock[1] -= 1
+            if not lock[1]:
+                del self._content_locks[key]
+
     def load_chunk_metadata(self, path, chunk_id):
         with open(path) as f:
             meta, _ = read_chunk_metadata(f, chunk_id)
             return meta
 
+    def _content_moved(self, content):
+        """
+        Update the cached location of a content after one of its chunks
+        has been moved, so the next chunks of the same content do not
+        need another request.
+        """
+        self.locate_cache.put(content.container_id, content.content_id,
+                              content.metadata, content.chunks.raw())
+
     def chunk_move(self, path, chunk_id):
         meta = self.load_chunk_metadata(path, chunk_id)
         container_id = meta['container_id']
         content_id = meta['content_id']
         chunk_id = meta['chunk_id']
 
-        try:
-            content = self.content_factory.get(container_id, content_id)
-        except ContentNotFound:
-            raise exc.OrphanChunk('Content not found')
+        with self._content_lock(container_id, content_id):
+            try:
+                content = self.content_factory.get(container_id, content_id)
+            except ContentNotFound:
+                raise exc.OrphanChunk('Content not found')
 
-        new_chunk = content.move_chunk(chunk_id)
+            try:
+                new_chunk = content.move_chunk(chunk_id)
+            except Exception:
+                self.locate_cache.invalidate(container_id, content_id)
+                raise
+            self._content_moved(content)
 
         self.logger.info(
             'moved chunk http://%s/%s to %s',
@@ -188,14 +315,21 @@ class BlobMoverWorker(object):
                     decode_fullpath(fullpath)
                 container_id = cid_from_name(account, container)
 
-                try:
-                    content = self.content_factory.get(container_id,
-                                                       content_id)
-                except ContentNotFound:
-                    raise exc.OrphanChunk('Content not found')
+                with self._content_lock(container_id, content_id):
+                    try:
+                        content = self.content_factory.get(container_id,
+                                                           content_id)
+                    except ContentNotFound:
+                        raise exc.OrphanChunk('Content not found')
 
-                new_linked_chunk = content.move_linked_chunk(
-                    chunk_id, new_chunk['url'])
+                    try:
+                        new_linked_chunk = content.move_linked_chunk(
+                            chunk_id, new_chunk['url'])
+                    except Exception:
+                        self.locate_cache.invalidate(container_id,
+                                                     content_id)
+                        raise
+                    self._content_moved(content)
 
                 self.logger.info(
                     'moved chunk http://%s/%s to %s',
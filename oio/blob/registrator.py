@@ -78,7 +78,7 @@ class BlobRegistratorWorker(object):
 
         self.logger.info("START %s", self.volume)
 
-        paths = paths_gen(self.volume)
+        paths = paths_gen(self.volume, conf=self.conf, logger=self.logger)
         for path in paths:
             chunk_id = path.rsplit('/', 1)[-1]
             if len(chunk_id) != STRLEN_CHUNKID:
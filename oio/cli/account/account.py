@@ -224,16 +224,26 @@ class RefreshAccount(command.Command):
             help='Refresh all accounts (<account> is ignored)',
             action=ValueFormatStoreTrueAction
         )
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            metavar='<count>',
+            help=('Sum the counters of at most <count> containers per '
+                  'request to the account service, resuming any '
+                  'interrupted refresh (default: whole account at once)')
+        )
         return parser
 
     def take_action(self, parsed_args):
         self.log.debug('take_action(%s)', parsed_args)
 
         if parsed_args.all_accounts:
-            self.app.client_manager.storage.account_refresh()
+            self.app.client_manager.storage.account_refresh(
+                batch_size=parsed_args.batch_size)
         elif parsed_args.account is not None:
             self.app.client_manager.storage.account_refresh(
-                account=parsed_args.account)
+                account=parsed_args.account,
+                batch_size=parsed_args.batch_size)
         else:
             from argparse import ArgumentError
             raise ArgumentError(parsed_args.account,
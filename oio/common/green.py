@@ -20,12 +20,14 @@ import time
 import logging
 
 import eventlet.hubs as eventlet_hubs # noqa
-from eventlet import sleep, patcher, greenthread # noqa
+from eventlet import sleep, patcher, greenthread, tpool # noqa
 from eventlet import Queue, Timeout, GreenPile, GreenPool # noqa
 from eventlet.green import threading, socket # noqa
 from eventlet.green.httplib import HTTPConnection, HTTPResponse, _UNKNOWN # noqa
 from eventlet.event import Event # noqa
 from eventlet.queue import Empty, LifoQueue # noqa
+from eventlet.semaphore import Semaphore # noqa
+from greenlet import GreenletExit # noqa
 
 eventlet.monkey_patch(os=False)
 
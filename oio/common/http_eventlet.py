@@ -14,11 +14,22 @@
 # License along with this library.
 
 
-from oio.common.green import socket, HTTPConnection, HTTPResponse, _UNKNOWN
+from oio.common.green import socket, patcher, \
+    HTTPConnection, HTTPResponse, _UNKNOWN
 
 import logging
 
 from urllib import quote
+from oio.common.utils import monotonic_time
+
+# Maximum number of idle connections kept for each service
+# (the number of connections in use is not limited)
+CONNECTION_POOL_MAX_IDLE_PER_HOST = 16
+# Idle connections are closed after this delay (seconds).
+# Keep it below the keep-alive timeout of the rawx services.
+CONNECTION_POOL_MAX_IDLE_TIME = 4.0
+
+_original_select = patcher.original('select')
 
 
 class CustomHTTPResponse(HTTPResponse):
@@ -44,6 +55,15 @@ class CustomHTTPResponse(HTTPResponse):
     def read(self, amount=None):
         return HTTPResponse.read(self, amount)
 
+    @property
+    def reusable(self):
+        """
+        Tell if the response has been entirely read and the server
+        accepts to keep the connection open.
+        """
+        return (self.will_close is not _UNKNOWN and not self.will_close
+                and not self.chunked and self.length == 0)
+
     def force_close(self):
         if self._actual_socket:
             self._actual_socket.close()
@@ -52,7 +72,7 @@ class CustomHTTPResponse(HTTPResponse):
 
     def close(self):
         HTTPResponse.close(self)
-        if self.sock:
+        if self.sock and not self.reusable:
             try:
                 # Prevent long CLOSE_WAIT state
                 self.sock.shutdown(socket.SHUT_RDWR)
@@ -65,6 +85,12 @@ class CustomHTTPResponse(HTTPResponse):
 class CustomHttpConnection(HTTPConnection):
     response_class = CustomHTTPResponse
 
+    def __init__(self, *args, **kwargs):
+        HTTPConnection.__init__(self, *args, **kwargs)
+        self.pool = None
+        self.pool_key = None
+        self.response = None
+
     def connect(self):
         r = HTTPConnection.connect(self)
         self.sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
@@ -80,20 +106,129 @@ class CustomHttpConnection(HTTPConnection):
         response = HTTPConnection.getresponse(self)
         logging.debug('HTTP %s %s:%s %s',
                       self._method, self.host, self.port, self._path)
+        self.response = response
         return response
 
+    def release(self):
+        """
+        Give the connection back to its pool if the last response
+        has been entirely read, close it otherwise.
+        """
+        resp = self.response
+        self.response = None
+        if (self.pool is not None and self.sock is not None and
+                resp is not None and resp.reusable):
+            # Let httplib know the connection is ready for a new request
+            resp.close()
+            self.pool.put(self)
+        else:
+            self.close()
 
-def http_connect(host, method, path, headers=None, query_string=None):
-    if isinstance(path, unicode):
+
+class ConnectionPool(object):
+    """
+    Per-host pool of idle HTTP/1.1 keep-alive connections.
+
+    Connections are taken from the pool by `http_connect`, and put back
+    by `CustomHttpConnection.release` once their response has been read.
+    """
+
+    def __init__(self, max_idle_per_host=CONNECTION_POOL_MAX_IDLE_PER_HOST,
+                 max_idle_time=CONNECTION_POOL_MAX_IDLE_TIME):
+        """
+        :param max_idle_per_host: maximum number of idle connections
+            kept for each host (connections in use are not counted)
+        :param max_idle_time: close connections that have been idle
+            for more than this number of seconds
+        """
+        self.max_idle_per_host = max_idle_per_host
+        self.max_idle_time = max_idle_time
+        self.hits = 0
+        self.misses = 0
+        # host -> list of (connection, release time), most recent last
+        self._idle = dict()
+        self._last_sweep = monotonic_time()
+
+    @staticmethod
+    def _is_healthy(conn):
+        """
+        Check that an idle connection has not been closed by the server.
+        An idle socket must not be readable: if it is, the server
+        has closed the connection (or sent unexpected data).
+        poll() is used since select() does not accept file descriptors
+        above FD_SETSIZE.
+        """
+        if conn.sock is None:
+            return False
         try:
-            path = path.encode('utf-8')
-        except UnicodeError as e:
-            logging.exception('ERROR encoding to UTF-8: %s', str(e))
-    path = quote('/' + path)
-    conn = CustomHttpConnection(host)
-    if query_string:
-        path += '?' + query_string
-    conn.path = path
+            poller = _original_select.poll()
+            poller.register(conn.sock.fileno(),
+                            _original_select.POLLIN |
+                            _original_select.POLLERR |
+                            _original_select.POLLHUP)
+            events = poller.poll(0)
+        except Exception:
+            return False
+        return not events
+
+    def _evict(self, conns, now):
+        """Close connections that have been idle for too long."""
+        while conns and now - conns[0][1] > self.max_idle_time:
+            conns.pop(0)[0].close()
+
+    def _sweep(self, now):
+        """
+        Close the connections that have been idle for too long,
+        to all hosts, even those which are not used anymore.
+        """
+        self._last_sweep = now
+        for host, conns in self._idle.items():
+            self._evict(conns, now)
+            if not conns:
+                del self._idle[host]
+
+    def get(self, host):
+        """
+        Get an idle and healthy connection to `host`.
+
+        :returns: a `CustomHttpConnection`, or None if there is none
+        """
+        conns = self._idle.get(host)
+        if conns:
+            self._evict(conns, monotonic_time())
+            while conns:
+                conn, _ = conns.pop()
+                if self._is_healthy(conn):
+                    self.hits += 1
+                    return conn
+                conn.close()
+        self.misses += 1
+        return None
+
+    def put(self, conn):
+        """Keep `conn` for a later request to the same host."""
+        now = monotonic_time()
+        if now - self._last_sweep >= self.max_idle_time:
+            self._sweep(now)
+        conns = self._idle.setdefault(conn.pool_key, list())
+        self._evict(conns, now)
+        if len(conns) >= self.max_idle_per_host:
+            conn.close()
+        else:
+            conns.append((conn, now))
+
+    def clear(self):
+        """Close all idle connections."""
+        idle, self._idle = self._idle, dict()
+        for conns in idle.values():
+            for conn, _ in conns:
+                conn.close()
+
+
+CONNECTION_POOL = ConnectionPool()
+
+
+def _send_request(conn, method, path, headers):
     conn.putrequest(method, path)
     if headers:
         for header, value in headers.items():
@@ -103,4 +238,49 @@ def http_connect(host, method, path, headers=None, query_string=None):
             else:
                 conn.putheader(header, str(value))
     conn.endheaders()
+
+
+def http_connect(host, method, path, headers=None, query_string=None,
+                 pool=CONNECTION_POOL, perfdata=None):
+    """
+    Send a request line and headers to `host`, reusing an idle
+    connection from `pool` if there is one.
+
+    :param pool: the `ConnectionPool` to take the connection from,
+        or None to always open a new connection
+    :param perfdata: optional `dict` in which the number of connections
+        reused from the pool ('rawx_pool_hits') and opened
+        ('rawx_pool_misses') will be counted
+    :returns: a `CustomHttpConnection`, on which the caller must call
+        `release()` when the response has been read
+    """
+    if isinstance(path, unicode):
+        try:
+            path = path.encode('utf-8')
+        except UnicodeError as e:
+            logging.exception('ERROR encoding to UTF-8: %s', str(e))
+    path = quote('/' + path)
+    if query_string:
+        path += '?' + query_string
+
+    conn = pool.get(host) if pool is not None else None
+    if conn is not None:
+        try:
+            conn.path = path
+            _send_request(conn, method, path, headers)
+            if perfdata is not None:
+                perfdata['rawx_pool_hits'] = \
+                    perfdata.get('rawx_pool_hits', 0) + 1
+            return conn
+        except socket.error:
+            # The server closed the connection in the meantime
+            conn.close()
+
+    conn = CustomHttpConnection(host)
+    conn.pool = pool
+    conn.pool_key = host
+    conn.path = path
+    _send_request(conn, method, path, headers)
+    if perfdata is not None:
+        perfdata['rawx_pool_misses'] = perfdata.get('rawx_pool_misses', 0) + 1
     return conn
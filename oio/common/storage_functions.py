@@ -15,13 +15,18 @@
 
 
 import random
+from collections import deque
 
-from oio.api.io import ChunkReader, READ_CHUNK_SIZE
+from oio.api.io import ChunkReader, READ_CHUNK_SIZE, chunk_host
 from oio.api.ec import ECChunkDownloadHandler
 from oio.common import exceptions as exc
 from oio.common.constants import OBJECT_METADATA_PREFIX
 from oio.common.http import http_header_from_ranges
 from oio.common.decorators import ensure_headers
+from oio.common import green
+
+# Default maximum amount of data buffered by metachunk readahead
+READAHEAD_MAX_BYTES = 64 * 1024 * 1024
 
 
 def obj_range_to_meta_chunk_range(obj_start, obj_end, meta_sizes):
@@ -110,7 +115,7 @@ def wrand_choice_index(scores):
     assert False, "Shouldn't get here"
 
 
-def _sort_chunks(raw_chunks, ec_security):
+def _sort_chunks(raw_chunks, ec_security, latency=None):
     """
     Sort a list a chunk objects. In addition to the sort,
     this function adds an "offset" field to each chunk object.
@@ -119,6 +124,9 @@ def _sort_chunks(raw_chunks, ec_security):
     :param ec_security: tells the sort algorithm that chunk positions are
         composed (e.g. "0.4").
     :type ec_security: `bool`
+    :param latency: if set, replicated chunks hosted by the services
+        with the lowest mean response time come first
+    :type latency: `oio.api.io.LatencyTracker`
     :returns: a `dict` with metachunk positions as keys,
         and `list` of chunk objects as values.
     """
@@ -158,7 +166,10 @@ def _sort_chunks(raw_chunks, ec_security):
         clist.sort(key=lambda x: x.get("score", 0), reverse=True)
         for element in clist:
             element['offset'] = offset
-        if not ec_security and len(clist) > 1:
+        if not ec_security and len(clist) > 1 and latency is not None:
+            # Services never measured are ranked with the median
+            clist.sort(key=lambda x: latency.estimate(chunk_host(x)))
+        elif not ec_security and len(clist) > 1:
             # When scores are close together (e.g. [95, 94, 94, 93, 50]),
             # don't always start with the highest element.
             first = wrand_choice_index(x.get("score", 0) for x in clist)
@@ -188,52 +199,173 @@ def _make_object_metadata(headers):
     return meta
 
 
+class MetachunkPrefetcher(object):
+    """
+    Read the data of a metachunk in a coroutine, buffering up to
+    `max_bytes` until it is consumed.
+    """
+
+    def __init__(self, stream, max_bytes):
+        """
+        :param stream: a generator over the data of the metachunk
+        :param max_bytes: pause reading when this amount of data
+            has been buffered
+        """
+        self.max_bytes = max_bytes
+        self.buffered = 0
+        self._queue = green.Queue()
+        self._room = None
+        self._thread = green.greenthread.spawn(self._run, stream)
+
+    def _run(self, stream):
+        try:
+            for data in stream:
+                self._queue.put(data)
+                self.buffered += len(data)
+                while self.buffered >= self.max_bytes:
+                    self._room = green.Event()
+                    self._room.wait()
+            self._queue.put(None)
+        except (Exception, green.Timeout) as err:
+            self._queue.put(err)
+        finally:
+            stream.close()
+
+    def __iter__(self):
+        while True:
+            data = self._queue.get()
+            if data is None:
+                return
+            if isinstance(data, (Exception, green.Timeout)):
+                raise data
+            self.buffered -= len(data)
+            if self._room is not None and self.buffered < self.max_bytes:
+                room, self._room = self._room, None
+                room.send()
+            yield data
+
+    def close(self):
+        self._thread.kill()
+
+
+def _stream_with_readahead(streams, readahead=None, max_bytes=None):
+    """
+    Chain the data of metachunk streams. While a metachunk is being
+    consumed, start reading the `readahead` next ones, without buffering
+    more than `max_bytes` for all of them.
+
+    :param streams: an iterator over generators of metachunk data
+    """
+    readahead = int(readahead or 0)
+    max_bytes = int(max_bytes or READAHEAD_MAX_BYTES)
+    prefetchers = deque()
+    current = next(streams, None)
+    try:
+        while current is not None:
+            while len(prefetchers) < readahead:
+                stream = next(streams, None)
+                if stream is None:
+                    break
+                prefetchers.append(
+                    MetachunkPrefetcher(stream, max_bytes // readahead))
+            for data in current:
+                yield data
+            if prefetchers:
+                current = prefetchers.popleft()
+            else:
+                current = next(streams, None)
+    finally:
+        if current is not None:
+            current.close()
+        for prefetcher in prefetchers:
+            prefetcher.close()
+
+
+def _fetch_metachunk(chunks, pos, headers, **kwargs):
+    reader = ChunkReader(
+        iter(chunks), READ_CHUNK_SIZE, headers=headers, **kwargs)
+    try:
+        it = reader.get_iter()
+    except exc.NotFound as err:
+        raise exc.UnrecoverableContent(
+            "Cannot download position %d: %s" %
+            (pos, err))
+    except Exception as err:
+        raise exc.ServiceUnavailable(
+            "Error while downloading position %d: %s" %
+            (pos, err))
+    for part in it:
+        for dat in part['iter']:
+            yield dat
+
+
 @ensure_headers
 def fetch_stream(chunks, ranges, storage_method, headers=None,
+                 metachunk_readahead=None, readahead_max_bytes=None,
                  **kwargs):
+    """
+    Download the data of a replicated object.
+
+    :param metachunk_readahead: number of metachunks to start downloading
+        while the current one is being consumed (disabled if not set)
+    :param readahead_max_bytes: maximum amount of data buffered
+        for the metachunks being read in advance
+    """
     ranges = ranges or [(None, None)]
     meta_range_list = get_meta_ranges(ranges, chunks)
 
-    for meta_range_dict in meta_range_list:
-        for pos in sorted(meta_range_dict.keys()):
-            meta_start, meta_end = meta_range_dict[pos]
-            if meta_start is not None and meta_end is not None:
-                headers['Range'] = http_header_from_ranges(
-                    (meta_range_dict[pos], ))
-            reader = ChunkReader(
-                iter(chunks[pos]), READ_CHUNK_SIZE, headers=headers,
-                **kwargs)
-            try:
-                it = reader.get_iter()
-            except exc.NotFound as err:
-                raise exc.UnrecoverableContent(
-                    "Cannot download position %d: %s" %
-                    (pos, err))
-            except Exception as err:
-                raise exc.ServiceUnavailable(
-                    "Error while downloading position %d: %s" %
-                    (pos, err))
-            for part in it:
-                for dat in part['iter']:
-                    yield dat
+    def _streams():
+        for meta_range_dict in meta_range_list:
+            for pos in sorted(meta_range_dict.keys()):
+                meta_start, meta_end = meta_range_dict[pos]
+                # each reader updates its own copy of the headers
+                reader_headers = headers.copy()
+                if meta_start is not None and meta_end is not None:
+                    reader_headers['Range'] = http_header_from_ranges(
+                        (meta_range_dict[pos], ))
+                yield _fetch_metachunk(chunks[pos], pos, reader_headers,
+                                       **kwargs)
+
+    return _stream_with_readahead(_streams(), metachunk_readahead,
+                                  readahead_max_bytes)
+
+
+def _fetch_metachunk_ec(storage_method, chunks, meta_start, meta_end,
+                        **kwargs):
+    handler = ECChunkDownloadHandler(
+        storage_method, chunks, meta_start, meta_end, **kwargs)
+    stream = handler.get_stream()
+    try:
+        for part_info in stream:
+            for dat in part_info['iter']:
+                yield dat
+    finally:
+        # This must be done in a finally block to handle the case
+        # when the reader does not read until the end of the stream.
+        stream.close()
 
 
 @ensure_headers
-def fetch_stream_ec(chunks, ranges, storage_method, **kwargs):
+def fetch_stream_ec(chunks, ranges, storage_method,
+                    metachunk_readahead=None, readahead_max_bytes=None,
+                    **kwargs):
+    """
+    Download the data of an EC object.
+
+    :param metachunk_readahead: number of metachunks to start downloading
+        while the current one is being consumed (disabled if not set)
+    :param readahead_max_bytes: maximum amount of data buffered
+        for the metachunks being read in advance
+    """
     ranges = ranges or [(None, None)]
     meta_range_list = get_meta_ranges(ranges, chunks)
-    for meta_range_dict in meta_range_list:
-        for pos in sorted(meta_range_dict.keys()):
-            meta_start, meta_end = meta_range_dict[pos]
-            handler = ECChunkDownloadHandler(
-                storage_method, chunks[pos],
-                meta_start, meta_end, **kwargs)
-            stream = handler.get_stream()
-            try:
-                for part_info in stream:
-                    for dat in part_info['iter']:
-                        yield dat
-            finally:
-                # This must be done in a finally block to handle the case
-                # when the reader does not read until the end of the stream.
-                stream.close()
+
+    def _streams():
+        for meta_range_dict in meta_range_list:
+            for pos in sorted(meta_range_dict.keys()):
+                meta_start, meta_end = meta_range_dict[pos]
+                yield _fetch_metachunk_ec(storage_method, chunks[pos],
+                                          meta_start, meta_end, **kwargs)
+
+    return _stream_with_readahead(_streams(), metachunk_readahead,
+                                  readahead_max_bytes)
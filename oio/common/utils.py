@@ -80,10 +80,16 @@ def drop_privileges(user):
     os.umask(0o22)
 
 
-def paths_gen(volume_path):
-    for root, dirs, files in os.walk(volume_path):
-        for name in files:
-            yield os.path.join(root, name)
+def paths_gen(volume_path, conf=None, logger=None):
+    """
+    Yield the paths of all files of a volume.
+
+    :param conf: daemon configuration, from which the `scan_*` parameters
+        of `oio.common.volume_scanner.VolumeScanner` are read
+    """
+    from oio.common.volume_scanner import VolumeScanner
+    return iter(VolumeScanner.from_conf(volume_path, conf or {},
+                                        logger=logger))
 
 
 def statfs(volume):
@@ -332,6 +338,39 @@ def monotonic_time():
     return __MONOTONIC_TIME()
 
 
+POSIX_FADV_SEQUENTIAL = 2
+POSIX_FADV_WILLNEED = 3
+POSIX_FADV_DONTNEED = 4
+
+__POSIX_FADVISE = None
+
+
+def posix_fadvise(fd, offset, length, advice):
+    """
+    Announce an intention to access file data in a specific pattern.
+    This is only a hint: it silently does nothing if the platform
+    does not support it.
+    """
+    global __POSIX_FADVISE
+    if __POSIX_FADVISE is None:
+        __POSIX_FADVISE = getattr(os, 'posix_fadvise', None)
+        if __POSIX_FADVISE is None:
+            from ctypes import CDLL, c_int, c_int64
+            try:
+                libc_fadvise = CDLL(None).posix_fadvise
+                libc_fadvise.argtypes = [c_int, c_int64, c_int64, c_int]
+                libc_fadvise.restype = c_int
+                __POSIX_FADVISE = libc_fadvise
+            except (OSError, AttributeError):
+                def _no_fadvise(*_args):
+                    pass
+                __POSIX_FADVISE = _no_fadvise
+    try:
+        __POSIX_FADVISE(fd, offset, length, advice)
+    except OSError:
+        pass
+
+
 def deadline_to_timeout(deadline, check=False):
     """Convert a deadline (`float` seconds) to a timeout (`float` seconds)"""
     dl_to = deadline - monotonic_time()
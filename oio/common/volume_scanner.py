@@ -0,0 +1,247 @@
+# Copyright (C) 2018 OpenIO SAS, as part of OpenIO SDS
+#
+# This library is free software; you can redistribute it and/or
+# modify it under the terms of the GNU Lesser General Public
+# License as published by the Free Software Foundation; either
+# version 3.0 of the License, or (at your option) any later version.
+#
+# This library is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# Lesser General Public License for more details.
+#
+# You should have received a copy of the GNU Lesser General Public
+# License along with this library.
+
+import os
+import stat
+import time
+
+from oio.common.easy_value import int_value, float_value, true_value
+from oio.common.green import GreenPool, Queue, tpool
+from oio.common.json import json
+
+try:
+    from os import scandir
+except ImportError:
+    try:
+        from scandir import scandir
+    except ImportError:
+        scandir = None
+
+
+SCAN_WORKERS = 4
+SCAN_QUEUE_SIZE = 1024
+SCAN_CHECKPOINT_INTERVAL = 30.0
+
+
+def list_dir(path, inode_order=False):
+    """
+    List the entries of a directory, without descending into it.
+
+    When scandir is available, the type of each entry comes from the
+    directory itself (d_type) and no stat() call is issued.
+
+    :param inode_order: sort the entries by inode number instead of
+        keeping the order of the directory
+    :returns: a tuple with the list of subdirectory paths and the list
+        of file paths. An unreadable directory is reported as empty,
+        like `os.walk` does.
+    """
+    entries = list()
+    try:
+        if scandir is not None:
+            for entry in scandir(path):
+                is_dir = entry.is_dir()
+                if is_dir and entry.is_symlink():
+                    # Like os.walk, do not follow links to directories
+                    continue
+                entries.append((entry.inode(), entry.path, is_dir))
+        else:
+            for name in os.listdir(path):
+                full_path = os.path.join(path, name)
+                try:
+                    st = os.stat(full_path)
+                except OSError:
+                    continue
+                is_dir = stat.S_ISDIR(st.st_mode)
+                if is_dir and os.path.islink(full_path):
+                    continue
+                entries.append((st.st_ino, full_path, is_dir))
+    except OSError:
+        return [], []
+    if inode_order:
+        entries.sort()
+    dirs = [entry[1] for entry in entries if entry[2]]
+    files = [entry[1] for entry in entries if not entry[2]]
+    return dirs, files
+
+
+class VolumeScanner(object):
+    """
+    Iterate over the paths of all files of a volume.
+
+    The top-level directories of the volume (the first level of the hashed
+    tree) are shared between `workers` green threads, each of them listing
+    directories in the native thread pool so the disk sees several
+    requests at once. File paths are yielded as soon as they are listed,
+    in no particular order.
+
+    If `checkpoint_file` is set, the scanner regularly saves the first
+    top-level directory which has not been fully consumed yet. A new
+    scanner on the same volume then skips everything before it, so a
+    restarted daemon does not begin its pass from scratch. The checkpoint
+    is removed at the end of a complete pass.
+    """
+
+    def __init__(self, volume_path, workers=SCAN_WORKERS, inode_order=False,
+                 checkpoint_file=None,
+                 checkpoint_interval=SCAN_CHECKPOINT_INTERVAL,
+                 queue_size=SCAN_QUEUE_SIZE, logger=None):
+        self.volume = volume_path
+        self.workers = max(workers, 1)
+        self.inode_order = inode_order
+        self.checkpoint_file = checkpoint_file
+        self.checkpoint_interval = checkpoint_interval
+        self.queue_size = queue_size
+        self.logger = logger
+        self.resumed_from = None
+
+    @classmethod
+    def from_conf(cls, volume_path, conf, logger=None):
+        """
+        Build a scanner from the `scan_workers`, `scan_inode_order`,
+        `scan_checkpoint_file` and `scan_checkpoint_interval` parameters
+        of a daemon configuration.
+        """
+        return cls(
+            volume_path,
+            workers=int_value(conf.get('scan_workers'), SCAN_WORKERS),
+            inode_order=true_value(conf.get('scan_inode_order', False)),
+            checkpoint_file=conf.get('scan_checkpoint_file') or None,
+            checkpoint_interval=float_value(
+                conf.get('scan_checkpoint_interval'),
+                SCAN_CHECKPOINT_INTERVAL),
+            logger=logger)
+
+    def _read_checkpoints(self):
+        try:
+            with open(self.checkpoint_file) as cp_file:
+                checkpoints = json.load(cp_file)
+        except (IOError, OSError, ValueError):
+            return dict()
+        if not isinstance(checkpoints, dict):
+            return dict()
+        return checkpoints
+
+    def _write_checkpoints(self, checkpoints):
+        tmp_file = self.checkpoint_file + '.tmp'
+        try:
+            if not checkpoints:
+                os.unlink(self.checkpoint_file)
+                return
+            with open(tmp_file, 'w') as cp_file:
+                json.dump(checkpoints, cp_file)
+            os.rename(tmp_file, self.checkpoint_file)
+        except (IOError, OSError) as exc:
+            if self.logger and checkpoints:
+                self.logger.warn('Failed to save scan checkpoint %s: %s',
+                                 self.checkpoint_file, exc)
+
+    def load_checkpoint(self):
+        """
+        :returns: the name of the top-level directory to resume from,
+            or None if there is no usable checkpoint.
+        """
+        if not self.checkpoint_file:
+            return None
+        checkpoint = self._read_checkpoints().get(self.volume)
+        if not isinstance(checkpoint, dict):
+            return None
+        return checkpoint.get('next')
+
+    def save_checkpoint(self, next_dir):
+        """
+        Save the name of the next directory to scan.
+
+        A checkpoint file holds one entry per volume, so several scanners
+        of the same daemon can share it.
+        """
+        checkpoints = self._read_checkpoints()
+        checkpoints[self.volume] = {'next': next_dir, 'mtime': time.time()}
+        self._write_checkpoints(checkpoints)
+
+    def clear_checkpoint(self):
+        checkpoints = self._read_checkpoints()
+        if checkpoints.pop(self.volume, None) is not None:
+            self._write_checkpoints(checkpoints)
+
+    def _list(self, path):
+        return tpool.execute(list_dir, path, self.inode_order)
+
+    def _walk(self, top, index, queue):
+        stack = [top]
+        while stack:
+            dirs, files = self._list(stack.pop())
+            for path in files:
+                queue.put((index, path))
+            stack.extend(reversed(dirs))
+
+    def __iter__(self):
+        tops, root_files = self._list(self.volume)
+        tops.sort()
+        resume_from = self.load_checkpoint()
+        if resume_from is not None:
+            self.resumed_from = resume_from
+            if self.logger:
+                self.logger.info('Resuming scan of %s from %s',
+                                 self.volume, resume_from)
+            tops = [top for top in tops
+                    if os.path.basename(top) >= resume_from]
+        else:
+            for path in root_files:
+                yield path
+
+        queue = Queue(self.queue_size)
+        todo = enumerate(tops)
+
+        def _worker():
+            for index, top in todo:
+                try:
+                    self._walk(top, index, queue)
+                except Exception:
+                    if self.logger:
+                        self.logger.exception('Failed to scan %s', top)
+                finally:
+                    queue.put((index, None))
+
+        pool = GreenPool(self.workers)
+        threads = [pool.spawn(_worker)
+                   for _ in range(min(self.workers, len(tops)))]
+        done = set()
+        next_index = 0
+        last_save = time.time()
+        try:
+            remaining = len(tops)
+            while remaining:
+                index, path = queue.get()
+                if path is not None:
+                    yield path
+                    continue
+                # All the files of this directory have been consumed
+                remaining -= 1
+                done.add(index)
+                while next_index in done:
+                    done.discard(next_index)
+                    next_index += 1
+                now = time.time()
+                if (self.checkpoint_file and remaining and
+                        now - last_save >= self.checkpoint_interval):
+                    self.save_checkpoint(
+                        os.path.basename(tops[next_index]))
+                    last_save = now
+            if self.checkpoint_file:
+                self.clear_checkpoint()
+        finally:
+            for thread in threads:
+                thread.kill()
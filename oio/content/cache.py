@@ -0,0 +1,177 @@
+# Copyright (C) 2018 OpenIO SAS, as part of OpenIO SDS
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as
+# published by the Free Software Foundation, either version 3 of the
+# License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+from collections import OrderedDict
+from time import time
+
+from oio.common.easy_value import int_value, float_value
+from oio.common.exceptions import NotFound
+from oio.common.green import Event
+
+
+LOCATE_CACHE_SIZE = 1024
+LOCATE_CACHE_TTL = 60.0  # in seconds
+
+
+class LocateCache(object):
+    """
+    LRU cache of content locations (metadata and list of chunks),
+    keyed by container ID and content ID. Entries expire after `ttl`
+    seconds. "Content not found" replies are cached as well.
+
+    Concurrent lookups of the same content share a single request,
+    which is useful when several chunks of a content (e.g. EC fragments)
+    are processed at the same time.
+
+    Returned structures are copies: callers can modify them freely.
+    Callers modifying a content must call `invalidate()` (or `put()`
+    with the new description).
+    """
+
+    def __init__(self, container_client, size=LOCATE_CACHE_SIZE,
+                 ttl=LOCATE_CACHE_TTL, properties=False):
+        self.container_client = container_client
+        self.max_size = size
+        self.ttl = ttl
+        self.properties = properties
+        self._cache = OrderedDict()
+        self._inflight = dict()
+        self.chunks = 0
+        self.hits = 0
+        self.misses = 0
+        self.expired = 0
+        self.evicted = 0
+
+    @classmethod
+    def from_conf(cls, conf, container_client, **kwargs):
+        """
+        Build a cache from the `locate_cache_size` and `locate_cache_ttl`
+        parameters of a daemon configuration.
+        """
+        return cls(
+            container_client,
+            size=int_value(conf.get('locate_cache_size'), LOCATE_CACHE_SIZE),
+            ttl=float_value(conf.get('locate_cache_ttl'), LOCATE_CACHE_TTL),
+            **kwargs)
+
+    def __len__(self):
+        return len(self._cache)
+
+    @staticmethod
+    def _copy(meta, chunks):
+        return dict(meta), [dict(chunk) for chunk in chunks]
+
+    def _pop(self, key):
+        entry = self._cache.pop(key, None)
+        if entry is not None:
+            self.chunks -= len(entry[2] or ())
+        return entry
+
+    def get(self, container_id, content_id):
+        """
+        :returns: a tuple with the metadata and the chunks of the content,
+            or None if the content is not in the cache.
+        :raises NotFound: if the content was not found by the last request
+        """
+        key = (container_id, content_id)
+        entry = self._pop(key)
+        if entry is None:
+            return None
+        expire, meta, chunks, error = entry
+        if expire < time():
+            self.expired += 1
+            return None
+        # Move the entry to the end of the LRU
+        self._cache[key] = entry
+        self.chunks += len(chunks or ())
+        if error is not None:
+            raise error
+        return self._copy(meta, chunks)
+
+    def put(self, container_id, content_id, meta, chunks, error=None):
+        """Save the description of a content (or the error to raise)."""
+        if self.max_size <= 0:
+            return
+        key = (container_id, content_id)
+        self._pop(key)
+        if error is None:
+            meta, chunks = self._copy(meta, chunks)
+        self._cache[key] = (time() + self.ttl, meta, chunks, error)
+        self.chunks += len(chunks or ())
+        while len(self._cache) > self.max_size:
+            _, entry = self._cache.popitem(last=False)
+            self.chunks -= len(entry[2] or ())
+            self.evicted += 1
+
+    def invalidate(self, container_id, content_id):
+        self._pop((container_id, content_id))
+
+    def clear(self):
+        self._cache.clear()
+        self.chunks = 0
+
+    def content_locate(self, container_id, content_id, **kwargs):
+        """
+        Same as `ContainerClient.content_locate`, but look in the cache
+        first.
+
+        :returns: a tuple with content metadata `dict` as first element
+            and chunk `list` as second element
+        """
+        key = (container_id, content_id)
+        cached = self.get(container_id, content_id)
+        if cached is not None:
+            self.hits += 1
+            return cached
+        inflight = self._inflight.get(key)
+        if inflight is not None:
+            # Another green thread is already asking
+            self.hits += 1
+            meta, chunks = inflight.wait()
+            return self._copy(meta, chunks)
+
+        self.misses += 1
+        inflight = self._inflight[key] = Event()
+        try:
+            meta, chunks = self.container_client.content_locate(
+                cid=container_id, content=content_id,
+                properties=self.properties, **kwargs)
+        except NotFound as err:
+            self.put(container_id, content_id, None, None, error=err)
+            inflight.send_exception(err)
+            raise
+        except Exception as err:
+            inflight.send_exception(err)
+            raise
+        finally:
+            del self._inflight[key]
+        self.put(container_id, content_id, meta, chunks)
+        inflight.send((meta, chunks))
+        return self._copy(meta, chunks)
+
+    def stats(self):
+        """
+        :returns: a `dict` with the number of cached contents and chunks,
+            and the number of hits, misses, expired and evicted entries.
+        """
+        lookups = self.hits + self.misses
+        return {'size': len(self._cache),
+                'max_size': self.max_size,
+                'chunks': self.chunks,
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_rate': self.hits / float(lookups or 1),
+                'expired': self.expired,
+                'evicted': self.evicted}
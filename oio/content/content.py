@@ -153,6 +153,25 @@ class Content(object):
     def rebuild_chunk(self, chunk_id, allow_same_rawx=False, chunk_pos=None):
         raise NotImplementedError()
 
+    def rebuild_chunks(self, chunks, allow_same_rawx=False):
+        """
+        Rebuild several chunks of the content.
+
+        :param chunks: `list` of (chunk_id, chunk_pos) tuples
+            (see `rebuild_chunk`)
+        :returns: a `list` with the exception raised while rebuilding
+            each chunk (None on success), in the same order as `chunks`
+        """
+        errors = list()
+        for chunk_id, chunk_pos in chunks:
+            try:
+                self.rebuild_chunk(chunk_id, allow_same_rawx=allow_same_rawx,
+                                   chunk_pos=chunk_pos)
+                errors.append(None)
+            except Exception as err:
+                errors.append(err)
+        return errors
+
     def create(self, stream, **kwargs):
         raise NotImplementedError()
 
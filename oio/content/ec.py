@@ -13,16 +13,64 @@
 # You should have received a copy of the GNU Lesser General Public
 # License along with this library.
 
+from oio.common.green import GreenPile, Queue
+
+from oio.common import exceptions as exc
 from oio.common.exceptions import OrphanChunk
 from oio.content.content import Content, Chunk
-from oio.api.ec import ECWriteHandler, ECRebuildHandler
+from oio.api.ec import ECWriteHandler, ECRebuildHandler, get_coding_pool
+from oio.api.io import PUT_QUEUE_DEPTH
 from oio.common.storage_functions import _sort_chunks, fetch_stream_ec
-from oio.common.utils import GeneratorIO
 from oio.common.constants import OIO_VERSION
 
 
+class FragmentPipe(object):
+    """
+    Bounded pipe between the loop rebuilding the fragments of a metachunk
+    and the upload of one of the rebuilt chunks.
+    """
+
+    def __init__(self, depth=PUT_QUEUE_DEPTH):
+        self.queue = Queue(depth)
+        self.closed = False
+
+    def put(self, data):
+        """
+        Send a data block, None to end the stream, or an exception
+        to abort the upload.
+        """
+        if not self.closed:
+            self.queue.put(data)
+
+    def close(self):
+        """Stop receiving data, because the upload has failed."""
+        self.closed = True
+        # Unblock the producer if it is waiting for some room
+        while not self.queue.empty():
+            self.queue.get_nowait()
+
+    def __iter__(self):
+        while True:
+            data = self.queue.get()
+            if data is None:
+                return
+            if isinstance(data, Exception):
+                raise data
+            yield data
+
+
 class ECContent(Content):
     def rebuild_chunk(self, chunk_id, allow_same_rawx=False, chunk_pos=None):
+        error = self.rebuild_chunks([(chunk_id, chunk_pos)],
+                                    allow_same_rawx=allow_same_rawx)[0]
+        if error is not None:
+            raise error
+
+    def _get_broken_chunk(self, chunk_id, chunk_pos):
+        """
+        :returns: the ID of the chunk to rebuild (None if it is not
+            referenced anymore), and the `Chunk` object describing it
+        """
         current_chunk = self.chunks.filter(id=chunk_id).one()
 
         if current_chunk is None and chunk_pos is None:
@@ -36,25 +84,87 @@ class ECContent(Content):
                 chunk_id = current_chunk.id
                 self.logger.debug('Chunk at pos %s has id %s',
                                   chunk_pos, chunk_id)
-
-        chunks = self.chunks.filter(metapos=current_chunk.metapos)\
-            .exclude(id=chunk_id, pos=chunk_pos)
-
-        if chunk_id is None:
-            current_chunk.size = chunks[0].size
-            current_chunk.checksum = chunks[0].checksum
+        return chunk_id, current_chunk
+
+    def rebuild_chunks(self, chunks, allow_same_rawx=False):
+        """
+        Rebuild several chunks of the content. The missing fragments
+        of a metachunk are all rebuilt from a single read of the
+        remaining fragments, and uploaded to spare rawx in parallel.
+
+        :param chunks: `list` of (chunk_id, chunk_pos) tuples
+        :returns: a `list` with the exception raised while rebuilding
+            each chunk (None on success), in the same order as `chunks`
+        """
+        errors = [None] * len(chunks)
+        by_metapos = dict()
+        for i, (chunk_id, chunk_pos) in enumerate(chunks):
+            try:
+                chunk_id, current_chunk = self._get_broken_chunk(
+                    chunk_id, chunk_pos)
+            except Exception as err:
+                errors[i] = err
+                continue
+            by_metapos.setdefault(current_chunk.metapos, list()).append(
+                (i, chunk_id, chunk_pos, current_chunk))
+
+        for metapos, broken in sorted(by_metapos.items()):
+            try:
+                results = self._rebuild_metachunk(
+                    metapos, broken, allow_same_rawx=allow_same_rawx)
+            except Exception as err:
+                results = [err] * len(broken)
+            for (i, _, _, _), err in zip(broken, results):
+                errors[i] = err
+        return errors
+
+    def _rebuild_metachunk(self, metapos, broken, allow_same_rawx=False):
+        chunks = self.chunks.filter(metapos=metapos)
+        for _, chunk_id, chunk_pos, _ in broken:
+            chunks = chunks.exclude(id=chunk_id, pos=chunk_pos)
 
         broken_list = list()
-        if not allow_same_rawx and chunk_id is not None:
-            broken_list.append(current_chunk)
-        spare_url = self._get_spare_chunk(chunks.all(), broken_list)
+        for _, chunk_id, _, current_chunk in broken:
+            if chunk_id is None:
+                current_chunk.size = chunks[0].size
+                current_chunk.checksum = chunks[0].checksum
+            elif not allow_same_rawx:
+                broken_list.append(current_chunk)
+        spare_urls = self._get_spare_chunk(chunks.all(), broken_list)
+        if len(spare_urls) < len(broken):
+            raise exc.SpareChunkException(
+                "Not enough spare chunks (%d/%d)" %
+                (len(spare_urls), len(broken)))
 
         handler = ECRebuildHandler(
-            chunks.raw(), current_chunk.subpos, self.storage_method)
-
-        new_chunk = Chunk({'pos': current_chunk.pos, 'url': spare_url[0]})
+            chunks.raw(), [current_chunk.subpos
+                           for _, _, _, current_chunk in broken],
+            self.storage_method,
+            coding_pool=get_coding_pool(self.conf.get('ec_coding_threads')))
         stream = handler.rebuild()
 
+        pipes = [FragmentPipe() for _ in broken]
+        pile = GreenPile(len(broken))
+        for (_, chunk_id, chunk_pos, current_chunk), spare_url, pipe in \
+                zip(broken, spare_urls, pipes):
+            pile.spawn(self._upload_rebuilt_chunk, chunk_id, chunk_pos,
+                       current_chunk, spare_url, pipe)
+        try:
+            for fragments in stream:
+                for pipe, fragment in zip(pipes, fragments):
+                    pipe.put(fragment)
+        except Exception as err:
+            for pipe in pipes:
+                pipe.put(err)
+        else:
+            for pipe in pipes:
+                pipe.put(None)
+        return list(pile)
+
+    def _upload_rebuilt_chunk(self, chunk_id, chunk_pos, current_chunk,
+                              spare_url, source):
+        new_chunk = Chunk({'pos': current_chunk.pos, 'url': spare_url})
+
         meta = {}
         meta['chunk_id'] = new_chunk.id
         meta['chunk_pos'] = current_chunk.pos
@@ -82,13 +192,21 @@ class ECContent(Content):
         meta['metachunk_size'] = current_chunk.size
         meta['full_path'] = self.full_path
         meta['oio_version'] = OIO_VERSION
-        self.blob_client.chunk_put(spare_url[0], meta, GeneratorIO(stream))
-        if chunk_id is None:
-            self._add_raw_chunk(current_chunk, spare_url[0])
-        else:
-            self._update_spare_chunk(current_chunk, spare_url[0])
+        try:
+            self.blob_client.chunk_put(spare_url, meta, source,
+                                       size=current_chunk.size)
+            if chunk_id is None:
+                self._add_raw_chunk(current_chunk, spare_url)
+            else:
+                self._update_spare_chunk(current_chunk, spare_url)
+        except Exception as err:
+            source.close()
+            self.logger.warn('Failed to rebuild chunk %s in %s: %s',
+                             chunk_id or chunk_pos, spare_url, err)
+            return err
         self.logger.info('Chunk %s repaired in %s',
-                         chunk_id or chunk_pos, spare_url[0])
+                         chunk_id or chunk_pos, spare_url)
+        return None
 
     def fetch(self):
         chunks = _sort_chunks(self.chunks.raw(), self.storage_method.ec)
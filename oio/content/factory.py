@@ -26,12 +26,18 @@ from oio.common.storage_method import STORAGE_METHODS
 class ContentFactory(object):
     DEFAULT_DATASEC = "plain", {"nb_copy": "1", "distance": "0"}
 
-    def __init__(self, conf, container_client=None, logger=None, **kwargs):
+    def __init__(self, conf, container_client=None, logger=None,
+                 locate_cache=None, **kwargs):
+        """
+        :param locate_cache: an optional cache of content locations
+        :type locate_cache: `oio.content.cache.LocateCache`
+        """
         self.conf = conf
         self.logger = logger or get_logger(conf)
         self.container_client = container_client or \
             ContainerClient(conf, logger=self.logger, **kwargs)
         self.blob_client = BlobClient(conf, **kwargs)
+        self.locate_cache = locate_cache
 
     def _get(self, container_id, meta, chunks,
              account=None, container_name=None):
@@ -54,8 +60,12 @@ class ContentFactory(object):
     def get(self, container_id, content_id, account=None,
             container_name=None):
         try:
-            meta, chunks = self.container_client.content_locate(
-                cid=container_id, content=content_id)
+            if self.locate_cache is not None:
+                meta, chunks = self.locate_cache.content_locate(
+                    container_id, content_id)
+            else:
+                meta, chunks = self.container_client.content_locate(
+                    cid=container_id, content=content_id)
         except NotFound:
             raise ContentNotFound("Content %s/%s not found" % (container_id,
                                   content_id))
@@ -54,6 +54,7 @@ class Meta2IndexingWorker(object):
         :param pool_manager: A connection pool manager. If none is given, a
                 new one with a default size of 10 will be created.
         """
+        self.conf = conf
         self.logger = get_logger(conf)
         self._stop = False
         self.volume = volume_path
@@ -182,7 +183,7 @@ class Meta2IndexingWorker(object):
         """
         Crawl the volume assigned to this worker, and index every database.
         """
-        paths = paths_gen(self.volume)
+        paths = paths_gen(self.volume, conf=self.conf, logger=self.logger)
         self.full_scan_nb += 1
         self.success_nb = 0
         self.failed_nb = 0
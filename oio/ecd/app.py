@@ -21,7 +21,8 @@ from werkzeug.routing import Map, Rule
 from werkzeug.wrappers import Response
 
 from oio.common.storage_method import STORAGE_METHODS
-from oio.api.ec import EcMetachunkWriter, ECChunkDownloadHandler
+from oio.api.ec import EcMetachunkWriter, ECChunkDownloadHandler, \
+    get_coding_pool
 from oio.api.replication import ReplicatedMetachunkWriter
 from oio.api.backblaze import BackblazeChunkWriteHandler, \
     BackblazeChunkDownloadHandler
@@ -122,8 +123,9 @@ class ECD(WerkzeugApp):
     def write_ec_meta_chunk(self, source, size, storage_method, sysmeta,
                             meta_chunk):
         meta_checksum = md5()
-        handler = EcMetachunkWriter(sysmeta, meta_chunk, meta_checksum,
-                                    storage_method)
+        handler = EcMetachunkWriter(
+            sysmeta, meta_chunk, meta_checksum, storage_method,
+            coding_pool=get_coding_pool(self.conf.get('ec_coding_threads')))
         bytes_transferred, checksum, chunks = handler.stream(source, size)
         return Response("OK")
 
@@ -157,8 +159,9 @@ class ECD(WerkzeugApp):
     def read_ec_meta_chunk(self, storage_method, meta_chunk,
                            meta_start=None, meta_end=None):
         headers = {}
-        handler = ECChunkDownloadHandler(storage_method, meta_chunk,
-                                         meta_start, meta_end, headers)
+        handler = ECChunkDownloadHandler(
+            storage_method, meta_chunk, meta_start, meta_end, headers,
+            ec_coding_threads=self.conf.get('ec_coding_threads'))
         stream = handler.get_stream()
         return Response(part_iter_to_bytes_iter(stream), 200)
 
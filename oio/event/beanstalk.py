@@ -312,6 +312,19 @@ class Connection(object):
 
     def send_command(self, command, *args, **kwargs):
         command = self.pack_command(command, kwargs.get('body'), *args)
+        self.send_packed_command(command)
+
+    def send_commands(self, commands):
+        """
+        Send several commands (without body) at once.
+
+        :param commands: list of tuples (command name, arg1, arg2...)
+        """
+        self.send_packed_command(
+            ''.join(self.pack_command(cmd[0], None, *cmd[1:])
+                    for cmd in commands))
+
+    def send_packed_command(self, command):
         if not self._sock:
             self.connect()
         try:
@@ -487,6 +500,34 @@ class Beanstalk(object):
         finally:
             self._release_connection(connection)
 
+    def execute_many(self, commands):
+        """
+        Send several commands in one go, then read all their responses,
+        saving a round-trip per command.
+
+        :param commands: list of tuples (command name, arg1, arg2...)
+        :returns: a list with the result of each command,
+            or the `ResponseError` it raised
+        """
+        if not commands:
+            return []
+        connection = self._get_connection()
+        try:
+            connection.send_commands(commands)
+            results = list()
+            for command in commands:
+                try:
+                    results.append(
+                        self.parse_response(connection, command[0]))
+                except ResponseError as exc:
+                    results.append(exc)
+            return results
+        except (ConnectionError, TimeoutError, InvalidResponse):
+            connection.disconnect()
+            raise
+        finally:
+            self._release_connection(connection)
+
     def parse_response(self, connection, command_name, **kwargs):
         response = connection.read_response()
         status, results = response
@@ -519,6 +560,27 @@ class Beanstalk(object):
         else:
             return self.execute_command('reserve')
 
+    def reserve_many(self, count, timeout=None):
+        """
+        Reserve up to `count` jobs. Only the first reservation waits
+        (at most `timeout` seconds, or forever if None), the following
+        ones, sent in the same batch, only take jobs that are ready.
+
+        :returns: a list of (job_id, data) tuples, possibly empty
+        """
+        if timeout is not None:
+            commands = [('reserve-with-timeout', timeout)]
+        else:
+            commands = [('reserve', )]
+        commands.extend([('reserve-with-timeout', 0)] * (count - 1))
+        jobs = list()
+        for result in self.execute_many(commands):
+            if isinstance(result, ResponseError):
+                # TIMED_OUT or DEADLINE_SOON
+                continue
+            jobs.append(result)
+        return jobs
+
     def bury(self, job_id, priority=DEFAULT_PRIORITY):
         self.execute_command('bury', job_id, priority)
 
@@ -14,7 +14,8 @@
 # along with this program.  If not, see <http://www.gnu.org/licenses/>.
 
 
-from oio.common.green import eventlet, Timeout, greenthread
+from oio.common.green import eventlet, Timeout, greenthread, GreenPool, \
+    Queue, Empty
 
 import time
 import signal
@@ -24,7 +25,8 @@ import greenlet
 
 from oio.conscience.client import ConscienceClient
 from oio.rdir.client import RdirClient
-from oio.event.beanstalk import Beanstalk, ConnectionError
+from oio.event.beanstalk import Beanstalk, ConnectionError, ResponseError, \
+    DEFAULT_PRIORITY
 from oio.common.utils import drop_privileges
 from oio.common.easy_value import int_value
 from oio.common.json import json
@@ -42,6 +44,9 @@ DEFAULT_TUBE = 'oio'
 BEANSTALK_RECONNECTION = 2.0
 # default release delay (in seconds)
 RELEASE_DELAY = 15
+# In batched mode, how long to wait for running handlers
+# before trying to reserve more jobs (in seconds)
+BATCH_POLL_INTERVAL = 0.1
 
 
 def _eventlet_stop(client, server, beanstalk):
@@ -60,6 +65,46 @@ class StopServe(Exception):
     pass
 
 
+class AckBuffer(object):
+    """
+    Collect the acknowledgements (delete, bury, release) of jobs,
+    to send them in batches on the connection the jobs were reserved on.
+    Has the same acknowledgement methods as `Beanstalk`.
+    """
+
+    def __init__(self):
+        self.queue = Queue()
+
+    def delete(self, job_id):
+        self.queue.put(('delete', job_id))
+
+    def bury(self, job_id, priority=DEFAULT_PRIORITY):
+        self.queue.put(('bury', job_id, priority))
+
+    def release(self, job_id, priority=DEFAULT_PRIORITY, delay=0):
+        self.queue.put(('release', job_id, priority, delay))
+
+    def pop_all(self):
+        """Get all pending acknowledgements, without waiting."""
+        commands = list()
+        while True:
+            try:
+                commands.append(self.queue.get_nowait())
+            except Empty:
+                return commands
+
+    def wait(self, timeout):
+        """
+        Wait at most `timeout` seconds for an acknowledgement,
+        and get all the pending ones.
+        """
+        try:
+            commands = [self.queue.get(timeout=timeout)]
+        except Empty:
+            return list()
+        return commands + self.pop_all()
+
+
 class Worker(object):
 
     SIGNALS = [getattr(signal, "SIG%s" % x)
@@ -154,6 +199,9 @@ class EventWorker(Worker):
                                      global_conf=self.conf,
                                      app=self)
 
+        self.concurrency = int_value(self.conf.get('concurrency'), 10)
+        self.reserve_batch_size = int_value(
+            self.conf.get('reserve_batch_size'), 0)
         for opt in ('acct_update', 'rdir_update',
                     'retries_per_second', 'batch_size'):
             if opt in self.conf:
@@ -178,14 +226,18 @@ class EventWorker(Worker):
     def run(self):
         coros = []
         queue_url = self.conf.get('queue_url', 'beanstalk://127.0.0.1:11300')
-        concurrency = int_value(self.conf.get('concurrency'), 10)
+        if self.reserve_batch_size > 1:
+            # One connection per queue, feeding a pool of handlers
+            handle, connections = self.handle_batched, 1
+        else:
+            handle, connections = self.handle, self.concurrency
 
         server_gt = greenthread.getcurrent()
 
         for url in queue_url.split(';'):
-            for i in range(concurrency):
+            for i in range(connections):
                 beanstalk = Beanstalk.from_url(url)
-                gt = eventlet.spawn(self.handle, beanstalk)
+                gt = eventlet.spawn(handle, beanstalk)
                 gt.link(_eventlet_stop, server_gt, beanstalk)
                 coros.append(gt)
                 beanstalk, gt = None, None
@@ -226,37 +278,146 @@ class EventWorker(Worker):
                         conn_error = True
                     eventlet.sleep(BEANSTALK_RECONNECTION)
                     continue
-                event = self.safe_decode_job(job_id, data)
-                if not event:
-                    self.logger.warn("Burying event %s: %s",
-                                     job_id, "malformed")
-                    beanstalk.bury(job_id)
-                else:
-                    try:
-                        self.process_event(job_id, event, beanstalk)
-                    except (ClientException, OioNetworkException) as exc:
-                        self.logger.warn("Burying event %s (%s): %s",
-                                         job_id, event.get('event'), exc)
-                        beanstalk.bury(job_id)
-                    except ExplicitBury:
-                        self.logger.info("Burying event %s (%s)",
-                                         job_id, event.get('event'))
-                        beanstalk.bury(job_id)
-                    except Exception:
-                        self.logger.exception("Burying event %s: %s",
-                                              job_id, event)
-                        beanstalk.bury(job_id)
+                self.process_job(job_id, data, beanstalk)
         except StopServe:
             pass
 
-    def process_event(self, job_id, event, beanstalk):
-        handler = self.get_handler(event)
-        if not handler:
-            self.logger.warn('no handler found for %r' % event)
-            beanstalk.delete(job_id)
+    def _flush_acks(self, beanstalk, commands):
+        """Send job acknowledgements in one batch."""
+        results = beanstalk.execute_many(commands)
+        for command, result in zip(commands, results):
+            if isinstance(result, ResponseError):
+                self.logger.warn("Failed to %s event %s: %s",
+                                 command[0], command[1], result)
+
+    def handle_batched(self, beanstalk):
+        """
+        Reserve jobs in batches of `reserve_batch_size` on one connection,
+        and pass them by batches to the handlers, keeping at most
+        `concurrency` events in flight.
+        Acknowledgements are sent in batches on the same connection.
+        """
+        pool = GreenPool(self.concurrency)
+        acks = AckBuffer()
+        commands = list()
+        conn_error = False
+        in_flight = [0]
+
+        def _process_jobs(jobs):
+            try:
+                self.process_jobs(jobs, acks)
+            finally:
+                in_flight[0] -= len(jobs)
+        try:
+            if self.tube:
+                beanstalk.use(self.tube)
+                beanstalk.watch(self.tube)
+            while True:
+                jobs = list()
+                try:
+                    commands.extend(acks.pop_all())
+                    self._flush_acks(beanstalk, commands)
+                    commands = list()
+                    free = self.concurrency - in_flight[0]
+                    if free > 0:
+                        # Wait for jobs only when nothing else is to be done
+                        idle = not pool.running() and acks.queue.empty()
+                        jobs = beanstalk.reserve_many(
+                            min(free, self.reserve_batch_size),
+                            timeout=None if idle else 0)
+                    if conn_error:
+                        self.logger.warn("beanstalk reconnected")
+                        conn_error = False
+                except ConnectionError:
+                    if not conn_error:
+                        self.logger.warn("beanstalk connection error")
+                        conn_error = True
+                    # The jobs reserved on the lost connection
+                    # have been released by the server.
+                    commands = list()
+                    eventlet.sleep(BEANSTALK_RECONNECTION)
+                    continue
+                if jobs:
+                    in_flight[0] += len(jobs)
+                    pool.spawn_n(_process_jobs, jobs)
+                if not jobs and pool.running():
+                    commands.extend(acks.wait(BATCH_POLL_INTERVAL))
+        except StopServe:
+            pool.waitall()
+            try:
+                self._flush_acks(beanstalk, commands + acks.pop_all())
+            except ConnectionError:
+                pass
+
+    def process_job(self, job_id, data, beanstalk):
+        """
+        Decode a job and process the event it carries,
+        burying the job in case of failure.
+        """
+        event = self.safe_decode_job(job_id, data)
+        if not event:
+            self.logger.warn("Burying event %s: %s",
+                             job_id, "malformed")
+            beanstalk.bury(job_id)
             return
+        try:
+            self.process_event(job_id, event, beanstalk)
+        except Exception as exc:
+            self._bury_failed(job_id, event, exc, beanstalk)
+
+    def _bury_failed(self, job_id, event, exc, beanstalk):
+        """Bury the job of an event whose processing raised `exc`."""
+        if isinstance(exc, (ClientException, OioNetworkException)):
+            self.logger.warn("Burying event %s (%s): %s",
+                             job_id, event.get('event'), exc)
+        elif isinstance(exc, ExplicitBury):
+            self.logger.info("Burying event %s (%s)",
+                             job_id, event.get('event'))
+        else:
+            self.logger.exception("Burying event %s: %s",
+                                  job_id, event)
+        beanstalk.bury(job_id)
+
+    def process_jobs(self, jobs, beanstalk):
+        """
+        Decode several jobs, and pass their events to the
+        `process_batch()` method of their handlers, one batch
+        per type of event.
+        """
+        batches = dict()
+        for job_id, data in jobs:
+            event = self.safe_decode_job(job_id, data)
+            if not event:
+                self.logger.warn("Burying event %s: %s",
+                                 job_id, "malformed")
+                beanstalk.bury(job_id)
+                continue
+            handler = self.get_handler(event)
+            if not handler:
+                self.logger.warn('no handler found for %r' % event)
+                beanstalk.delete(job_id)
+                continue
+            batch = batches.setdefault(event.get('event'),
+                                       (handler, list(), list()))
+            batch[1].append(event)
+            batch[2].append(self._event_callback(job_id, event, beanstalk))
 
+        for handler, events, cbs in batches.itervalues():
+            try:
+                handler.process_batch(events, cbs)
+            except Exception as exc:
+                for event, cb in zip(events, cbs):
+                    if not cb.called:
+                        self._bury_failed(event['job_id'], event, exc,
+                                          beanstalk)
+
+    def _event_callback(self, job_id, event, beanstalk):
+        """
+        Build the callback acknowledging the job of an event
+        depending on the status of its processing.
+        """
         def cb(status, msg):
+            cb.called = True
             if is_success(status):
                 beanstalk.delete(job_id)
             elif is_error(status):
@@ -264,8 +425,17 @@ class EventWorker(Worker):
                     'event %s handling failure (release with delay): %s',
                     event['job_id'], msg)
                 beanstalk.release(job_id, delay=RELEASE_DELAY)
+        cb.called = False
+        return cb
+
+    def process_event(self, job_id, event, beanstalk):
+        handler = self.get_handler(event)
+        if not handler:
+            self.logger.warn('no handler found for %r' % event)
+            beanstalk.delete(job_id)
+            return
 
-        handler(event, cb)
+        handler(event, self._event_callback(job_id, event, beanstalk))
 
     def get_handler(self, event):
         return self.handlers.get(event.get('event'), None)
@@ -14,7 +14,9 @@
 # along with this program.  If not, see <http://www.gnu.org/licenses/>.
 
 
+from oio.common.easy_value import float_value, int_value
 from oio.common.exceptions import ClientException, OioTimeout
+from oio.common.green import Event as GreenEvent, greenthread
 from oio.account.client import AccountClient
 from oio.event.evob import Event, EventError
 from oio.event.consumer import EventTypes
@@ -22,50 +24,181 @@ from oio.event.filters.base import Filter
 
 
 ACCOUNT_TIMEOUT = 30
+# Delay during which updates of the same container are merged (seconds),
+# 0 to send each update as soon as its event is processed
+COALESCE_WINDOW = 0.0
 
 CONTAINER_EVENTS = [
         EventTypes.CONTAINER_STATE,
         EventTypes.CONTAINER_NEW]
 
 
+class PendingUpdate(object):
+    """
+    Container update waiting to be sent to the account service,
+    shared by all the events it has been merged from.
+    """
+
+    def __init__(self, account, container, body):
+        self.account = account
+        self.container = container
+        self.body = body
+        self.result = GreenEvent()
+
+    def merge(self, body):
+        """Keep the update with the newest mtime."""
+        if body['mtime'] >= self.body['mtime']:
+            self.body = body
+
+    def wait(self):
+        """
+        Wait for the update to be sent.
+
+        :returns: a tuple (status, message)
+        """
+        return self.result.wait()
+
+
 class AccountUpdateFilter(Filter):
 
     def init(self):
         self.account = AccountClient(self.conf, logger=self.logger)
+        self.coalesce_window = float_value(
+            self.conf.get('coalesce_window'), COALESCE_WINDOW)
+        # By default, send the pending updates as soon as all the events
+        # a worker processes concurrently are waiting for them.
+        self.coalesce_max_updates = int_value(
+            self.conf.get('coalesce_max_updates'),
+            int_value(self.conf.get('concurrency'), 10))
+        self._pending = dict()
+        self._waiting = 0
+        self._flusher = None
+
+    def _send_update(self, account, container, body):
+        """
+        Send the update of a single container.
+
+        :returns: a tuple (status, message)
+        """
+        try:
+            self.account.container_update(account, container, body,
+                                          read_timeout=ACCOUNT_TIMEOUT)
+        except OioTimeout as exc:
+            return 500, str(exc)
+        except ClientException as exc:
+            return exc.http_status, exc.message
+        return 200, None
+
+    def _send_updates(self, account, updates):
+        """Send a batch of updates of the same account."""
+        try:
+            results = self.account.container_update_many(
+                account, [u.body for u in updates],
+                read_timeout=ACCOUNT_TIMEOUT)
+        except Exception as exc:
+            if not isinstance(exc, (ClientException, OioTimeout)):
+                self.logger.exception('account update failure')
+            for update in updates:
+                update.result.send((500, str(exc)))
+            return
+        results = results or list()
+        for update, result in zip(updates, results):
+            update.result.send((result.get('status'),
+                                result.get('message')))
+        if len(results) < len(updates):
+            self.logger.error('account update failure: %d results '
+                              'for %d updates', len(results), len(updates))
+            # Do not let the events of the other updates wait forever
+            for update in updates[len(results):]:
+                update.result.send(
+                    (500, 'No result for container %s' % update.container))
+
+    def _send_pending(self, pending):
+        """Send a `dict` of pending updates, one request per account."""
+        by_account = dict()
+        for update in pending.itervalues():
+            by_account.setdefault(update.account, list()).append(update)
+        for account, updates in by_account.iteritems():
+            self._send_updates(account, updates)
+
+    def _flush(self):
+        """Send all pending updates."""
+        pending, self._pending = self._pending, dict()
+        self._waiting = 0
+        self._flusher = None
+        self._send_pending(pending)
+
+    def _update_container(self, account, container, body):
+        """
+        Queue a container update, merging it with a pending update
+        of the same container, and wait for it to be sent.
+        Without coalescing window, send it right away.
+
+        :returns: a tuple (status, message)
+        """
+        if self.coalesce_window <= 0:
+            return self._send_update(account, container, body)
+        key = (account, container)
+        update = self._pending.get(key)
+        if update is not None:
+            update.merge(body)
+        else:
+            update = PendingUpdate(account, container, body)
+            self._pending[key] = update
+        self._waiting += 1
+        if self._waiting >= self.coalesce_max_updates:
+            if self._flusher is not None:
+                self._flusher.cancel()
+            self._flush()
+        elif self._flusher is None:
+            self._flusher = greenthread.spawn_after(
+                self.coalesce_window, self._flush)
+        return update.wait()
+
+    def _container_update(self, event):
+        """
+        :returns: a tuple (account, container, body) with the update
+            to send for a container event
+        """
+        mtime = event.when / 1000000.0  # convert to seconds
+        data = event.data
+        url = event.env.get('url')
+        body = dict()
+        body['name'] = url.get('user')
+        if event.event_type == EventTypes.CONTAINER_STATE:
+            body['bytes'] = data.get('bytes-count', 0)
+            body['objects'] = data.get('object-count', 0)
+            body['mtime'] = mtime
+        elif event.event_type == EventTypes.CONTAINER_NEW:
+            body['mtime'] = mtime
+        return url.get('account'), url.get('user'), body
+
+    def _check_result(self, event, env, cb, status, message):
+        """
+        Answer the event if its update has failed.
+
+        :returns: True if the event can go on through the pipeline
+        """
+        if status == 409 and "No update needed" in (message or ''):
+            self.logger.info("Discarding event %s (%s): %s",
+                             event.job_id,
+                             event.event_type,
+                             message)
+        elif status != 200:
+            msg = 'account update failure: %s' % message
+            resp = EventError(event=Event(env), body=msg)
+            resp(env, cb)
+            return False
+        return True
 
     def process(self, env, cb):
         event = Event(env)
 
         if event.event_type in CONTAINER_EVENTS:
-            mtime = event.when / 1000000.0  # convert to seconds
-            data = event.data
-            url = event.env.get('url')
-            body = dict()
-            if event.event_type == EventTypes.CONTAINER_STATE:
-                body['bytes'] = data.get('bytes-count', 0)
-                body['objects'] = data.get('object-count', 0)
-                body['mtime'] = mtime
-            elif event.event_type == EventTypes.CONTAINER_NEW:
-                body['mtime'] = mtime
-            try:
-                self.account.container_update(
-                    url.get('account'), url.get('user'), body,
-                    read_timeout=ACCOUNT_TIMEOUT)
-            except OioTimeout as exc:
-                msg = 'account update failure: %s' % str(exc)
-                resp = EventError(event=Event(env), body=msg)
-                return resp(env, cb)
-            except ClientException as exc:
-                if (exc.http_status == 409 and
-                        "No update needed" in exc.message):
-                    self.logger.info("Discarding event %s (%s): %s",
-                                     event.job_id,
-                                     event.event_type,
-                                     exc.message)
-                else:
-                    msg = 'account update failure: %s' % str(exc)
-                    resp = EventError(event=Event(env), body=msg)
-                    return resp(env, cb)
+            status, message = self._update_container(
+                *self._container_update(event))
+            if not self._check_result(event, env, cb, status, message):
+                return
         elif event.event_type == EventTypes.ACCOUNT_SERVICES:
             url = event.env.get('url')
             if isinstance(event.data, list):
@@ -86,6 +219,40 @@ class AccountUpdateFilter(Filter):
                     url.get('account'), read_timeout=ACCOUNT_TIMEOUT)
         return self.app(env, cb)
 
+    def process_batch(self, envs, cbs):
+        """
+        Send the updates of all the container events of the batch
+        at once, one request per account, without coalescing window.
+        Other events are processed one by one.
+        """
+        pending = dict()
+        container_events = list()
+        for env, cb in zip(envs, cbs):
+            event = Event(env)
+            if event.event_type not in CONTAINER_EVENTS:
+                self.process(env, cb)
+                continue
+            account, container, body = self._container_update(event)
+            update = pending.get((account, container))
+            if update is not None:
+                update.merge(body)
+            else:
+                update = PendingUpdate(account, container, body)
+                pending[(account, container)] = update
+            container_events.append((event, env, cb, update))
+        if not container_events:
+            return
+
+        self._send_pending(pending)
+        next_envs = list()
+        next_cbs = list()
+        for event, env, cb, update in container_events:
+            status, message = update.wait()
+            if self._check_result(event, env, cb, status, message):
+                next_envs.append(env)
+                next_cbs.append(cb)
+        self.app.process_batch(next_envs, next_cbs)
+
 
 def filter_factory(global_conf, **local_conf):
     conf = global_conf.copy()
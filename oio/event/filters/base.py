@@ -32,5 +32,18 @@ class Filter(object):
     def process(self, env, cb):
         return self.app(env, cb)
 
+    def process_batch(self, envs, cbs):
+        """
+        Process several events at once. The callback of each event
+        (at the same position in `cbs`) must be called, or passed along
+        with the event to `self.app.process_batch()`, exactly like the
+        callback given to `process()`.
+
+        Filters able to save work on a whole batch override this method,
+        by default events are processed one by one.
+        """
+        for env, cb in zip(envs, cbs):
+            self.process(env, cb)
+
     def __call__(self, env, cb):
         self.process(env, cb)
@@ -39,8 +39,7 @@ class ContentReaperFilter(Filter):
     def _handle_rawx(self, url, chunks, content_headers,
                      storage_method, reqid):
         cid = url.get('id')
-        headers = {'X-oio-req-id': reqid,
-                   'Connection': 'close'}
+        headers = {'X-oio-req-id': reqid}
 
         resps = self.blob_client.chunk_delete_many(
             chunks, cid=cid, headers=headers, timeout=5.0)
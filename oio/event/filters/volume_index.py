@@ -14,6 +14,9 @@
 # along with this program.  If not, see <http://www.gnu.org/licenses/>.
 
 
+from itertools import groupby
+
+from oio.common.easy_value import int_value
 from oio.event.evob import Event, EventError
 from oio.event.consumer import EventTypes
 from oio.event.filters.base import Filter
@@ -22,6 +25,8 @@ from oio.common.exceptions import OioException, VolumeException
 
 CHUNK_EVENTS = [EventTypes.CHUNK_DELETED, EventTypes.CHUNK_NEW]
 SERVICE_EVENTS = [EventTypes.ACCOUNT_SERVICES, EventTypes.CONTAINER_DELETED]
+# Number of simultaneous requests to an rdir service in batch mode
+RDIR_CONCURRENCY = 10
 
 
 class VolumeIndexFilter(Filter):
@@ -29,6 +34,10 @@ class VolumeIndexFilter(Filter):
     _attempts_push = 3
     _attempts_delete = 3
 
+    def init(self):
+        self.rdir_concurrency = int_value(
+            self.conf.get('rdir_concurrency'), RDIR_CONCURRENCY)
+
     def _chunk_delete(self, reqid,
                       volume_id, container_id, content_id, chunk_id):
         headers = {'X-oio-req-id': reqid}
@@ -122,6 +131,70 @@ class VolumeIndexFilter(Filter):
                                          container_url, container_id)
         return self.app(env, cb)
 
+    def _chunk_update_many(self, events):
+        """
+        Push or delete the chunks of several chunk events,
+        of different volumes.
+        """
+        pushes = list()
+        deletes = list()
+        for event in events:
+            data = event.data
+            entry = {
+                'volume_id': (data.get('volume_service_id') or
+                              data.get('volume_id')),
+                'container_id': data.get('container_id'),
+                'content_id': data.get('content_id'),
+                'chunk_id': data.get('chunk_id')}
+            if event.event_type == EventTypes.CHUNK_DELETED:
+                deletes.append(entry)
+            else:
+                entry['mtime'] = event.when / 1000000
+                pushes.append(entry)
+        for entries, method, action in (
+                (pushes, self.app.rdir.chunk_push_many, 'push'),
+                (deletes, self.app.rdir.chunk_delete_many, 'delete')):
+            if not entries:
+                continue
+            for entry, exc in method(entries,
+                                     batch_size=self.rdir_concurrency):
+                self.logger.warn("chunk %s failed (%s): %s",
+                                 action, entry['chunk_id'], exc)
+
+    def process_batch(self, envs, cbs):
+        """
+        Update the rdir services with bulk requests grouped by volume.
+        The chunk events of a volume are split in runs of consecutive
+        events of the same type, and the runs are applied in order.
+        Service events are processed one by one.
+        """
+        volumes = dict()
+        chunk_envs = list()
+        chunk_cbs = list()
+        for env, cb in zip(envs, cbs):
+            event = Event(env)
+            if event.event_type not in CHUNK_EVENTS:
+                self.process(env, cb)
+                continue
+            data = event.data
+            volume_id = data.get('volume_service_id') or data.get('volume_id')
+            volumes.setdefault(volume_id, list()).append(event)
+            chunk_envs.append(env)
+            chunk_cbs.append(cb)
+        if not volumes:
+            return
+
+        # The n-th run of all volumes are sent together
+        runs = list()
+        for events in volumes.itervalues():
+            runs.append([list(run) for _, run in
+                         groupby(events, lambda e: e.event_type)])
+        for i in range(max(len(volume_runs) for volume_runs in runs)):
+            self._chunk_update_many(
+                [evt for volume_runs in runs if i < len(volume_runs)
+                 for evt in volume_runs[i]])
+        self.app.process_batch(chunk_envs, chunk_cbs)
+
 
 def filter_factory(global_conf, **local_conf):
     conf = global_conf.copy()
@@ -38,6 +38,10 @@ class Handler(object):
             res = EventError(event=event, body='An error ocurred')
             return res(env, cb)
 
+    def process_batch(self, envs, cbs):
+        for env, cb in zip(envs, cbs):
+            self(env, cb)
+
 
 def handler_factory(app, global_conf, **local_conf):
     conf = global_conf.copy()
@@ -65,15 +65,45 @@ class _Filter(_Type):
 FILTER = _Filter()
 
 
+class _BatchAdapter(object):
+    """
+    Give a `process_batch()` method to a filter or a handler
+    which can only process events one by one.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    def __getattr__(self, name):
+        return getattr(self.app, name)
+
+    def __call__(self, env, cb):
+        return self.app(env, cb)
+
+    def process_batch(self, envs, cbs):
+        for env, cb in zip(envs, cbs):
+            self.app(env, cb)
+
+
+def _batch_capable(app):
+    if hasattr(app, 'process_batch'):
+        return app
+    return _BatchAdapter(app)
+
+
 class _Pipeline(_Type):
     name = 'pipeline'
 
     def invoke(self, context, **kwargs):
-        app = context.handler_context.create(**kwargs)
+        """
+        Build the pipeline of filters ending with the handler.
+        Each step of the pipeline has a `process_batch(envs, cbs)` method.
+        """
+        app = _batch_capable(context.handler_context.create(**kwargs))
         filters = [c.create(**kwargs) for c in context.filter_contexts]
         filters.reverse()
         for filter_ in filters:
-            app = filter_(app)
+            app = _batch_capable(filter_(app))
         return app
 
 
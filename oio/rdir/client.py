@@ -25,10 +25,13 @@ from oio.common.decorators import ensure_headers, ensure_request_id
 from oio.conscience.client import ConscienceClient
 from oio.directory.client import DirectoryClient
 from oio.common.utils import depaginate, cid_from_name
-from oio.common.green import sleep
+from oio.common.green import sleep, GreenPile
 
 RDIR_ACCT = '_RDIR'
 
+# Number of simultaneous requests of chunk_push_many and chunk_delete_many
+RDIR_BATCH_SIZE = 32
+
 # Special target that will match any service from the "known" service list
 JOKER_SVC_TARGET = '__any_slot'
 
@@ -360,8 +363,89 @@ class RdirClient(HttpApi):
         self._rdir_request(volume_id, 'DELETE', 'delete',
                            json=body, **kwargs)
 
+    def _chunk_request_many(self, method, action, entries, batch_size,
+                            create=False, **kwargs):
+        """
+        Send one request per chunk entry, grouped by volume, with at most
+        `batch_size` requests at the same time.
+
+        :returns: the list of (entry, exception) of the failed requests
+        """
+        volumes = dict()
+        for entry in entries:
+            volumes.setdefault(entry['volume_id'], list()).append(entry)
+
+        params = {'create': '1'} if create else dict()
+        req_id = kwargs['headers']['X-oio-req-id']
+
+        def _request(uri, volume_id, entry):
+            body = dict(entry)
+            del body['volume_id']
+            try:
+                self._direct_request(method, uri, json=body,
+                                     params=dict(params, vol=volume_id),
+                                     **kwargs)
+            except Exception as exc:
+                return entry, exc
+
+        failures = list()
+        for volume_id, volume_entries in volumes.iteritems():
+            # Resolve the rdir service once per volume
+            try:
+                uri = self._make_uri(action, volume_id, req_id=req_id)
+            except Exception as exc:
+                failures.extend((entry, exc) for entry in volume_entries)
+                continue
+            for i in range(0, len(volume_entries), batch_size):
+                pile = GreenPile(batch_size)
+                for entry in volume_entries[i:i + batch_size]:
+                    pile.spawn(_request, uri, volume_id, entry)
+                errors = [failure for failure in pile if failure]
+                failures.extend(errors)
+                if any(isinstance(exc, OioNetworkException)
+                       for _, exc in errors):
+                    self._clear_cache(volume_id)
+        return failures
+
+    @ensure_headers
+    @ensure_request_id
+    def chunk_push_many(self, entries, batch_size=RDIR_BATCH_SIZE, **kwargs):
+        """
+        Reference several chunks in the reverse directories
+        of their volumes.
+
+        :param entries: dictionaries with "volume_id", "container_id",
+            "content_id" and "chunk_id" keys, and optional extra
+            fields (like "mtime")
+        :type entries: `iterable` of `dict`
+        :param batch_size: maximum number of simultaneous requests
+        :returns: the list of (entry, exception) tuples of the chunks
+            which could not be referenced
+        """
+        return self._chunk_request_many('POST', 'push', entries, batch_size,
+                                        create=True, **kwargs)
+
+    @ensure_headers
+    @ensure_request_id
+    def chunk_delete_many(self, entries, batch_size=RDIR_BATCH_SIZE,
+                          **kwargs):
+        """
+        Unreference several chunks from the reverse directories
+        of their volumes.
+
+        :param entries: dictionaries with "volume_id", "container_id",
+            "content_id" and "chunk_id" keys
+        :type entries: `iterable` of `dict`
+        :param batch_size: maximum number of simultaneous requests
+        :returns: the list of (entry, exception) tuples of the chunks
+            which could not be unreferenced
+        """
+        return self._chunk_request_many('DELETE', 'delete', entries,
+                                        batch_size, **kwargs)
+
     def chunk_fetch(self, volume, limit=100, rebuild=False,
-                    container_id=None, max_attempts=3, **kwargs):
+                    container_id=None, max_attempts=3,
+                    start_after=None, **kwargs):
         """
         Fetch the list of chunks belonging to the specified volume.
 
@@ -374,12 +458,17 @@ class RdirClient(HttpApi):
         :keyword container_id: get only chunks belonging to
            the specified container
         :type container_id: `str`
+        :keyword start_after: fetch only chunks whose key
+           ('container_id|content_id|chunk_id') is after this one
+        :type start_after: `str`
         """
         req_body = {'limit': limit}
         if rebuild:
             req_body['rebuild'] = True
         if container_id:
             req_body['container_id'] = container_id
+        if start_after:
+            req_body['start_after'] = start_after
 
         while True:
             for i in range(max_attempts):
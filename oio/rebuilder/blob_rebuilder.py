@@ -16,6 +16,7 @@
 
 import time
 import uuid
+from itertools import chain
 from datetime import datetime
 from socket import gethostname
 
@@ -24,16 +25,52 @@ from oio.common.green import threading
 from oio.common.easy_value import int_value, true_value
 from oio.common.exceptions import ContentNotFound, NotFound, OrphanChunk, \
     ConfigurationException, OioTimeout, ExplicitBury
+from oio.common.storage_method import STORAGE_METHODS
+from oio.container.client import ContainerClient
+from oio.content.cache import LocateCache
+from oio.content.content import Chunk
 from oio.content.factory import ContentFactory
 from oio.event.beanstalk import Beanstalk, BeanstalkError, ConnectionError, \
-    ResponseError
+    ResponseError, DEFAULT_PRIORITY
 from oio.rdir.client import RdirClient
 from oio.rebuilder.rebuilder import Rebuilder, RebuilderWorker
+from oio.rebuilder.rate_controller import RateController
+from oio.rebuilder.scheduler import RebuildScheduler
 
 
 DEFAULT_REBUILDER_TUBE = 'oio-rebuild'
 DEFAULT_IMPROVER_TUBE = 'oio-improve'
 DISTRIBUTED_REBUILDER_TIMEOUT = 300
+MAX_CHUNKS_PER_BATCH = 64
+SCHEDULING_WINDOW = 256
+# Priority of the batches whose risk of data loss cannot be evaluated
+# (or which turn out not to be damaged): after all the others, so that
+# they do not delay the metachunks actually at risk
+UNKNOWN_RISK_PRIORITY = 2 ** 16
+
+
+def group_chunks_by_content(chunks, max_size=MAX_CHUNKS_PER_BATCH):
+    """
+    Group consecutive broken chunks belonging to the same content,
+    so that the chunks of a metachunk can be rebuilt together.
+
+    :returns: an iterator over `list`s of chunks
+    """
+    batch = list()
+    for chunk in chunks:
+        if batch and (len(batch) >= max_size
+                      or chunk[0] != batch[0][0]
+                      or chunk[1] != batch[0][1]):
+            yield batch
+            batch = list()
+        batch.append(chunk)
+    if batch:
+        yield batch
+
+
+def chunk_key(chunk):
+    """Key of a broken chunk, as in rdir and in input files."""
+    return '|'.join(chunk[:3])
 
 
 class BlobRebuilder(Rebuilder):
@@ -44,8 +81,17 @@ class BlobRebuilder(Rebuilder):
         # rdir
         self.rdir_client = RdirClient(conf, logger=self.logger)
         self.rdir_fetch_limit = int_value(conf.get('rdir_fetch_limit'), 100)
+        # meta2
+        self.container_client = ContainerClient(conf, logger=self.logger)
+        self.locate_cache = LocateCache.from_conf(
+            conf, self.container_client, properties=True)
         # rawx
         self.try_chunk_delete = try_chunk_delete
+        self.max_concurrency_per_rawx = int_value(
+            conf.get('max_concurrency_per_rawx'), 0)
+        # scheduling
+        self.scheduling_window = int_value(
+            conf.get('scheduling_window'), SCHEDULING_WINDOW)
         # beanstalk
         if beanstalkd_addr:
             self.beanstalkd_listener = BeanstalkdListener(
@@ -57,7 +103,6 @@ class BlobRebuilder(Rebuilder):
         # counters
         self.bytes_processed = 0
         self.total_bytes_processed = 0
-        self.total_expected_chunks = None
         # distributed
         self.distributed = False
 
@@ -65,10 +110,68 @@ class BlobRebuilder(Rebuilder):
         return BlobRebuilderWorker(
             self, try_chunk_delete=self.try_chunk_delete, **kwargs)
 
+    def _create_rate_controller(self):
+        return RateController.from_conf(self.conf, logger=self.logger)
+
+    def _create_queue(self, **kwargs):
+        return RebuildScheduler(
+            max(self.scheduling_window, self.nworkers),
+            max_per_service=self.max_concurrency_per_rawx)
+
     def _fill_queue(self, queue, **kwargs):
-        chunks = self._fetch_chunks(**kwargs)
-        for chunk in chunks:
-            queue.put(chunk)
+        for batch in self._fetch_batches(**kwargs):
+            priority, sources = self._schedule_batch(batch)
+            self._queue_item(queue, batch, marker=chunk_key(batch[-1]),
+                             priority=priority, services=sources)
+
+    def _schedule_batch(self, chunks):
+        """
+        Evaluate the risk of data loss of a batch of broken chunks
+        belonging to the same content.
+
+        :returns: a tuple with the number of chunks that can still be
+            lost in the most damaged metachunk (the lower, the sooner
+            the batch must be rebuilt), or `UNKNOWN_RISK_PRIORITY`,
+            and the list of rawx services holding the remaining chunks
+            of the damaged metachunks
+        """
+        container_id, content_id, _, _ = chunks[0]
+        try:
+            meta, raw_chunks = self.locate_cache.content_locate(
+                container_id, content_id)
+            storage_method = STORAGE_METHODS.load(meta['chunk_method'])
+        except Exception as exc:
+            # The workers will deal with it
+            self.logger.debug('Cannot evaluate %s: %s',
+                              self._item_to_string(chunks[0]), exc)
+            return UNKNOWN_RISK_PRIORITY, ()
+        min_chunks = storage_method.ec_nb_data if storage_method.ec else 1
+
+        broken = set()
+        damaged = set()
+        for _, _, chunk_id_or_pos, _ in chunks:
+            if len(chunk_id_or_pos) < 32:
+                broken.add(chunk_id_or_pos)
+                damaged.add(int(chunk_id_or_pos.split('.', 1)[0]))
+            else:
+                broken.add(chunk_id_or_pos.rsplit('/', 1)[-1])
+        remaining = dict()
+        for raw_chunk in raw_chunks:
+            chunk = Chunk(raw_chunk)
+            if chunk.id in broken or chunk.pos in broken \
+                    or (self.volume and chunk.host == self.volume):
+                damaged.add(chunk.metapos)
+            else:
+                remaining.setdefault(chunk.metapos, list()).append(
+                    chunk.host)
+        if not damaged:
+            return UNKNOWN_RISK_PRIORITY, ()
+        priority = min(len(remaining.get(metapos, ())) - min_chunks
+                       for metapos in damaged)
+        sources = set()
+        for metapos in damaged:
+            sources.update(remaining.get(metapos, ()))
+        return priority, sorted(sources)
 
     def _item_to_string(self, chunk, **kwargs):
         cid, content_id, chunk_id_or_pos, _ = chunk
@@ -111,11 +214,11 @@ class BlobRebuilder(Rebuilder):
                     'total_errors_rate':
                         100 * total_errors / float(total_chunks_processed or 1)
                 })
-        if self.total_expected_chunks is not None:
-            progress = 100 * total_chunks_processed / \
-                float(self.total_expected_chunks or 1)
-            report += ' progress=%d/%d %.2f%%' % \
-                (total_chunks_processed, self.total_expected_chunks, progress)
+        report += self._get_progress_report(total_chunks_processed, end_time)
+        if self.rate_controller is not None:
+            report += ' rate_limit=%dB/s' % self.rate_controller.rate
+        report += ' locate_cache_hits=%(hits)d %(hit_rate).2f' % \
+            self.locate_cache.stats()
         return report
 
     def _update_processed_without_lock(self, bytes_processed, error=None,
@@ -134,30 +237,50 @@ class BlobRebuilder(Rebuilder):
         return chunks_processed, bytes_processed, errors, \
             total_chunks_processed, self.total_bytes_processed, total_errors
 
-    def _rebuilder_pass(self, **kwargs):
-        return super(BlobRebuilder, self).rebuilder_pass(**kwargs)
+    def _get_counters_without_lock(self):
+        counters = super(BlobRebuilder, self)._get_counters_without_lock()
+        counters['bytes_processed'] = \
+            self.total_bytes_processed + self.bytes_processed
+        return counters
+
+    def _set_counters_without_lock(self, counters):
+        super(BlobRebuilder, self)._set_counters_without_lock(counters)
+        self.total_bytes_processed = counters.get('bytes_processed', 0)
+
+    def _checkpoint_entries(self, chunks):
+        return [(chunk_key(chunk), list(chunk[:3])) for chunk in chunks]
+
+    def _open_checkpoint(self):
+        if self._fetch_from_beanstalk():
+            # Events are deleted from beanstalkd once they are fetched,
+            # there is nothing to resume from.
+            return
+        super(BlobRebuilder, self)._open_checkpoint()
+
+    def _count_expected_items(self):
+        if self.volume and not self.input_file:
+            info = self.rdir_client.status(self.volume)
+            return info.get('chunk', dict()).get('to_rebuild', None)
+        return super(BlobRebuilder, self)._count_expected_items()
 
     def rebuilder_pass(self, **kwargs):
         success = False
         if self.volume:
             self.rdir_client.admin_lock(self.volume,
                                         "rebuilder on %s" % gethostname())
-            info = self.rdir_client.status(self.volume)
-            self.total_expected_chunks = info.get(
-                    'chunk', dict()).get('to_rebuild', None)
         try:
-            success = self._rebuilder_pass(**kwargs)
+            success = super(BlobRebuilder, self).rebuilder_pass(**kwargs)
         finally:
             if self.volume:
                 self.rdir_client.admin_unlock(self.volume)
         return success
 
-    def _event_from_broken_chunk(self, chunk, reply, **kwargs):
-        cid, content_id, chunk_id_or_pos, _ = chunk
+    def _event_from_broken_chunks(self, chunks, reply, **kwargs):
+        cid, content_id, _, _ = chunks[0]
         event = {}
         event['when'] = time.time()
         event['event'] = 'storage.content.broken'
-        event['data'] = {'missing_chunks': [chunk_id_or_pos]}
+        event['data'] = {'missing_chunks': [chunk[2] for chunk in chunks]}
         event['url'] = {'ns': self.namespace,
                         'id': cid, 'content': content_id}
         event['reply'] = reply
@@ -171,30 +294,53 @@ class BlobRebuilder(Rebuilder):
         reply = decoded.get('reply', None)
         if reply:
             more = {'reply': reply}
-        for chunk_id_or_pos in decoded['data']['missing_chunks']:
-            yield [container_id, content_id,
-                   str(chunk_id_or_pos), more]
+        # All the chunks of an event belong to the same content
+        yield [[container_id, content_id, str(chunk_id_or_pos), more]
+               for chunk_id_or_pos in decoded['data']['missing_chunks']]
 
     def _fetch_events_from_beanstalk(self, **kwargs):
         return self.beanstalkd_listener.fetch_events(
             self._chunks_from_event, **kwargs)
 
-    def _fetch_chunks_from_file(self, **kwargs):
+    def _fetch_chunks_from_file(self, start_after=None, **kwargs):
         with open(self.input_file, 'r') as ifile:
             for line in ifile:
                 stripped = line.strip()
-                if stripped and not stripped.startswith('#'):
-                    yield stripped.split('|', 3)[:3] + [None]
-
-    def _fetch_chunks(self, **kwargs):
-        if self.input_file:
-            return self._fetch_chunks_from_file(**kwargs)
-        if self.beanstalkd_listener and not self.distributed:
+                if not stripped or stripped.startswith('#'):
+                    continue
+                chunk = stripped.split('|', 3)[:3] + [None]
+                if start_after is not None:
+                    if chunk_key(chunk) == start_after:
+                        start_after = None
+                    continue
+                yield chunk
+
+    def _fetch_from_beanstalk(self):
+        return not self.input_file and self.beanstalkd_listener \
+            and not self.distributed
+
+    def _fetch_batches(self, **kwargs):
+        """
+        :returns: an iterator over `list`s of broken chunks
+            belonging to the same content
+        """
+        if self._fetch_from_beanstalk():
             return self._fetch_events_from_beanstalk(**kwargs)
+        # When resuming, rebuild the chunks which were in progress first
+        pending = [chunk + [None] for chunk in self._pending_items()]
+        return chain(
+            group_chunks_by_content(pending),
+            group_chunks_by_content(self._fetch_chunks(
+                start_after=self._resume_marker(), **kwargs)))
+
+    def _fetch_chunks(self, start_after=None, **kwargs):
+        if self.input_file:
+            return self._fetch_chunks_from_file(start_after=start_after,
+                                                **kwargs)
         if self.volume:
             return self.rdir_client.chunk_fetch(
                 self.volume, limit=self.rdir_fetch_limit, rebuild=True,
-                **kwargs)
+                start_after=start_after, **kwargs)
         raise ConfigurationException('No source to fetch chunks from')
 
 
@@ -254,6 +400,7 @@ class DistributedBlobRebuilder(BlobRebuilder):
                     self.beanstalkd_senders[beanstalkd_addr].event_done()
                     self.update_processed(
                         chunk, bytes_processed, error=error, **kwargs)
+                    self.item_done([chunk])
                 self.log_report('RUN', **kwargs)
             except OioTimeout:
                 self.logger.error("No response since %d secondes",
@@ -269,27 +416,34 @@ class DistributedBlobRebuilder(BlobRebuilder):
         senders = self.beanstalkd_senders.values()
         n = len(senders)
 
-        def _send_broken_chunk(broken_chunk, index):
-            event = self._event_from_broken_chunk(
-                broken_chunk, reply, **kwargs)
+        def _send_broken_chunks(broken_chunks, index):
+            event = self._event_from_broken_chunks(
+                broken_chunks, reply, **kwargs)
             # Send the event with a non-full sender
+            # Beanstalkd serves the jobs with the lowest priority first
+            priority, _ = self._schedule_batch(broken_chunks)
+            if self.checkpoint is not None:
+                self.checkpoint.queued(
+                    self._checkpoint_entries(broken_chunks),
+                    marker=chunk_key(broken_chunks[-1]))
             while True:
                 for _ in range(n):
                     success = senders[index].send_event(
-                        event, **kwargs)
+                        event, nb_chunks=len(broken_chunks),
+                        priority=max(priority, 0), **kwargs)
                     index = (index + 1) % n
                     if success:
                         return index
                 time.sleep(5)
 
-        broken_chunks = self._fetch_chunks(**kwargs)
+        batches = self._fetch_batches(**kwargs)
         try:
-            index = _send_broken_chunk(next(broken_chunks), index)
+            index = _send_broken_chunks(next(batches), index)
             self.sending = True
         except StopIteration:
             return
-        for broken_chunk in broken_chunks:
-            index = _send_broken_chunk(broken_chunk, index)
+        for batch in batches:
+            index = _send_broken_chunks(batch, index)
 
     def _rebuilt_chunk_from_event(self, job_id, data, **kwargs):
         decoded = json.loads(data)
@@ -315,21 +469,57 @@ class BlobRebuilderWorker(RebuilderWorker):
             self.rebuilder.conf.get('allow_same_rawx'))
         self.try_chunk_delete = try_chunk_delete
         self.rdir_client = self.rebuilder.rdir_client
-        self.content_factory = ContentFactory(self.rebuilder.conf,
-                                              logger=self.logger)
+        self.locate_cache = self.rebuilder.locate_cache
+        self.content_factory = ContentFactory(
+            self.rebuilder.conf, logger=self.logger,
+            container_client=self.rebuilder.container_client,
+            locate_cache=self.locate_cache)
         self.sender = None
 
-    def _rebuild_one(self, chunk, **kwargs):
-        container_id, content_id, chunk_id_or_pos, _ = chunk
-        if self.dry_run:
-            self.dryrun_chunk_rebuild(container_id, content_id,
-                                      chunk_id_or_pos, **kwargs)
+    def _count_items(self, chunks):
+        return len(chunks)
+
+    def _count_bytes(self, chunks, results):
+        if not results:
             return 0
-        else:
-            return self.chunk_rebuild(container_id, content_id,
-                                      chunk_id_or_pos, **kwargs)
+        return sum(bytes_processed or 0 for bytes_processed, _ in results)
 
-    def update_processed(self, chunk, bytes_processed, error=None, **kwargs):
+    def _count_failures(self, chunks, results, error):
+        if results is None:
+            return len(chunks)
+        return sum(1 for _, chunk_error in results if chunk_error is not None)
+
+    def _rebuild_one(self, chunks, **kwargs):
+        """
+        Rebuild a batch of broken chunks belonging to the same content.
+
+        :returns: a `list` of (bytes_processed, error) tuples
+        """
+        container_id, content_id, _, _ = chunks[0]
+        if self.dry_run:
+            for chunk in chunks:
+                self.dryrun_chunk_rebuild(container_id, content_id,
+                                          chunk[2], **kwargs)
+            return [(0, None)] * len(chunks)
+        results = self.chunks_rebuild(
+            container_id, content_id, [chunk[2] for chunk in chunks],
+            **kwargs)
+        return [(bytes_processed, str(err) if err is not None else None)
+                for bytes_processed, err in results]
+
+    def update_processed(self, chunks, results, error=None, **kwargs):
+        """
+        :param results: `list` of (bytes_processed, error) tuples, one per
+            chunk of the batch, or None if the whole batch failed
+        """
+        if results is None:
+            results = [(None, error)] * len(chunks)
+        for chunk, (bytes_processed, chunk_error) in zip(chunks, results):
+            self._update_chunk_processed(chunk, bytes_processed,
+                                         error=chunk_error, **kwargs)
+
+    def _update_chunk_processed(self, chunk, bytes_processed, error=None,
+                                **kwargs):
         container_id, content_id, chunk_id_or_pos, more = chunk
         if more is not None:
             reply = more.get('reply', None)
@@ -371,14 +561,18 @@ class BlobRebuilderWorker(RebuilderWorker):
 
     def chunk_rebuild(self, container_id, content_id, chunk_id_or_pos,
                       **kwargs):
-        self.logger.info('Rebuilding (container %s, content %s, chunk %s)',
-                         container_id, content_id, chunk_id_or_pos)
-        try:
-            content = self.content_factory.get(container_id, content_id)
-        except ContentNotFound:
-            raise OrphanChunk('Content not found: possible orphan chunk')
-
-        chunk_size = 0
+        bytes_processed, error = self.chunks_rebuild(
+            container_id, content_id, [chunk_id_or_pos], **kwargs)[0]
+        if error is not None:
+            raise error
+        return bytes_processed
+
+    def _get_broken_chunk(self, content, chunk_id_or_pos):
+        """
+        :returns: a tuple with the ID (or None), the position (or None),
+            the description (or None) and the size of the chunk to rebuild
+        """
+        chunk = None
         chunk_pos = None
         if len(chunk_id_or_pos) < 32:
             chunk_pos = chunk_id_or_pos
@@ -398,11 +592,55 @@ class BlobRebuilderWorker(RebuilderWorker):
             elif self.volume and chunk.host != self.volume:
                 raise ValueError("Chunk does not belong to this volume")
             chunk_size = chunk.size
+        return chunk_id, chunk_pos, chunk, chunk_size
+
+    def chunks_rebuild(self, container_id, content_id, chunk_ids_or_pos,
+                       **kwargs):
+        """
+        Rebuild several chunks of the same content. The chunks belonging
+        to the same metachunk are rebuilt together.
+
+        :returns: a `list` of (bytes_processed, error) tuples,
+            in the same order as `chunk_ids_or_pos`
+        """
+        self.logger.info('Rebuilding (container %s, content %s, chunks %s)',
+                         container_id, content_id, chunk_ids_or_pos)
+        try:
+            content = self.content_factory.get(container_id, content_id)
+        except ContentNotFound:
+            raise OrphanChunk('Content not found: possible orphan chunk')
 
-        content.rebuild_chunk(chunk_id, allow_same_rawx=self.allow_same_rawx,
-                              chunk_pos=chunk_pos)
+        results = [None] * len(chunk_ids_or_pos)
+        broken = list()
+        for i, chunk_id_or_pos in enumerate(chunk_ids_or_pos):
+            try:
+                broken.append(
+                    (i, ) + self._get_broken_chunk(content, chunk_id_or_pos))
+            except Exception as err:
+                results[i] = (None, err)
 
-        if self.try_chunk_delete:
+        try:
+            errors = content.rebuild_chunks(
+                [(chunk_id, chunk_pos)
+                 for _, chunk_id, chunk_pos, _, _ in broken],
+                allow_same_rawx=self.allow_same_rawx)
+        finally:
+            # The list of chunks of the content has changed
+            self.locate_cache.invalidate(container_id, content_id)
+
+        for (i, chunk_id, _, chunk, chunk_size), error in zip(broken, errors):
+            if error is None:
+                try:
+                    self._chunk_rebuilt(content, container_id, content_id,
+                                        chunk_id, chunk, **kwargs)
+                except Exception as err:
+                    error = err
+            results[i] = (chunk_size if error is None else None, error)
+        return results
+
+    def _chunk_rebuilt(self, content, container_id, content_id, chunk_id,
+                       chunk, **kwargs):
+        if self.try_chunk_delete and chunk is not None:
             try:
                 content.blob_client.chunk_delete(chunk.url, **kwargs)
                 self.logger.info("Chunk %s deleted", chunk.url)
@@ -414,8 +652,6 @@ class BlobRebuilderWorker(RebuilderWorker):
             self.rdir_client.chunk_delete(chunk.host, container_id,
                                           content_id, chunk_id, **kwargs)
 
-        return chunk_size
-
 
 class Beanstalkd(object):
 
@@ -505,7 +741,14 @@ class BeanstalkdSender(Beanstalkd):
         self.nb_events = 0
         self.lock_nb_events = threading.Lock()
 
-    def send_event(self, event, **kwargs):
+    def send_event(self, event, nb_chunks=1, priority=DEFAULT_PRIORITY,
+                   **kwargs):
+        """
+        :param nb_chunks: number of chunks described by the event
+            (one reply is expected for each)
+        :param priority: beanstalkd priority of the job
+            (the lowest are reserved first)
+        """
         if self.nb_events <= self.threshold:
             self.fill = True
         elif not self.fill or self.nb_events > self.limit:
@@ -519,9 +762,9 @@ class BeanstalkdSender(Beanstalkd):
                 self._connect(**kwargs)
 
             with self.lock_nb_events:
-                job_id = self.beanstalkd.put(event)
-                self.nb_events += 1
-                if self.nb_events == self.limit:
+                job_id = self.beanstalkd.put(event, priority=priority)
+                self.nb_events += nb_chunks
+                if self.nb_events >= self.limit:
                     self.fill = False
             return True
         except ConnectionError as exc:
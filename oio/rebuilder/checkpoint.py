@@ -0,0 +1,129 @@
+# Copyright (C) 2018 OpenIO SAS, as part of OpenIO SDS
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as
+# published by the Free Software Foundation, either version 3 of the
+# License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+import sqlite3
+
+from oio.common.json import json
+
+
+CHECKPOINT_COMMIT_INTERVAL = 100
+
+
+class RebuilderCheckpoint(object):
+    """
+    Progress of a rebuilder pass, kept in a sqlite database so that
+    an interrupted pass can be resumed instead of restarted:
+    the marker of the last item put in the queue (e.g. the last rdir key),
+    the items put in the queue but not processed yet, some counters,
+    and optionally the keys of the items already seen, for listings
+    where the same item may appear several times.
+
+    Items and values must be JSON serializable. Changes are committed
+    every `commit_interval` writes, and by `commit()`: after a crash,
+    a few items may be processed twice.
+    """
+
+    def __init__(self, path, commit_interval=CHECKPOINT_COMMIT_INTERVAL):
+        self.path = path
+        self.commit_interval = commit_interval
+        self.pending = 0
+        self.db = sqlite3.connect(path)
+        self.db.execute('CREATE TABLE IF NOT EXISTS items ('
+                        'seq INTEGER PRIMARY KEY AUTOINCREMENT, '
+                        'key TEXT UNIQUE, item TEXT)')
+        self.db.execute('CREATE TABLE IF NOT EXISTS admin ('
+                        'k TEXT PRIMARY KEY, v TEXT)')
+        self.db.execute('CREATE TABLE IF NOT EXISTS seen ('
+                        'key TEXT PRIMARY KEY)')
+        self.db.commit()
+
+    def __len__(self):
+        return self.db.execute('SELECT COUNT(*) FROM items').fetchone()[0]
+
+    def get(self, key, default=None):
+        row = self.db.execute(
+            'SELECT v FROM admin WHERE k = ?', (key, )).fetchone()
+        if row is None:
+            return default
+        return json.loads(row[0])
+
+    def set(self, key, value):
+        self.db.execute('INSERT OR REPLACE INTO admin VALUES (?, ?)',
+                        (key, json.dumps(value)))
+        self._written()
+
+    @property
+    def marker(self):
+        """Marker of the last item put in the queue, or None."""
+        return self.get('marker')
+
+    def queued(self, entries, marker=None):
+        """
+        Record items put in the queue.
+
+        :param entries: `list` of (key, item) tuples
+        :param marker: marker to resume from, once these items
+            have been recorded
+        """
+        self.db.executemany(
+            'INSERT OR REPLACE INTO items (key, item) VALUES (?, ?)',
+            [(key, json.dumps(item)) for key, item in entries])
+        if marker is not None:
+            self.db.execute("INSERT OR REPLACE INTO admin VALUES "
+                            "('marker', ?)", (json.dumps(marker), ))
+        self._written()
+
+    def done(self, keys):
+        """Forget items which have been processed."""
+        self.db.executemany('DELETE FROM items WHERE key = ?',
+                            [(key, ) for key in keys])
+        self._written()
+
+    def seen(self, key):
+        """Record that the item identified by `key` has been seen."""
+        self.db.execute('INSERT OR IGNORE INTO seen VALUES (?)', (key, ))
+        self._written()
+
+    def seen_keys(self):
+        """:returns: the `set` of keys recorded by `seen()`"""
+        return set(row[0] for row in self.db.execute('SELECT key FROM seen'))
+
+    def pending_items(self):
+        """
+        :returns: the `list` of items put in the queue but not processed,
+            in the order they have been queued
+        """
+        return [json.loads(row[0]) for row in self.db.execute(
+            'SELECT item FROM items ORDER BY seq')]
+
+    def reset(self):
+        """Forget everything, to start a new pass."""
+        self.db.execute('DELETE FROM items')
+        self.db.execute('DELETE FROM admin')
+        self.db.execute('DELETE FROM seen')
+        self.commit()
+
+    def _written(self):
+        self.pending += 1
+        if self.pending >= self.commit_interval:
+            self.commit()
+
+    def commit(self):
+        self.db.commit()
+        self.pending = 0
+
+    def close(self):
+        self.commit()
+        self.db.close()
@@ -37,25 +37,29 @@ class Meta1Rebuilder(MetaRebuilder):
         if self._fill_queue_from_file(queue, **kwargs):
             return
 
-        prefixes = set()
+        # When resuming, skip the prefixes already queued
+        prefixes = self._seen_keys()
 
-        rawx_services = self.conscience.all_services('rawx')
-        for rawx in rawx_services:
-            cid = cid_from_name('_RDIR', rawx['addr'])
+        def _queue_prefix(cid, marker=None):
             prefix = cid[:self.meta1_digits]
-            if prefix not in prefixes:
-                queue.put(prefix.ljust(64, '0'))
-                prefixes.add(prefix)
-
-        accounts = self.api.account_list()
-        for account in accounts:
-            containers = self._full_container_list(account)
-            for container in containers:
-                cid = cid_from_name(account, container[0])
-                prefix = cid[:self.meta1_digits]
-                if prefix not in prefixes:
-                    queue.put(prefix.ljust(64, '0'))
-                    prefixes.add(prefix)
+            if prefix in prefixes:
+                self._update_marker(marker)
+                return
+            prefixes.add(prefix)
+            self._seen(prefix)
+            self._queue_item(queue, prefix.ljust(64, '0'), marker=marker)
+
+        for cid in self._pending_items():
+            self._queue_item(queue, cid)
+
+        if self._resume_marker() is None:
+            rawx_services = self.conscience.all_services('rawx')
+            for rawx in rawx_services:
+                _queue_prefix(cid_from_name('_RDIR', rawx['addr']))
+
+        for account, container in self._full_account_container_list():
+            _queue_prefix(cid_from_name(account, container),
+                          marker=(account, container))
 
     def _item_to_string(self, prefix, **kwargs):
         return 'prefix %s' % prefix
@@ -93,7 +97,8 @@ class Meta1Rebuilder(MetaRebuilder):
                     'total_errors': total_errors,
                     'total_errors_rate': 100 * total_errors /
                         float(total_prefixes_processed or 1)
-                })
+                }) + self._get_progress_report(total_prefixes_processed,
+                                               end_time)
 
 
 class Meta1RebuilderWorker(MetaRebuilderWorker):
@@ -32,12 +32,16 @@ class Meta2Rebuilder(MetaRebuilder):
         if self._fill_queue_from_file(queue, **kwargs):
             return
 
-        accounts = self.api.account_list()
-        for account in accounts:
-            containers = self._full_container_list(account)
-            for container in containers:
-                cid = cid_from_name(account, container[0])
-                queue.put(cid)
+        for cid in self._pending_items():
+            self._queue_item(queue, cid)
+        for account, container in self._full_account_container_list():
+            self._queue_item(queue, cid_from_name(account, container),
+                             marker=(account, container))
+
+    def _count_expected_items(self):
+        if self.input_file:
+            return super(Meta2Rebuilder, self)._count_expected_items()
+        return self._count_account_containers()
 
     def _item_to_string(self, cid, **kwargs):
         return 'reference %s' % cid
@@ -75,7 +79,8 @@ class Meta2Rebuilder(MetaRebuilder):
                     'total_errors': total_errors,
                     'total_errors_rate': 100 * total_errors /
                         float(total_references_processed or 1)
-                })
+                }) + self._get_progress_report(total_references_processed,
+                                               end_time)
 
 
 class Meta2RebuilderWorker(MetaRebuilderWorker):
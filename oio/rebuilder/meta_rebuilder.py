@@ -36,13 +36,43 @@ class MetaRebuilder(Rebuilder):
     def _fill_queue_from_file(self, queue, **kwargs):
         if self.input_file is None:
             return False
+        for item in self._pending_items():
+            self._queue_item(queue, item)
+        # The marker is the number of the last line queued
+        start_after = self._resume_marker() or 0
         with open(self.input_file, 'r') as ifile:
-            for line in ifile:
+            for lineno, line in enumerate(ifile, 1):
+                if lineno <= start_after:
+                    continue
                 stripped = line.strip()
                 if stripped and not stripped.startswith('#'):
-                    queue.put(stripped)
+                    self._queue_item(queue, stripped, marker=lineno)
         return True
 
+    def _full_account_container_list(self, **kwargs):
+        """
+        List the containers of all accounts, in the order of their
+        names, starting after the resume marker if there is one.
+
+        :returns: an iterator over (account, container name) tuples
+        """
+        marker = self._resume_marker()
+        for account in self.api.account_list():
+            listing_kwargs = dict(kwargs)
+            if marker is not None:
+                if account < marker[0]:
+                    continue
+                if account == marker[0]:
+                    listing_kwargs['marker'] = marker[1]
+            for container in self._full_container_list(account,
+                                                       **listing_kwargs):
+                yield account, container[0]
+
+    def _count_account_containers(self):
+        """Count the containers of all accounts."""
+        return sum(self.api.account_show(account).get('containers', 0)
+                   for account in self.api.account_list())
+
     def _full_container_list(self, account, **kwargs):
         listing = self.api.container_list(account, **kwargs)
         for element in listing:
@@ -0,0 +1,236 @@
+# Copyright (C) 2018 OpenIO SAS, as part of OpenIO SDS
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as
+# published by the Free Software Foundation, either version 3 of the
+# License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+from oio.common.green import sleep
+
+import time
+
+from oio.common.easy_value import int_value, float_value
+from oio.conscience.client import ConscienceClient
+
+
+MIB = 1024 * 1024
+LATENCY_TOLERANCE = 2.0
+SCORE_CHECK_INTERVAL = 30.0  # in seconds
+OFF_PEAK_FACTOR = 2.0
+ADJUST_INTERVAL = 1.0  # in seconds
+# Weight of the last observation in the moving average of the latency
+LATENCY_EWMA_WEIGHT = 0.2
+# Additive increase, as a fraction of the maximum rate
+RATE_INCREASE = 0.05
+# Multiplicative decrease
+RATE_DECREASE = 0.7
+# Latency recorded for a failed item, relative to the highest
+# acceptable latency: a failure (e.g. a timeout) is a sign of overload
+FAILURE_PENALTY = 2.0
+# Cost of a failed item when the size of the items is not known yet
+DEFAULT_ITEM_SIZE = MIB
+# Growth of the reference latency at each decrease, so that a cluster
+# which has become slower for good is not throttled forever
+LATENCY_RELAXATION = 1.05
+
+
+def parse_hours(hours):
+    """
+    Parse a range of hours like '22-6'.
+
+    :returns: a tuple with the first hour and the hour after the last one,
+        or None if `hours` is empty
+    """
+    if not hours:
+        return None
+    start, end = hours.split('-', 1)
+    return int(start) % 24, int(end) % 24
+
+
+class RateController(object):
+    """
+    Limit the number of bytes rebuilt per second by all the workers of
+    a rebuilder, adapting the limit to the load of the cluster:
+
+    - the limit grows additively while the time the workers need to move
+      a MiB stays close to the best observed, and shrinks multiplicatively
+      when it gets longer (the rawx services are getting slower)
+      or when items cannot be rebuilt (e.g. timeouts);
+    - failed items cost as much as the average rebuilt item;
+    - the bytes rebuilt from services with a low conscience score cost
+      more, as well as all bytes while the average score of the rawx
+      services (where the new chunks are written) is low;
+    - the maximum limit is multiplied by `off_peak_factor` during
+      `off_peak_hours`, when client traffic is low.
+    """
+
+    def __init__(self, bytes_per_second, min_bytes_per_second=None,
+                 latency_tolerance=LATENCY_TOLERANCE, off_peak_hours=None,
+                 off_peak_factor=OFF_PEAK_FACTOR, conscience=None,
+                 score_check_interval=SCORE_CHECK_INTERVAL, logger=None):
+        self.bytes_per_second = bytes_per_second
+        if min_bytes_per_second is None:
+            min_bytes_per_second = bytes_per_second / 10
+        self.min_bytes_per_second = max(min_bytes_per_second, 1)
+        self.latency_tolerance = latency_tolerance
+        self.off_peak_hours = parse_hours(off_peak_hours)
+        self.off_peak_factor = off_peak_factor
+        self.conscience = conscience
+        self.score_check_interval = score_check_interval
+        self.logger = logger
+        self.adjust_interval = ADJUST_INTERVAL
+        self.rate = float(bytes_per_second)
+        self.latency = None
+        self.best_latency = None
+        self.bytes_rebuilt = 0
+        self.items_rebuilt = 0
+        self.last_adjustment = 0
+        self.next_time = 0
+        self.scores = dict()
+        self.last_score_check = 0
+
+    @classmethod
+    def from_conf(cls, conf, logger=None):
+        """
+        Build a controller from the `bytes_per_second`,
+        `min_bytes_per_second`, `latency_tolerance`, `off_peak_hours`,
+        `off_peak_factor` and `score_check_interval` parameters
+        of a rebuilder configuration.
+
+        :returns: None if `bytes_per_second` is not set
+        """
+        bytes_per_second = int_value(conf.get('bytes_per_second'), 0)
+        if bytes_per_second <= 0:
+            return None
+        score_check_interval = float_value(
+            conf.get('score_check_interval'), SCORE_CHECK_INTERVAL)
+        conscience = None
+        if score_check_interval > 0:
+            conscience = ConscienceClient(conf, logger=logger)
+        return cls(
+            bytes_per_second,
+            min_bytes_per_second=int_value(
+                conf.get('min_bytes_per_second'), None),
+            latency_tolerance=float_value(
+                conf.get('latency_tolerance'), LATENCY_TOLERANCE),
+            off_peak_hours=conf.get('off_peak_hours'),
+            off_peak_factor=float_value(
+                conf.get('off_peak_factor'), OFF_PEAK_FACTOR),
+            conscience=conscience,
+            score_check_interval=score_check_interval,
+            logger=logger)
+
+    def is_off_peak(self, now=None):
+        if self.off_peak_hours is None:
+            return False
+        hour = time.localtime(now).tm_hour
+        start, end = self.off_peak_hours
+        if start <= end:
+            return start <= hour < end
+        return hour >= start or hour < end
+
+    def max_rate(self, now=None):
+        """Maximum number of bytes per second at the specified time."""
+        if self.is_off_peak(now):
+            return self.bytes_per_second * self.off_peak_factor
+        return self.bytes_per_second
+
+    @property
+    def item_size(self):
+        """Average number of bytes of the items rebuilt so far."""
+        if not self.items_rebuilt:
+            return DEFAULT_ITEM_SIZE
+        return self.bytes_rebuilt / float(self.items_rebuilt)
+
+    def _add_latency(self, latency):
+        if self.latency is None:
+            self.latency = latency
+        else:
+            self.latency += LATENCY_EWMA_WEIGHT * (latency - self.latency)
+
+    def update(self, nbytes, duration, items=1, failures=0, now=None):
+        """
+        Adjust the limit with the time a worker took to rebuild
+        `nbytes` bytes of `items` items, and fail to rebuild
+        `failures` items.
+        """
+        if items > 0 and nbytes > 0:
+            self.bytes_rebuilt += nbytes
+            self.items_rebuilt += items
+            # Items smaller than a MiB are mostly latency
+            self._add_latency(duration * MIB / max(nbytes, MIB))
+            if self.best_latency is None \
+                    or self.latency < self.best_latency:
+                self.best_latency = self.latency
+        elif failures <= 0:
+            return
+        if failures > 0 and self.best_latency is not None:
+            self._add_latency(max(
+                duration,
+                self.best_latency * self.latency_tolerance * FAILURE_PENALTY))
+
+        now = now or time.time()
+        if now - self.last_adjustment < self.adjust_interval:
+            return
+        self.last_adjustment = now
+        max_rate = self.max_rate(now)
+        if self.best_latency is None:
+            # Only failures so far
+            self.rate *= RATE_DECREASE
+        elif self.latency > self.best_latency * self.latency_tolerance:
+            self.rate *= RATE_DECREASE
+            self.best_latency *= LATENCY_RELAXATION
+        else:
+            self.rate += max_rate * RATE_INCREASE
+        self.rate = max(min(self.rate, max_rate), self.min_bytes_per_second)
+
+    def refresh_scores(self, now=None):
+        """Load the scores of the rawx services from the conscience."""
+        now = now or time.time()
+        if self.conscience is None \
+                or now - self.last_score_check < self.score_check_interval:
+            return
+        self.last_score_check = now
+        try:
+            self.scores = {srv['addr']: srv['score'] for srv
+                           in self.conscience.all_services('rawx')}
+        except Exception as exc:
+            if self.logger:
+                self.logger.warn('Failed to load rawx scores: %s', exc)
+
+    def score_factor(self, services=()):
+        """
+        :returns: the fraction of the limit the rebuild of an item
+            involving `services` may use, according to their scores
+        """
+        if not self.scores:
+            return 1.0
+        scores = [self.scores[service] for service in services
+                  if service in self.scores]
+        # Where the rebuilt chunks are written is not known in advance
+        scores.append(sum(self.scores.values()) / float(len(self.scores)))
+        return max(min(scores) / 100.0,
+                   self.min_bytes_per_second / float(self.bytes_per_second))
+
+    def wait(self, nbytes, services=(), failures=0):
+        """
+        Sleep as long as needed to stay under the limit, after
+        `nbytes` bytes have been rebuilt from `services`,
+        and `failures` items could not be rebuilt.
+        """
+        self.refresh_scores()
+        cost = (nbytes + failures * self.item_size) / \
+            self.score_factor(services)
+        now = time.time()
+        start = max(self.next_time, now)
+        self.next_time = start + cost / self.rate
+        if start > now:
+            sleep(start - now)
@@ -19,8 +19,10 @@ from oio.common.green import ratelimit, eventlet, threading, ContextPool
 import random
 import time
 
-from oio.common.easy_value import int_value
+from oio.common.easy_value import int_value, true_value
 from oio.common.logger import get_logger
+from oio.rebuilder.checkpoint import RebuilderCheckpoint
+from oio.rebuilder.scheduler import RebuildScheduler
 
 
 class Rebuilder(object):
@@ -31,6 +33,10 @@ class Rebuilder(object):
       `_fill_queue()`
       `_item_to_string()`
       `_get_report()`.
+
+    If `checkpoint_file` is configured, the progress of the pass is
+    recorded, and can be resumed (with `resume`) after an interruption.
+    In that case `_fill_queue()` must put items with `_queue_item()`.
     """
 
     def __init__(self, conf, logger, volume, input_file=None, **kwargs):
@@ -51,14 +57,29 @@ class Rebuilder(object):
         self.start_time = 0
         self.last_report = 0
         self.report_interval = int_value(conf.get('report_interval'), 3600)
+        self.total_expected_items = None
+        self.resumed_items = 0
+        # checkpoint
+        self.checkpoint_file = conf.get('checkpoint_file')
+        self.resume = true_value(conf.get('resume'))
+        self.checkpoint = None
+        # rate control shared by the workers
+        self.rate_controller = self._create_rate_controller()
 
     def rebuilder_pass(self, **kwargs):
+        self._open_checkpoint()
+        try:
+            return self._rebuilder_pass(**kwargs)
+        finally:
+            self._close_checkpoint()
+
+    def _rebuilder_pass(self, **kwargs):
         self.start_time = self.last_report = time.time()
         self.log_report('START', force=True)
 
         workers = list()
         with ContextPool(self.nworkers) as pool:
-            queue = eventlet.Queue(self.nworkers*10)
+            queue = self._create_queue(**kwargs)
             # spawn workers to rebuild
             for i in range(self.nworkers):
                 worker = self._create_worker(**kwargs)
@@ -72,6 +93,150 @@ class Rebuilder(object):
         self.log_report('DONE', force=True)
         return self.total_errors == 0
 
+    def _open_checkpoint(self):
+        if self.total_expected_items is None:
+            self.total_expected_items = self._count_expected_items()
+        if not self.checkpoint_file:
+            return
+        self.checkpoint = RebuilderCheckpoint(self.checkpoint_file)
+        if not self.resume:
+            self.checkpoint.reset()
+            self.checkpoint.set('expected', self.total_expected_items)
+            return
+        with self.lock_counters:
+            self._set_counters_without_lock(
+                self.checkpoint.get('counters', dict()))
+            self.resumed_items = self.total_items_processed
+        self.total_expected_items = self.checkpoint.get(
+            'expected', self.total_expected_items)
+        self.logger.info('Resuming from %s with %d pending items '
+                         '(%d items already processed)',
+                         self.checkpoint.marker, len(self.checkpoint),
+                         self.resumed_items)
+
+    def _close_checkpoint(self):
+        if self.checkpoint is not None:
+            self.checkpoint.close()
+            self.checkpoint = None
+
+    def _count_expected_items(self):
+        """
+        Count the items which will be processed by the pass
+        (None if unknown). By default, count the lines of the input file.
+        """
+        if not self.input_file:
+            return None
+        with open(self.input_file, 'r') as ifile:
+            return sum(1 for line in ifile
+                       if line.strip() and not line.strip().startswith('#'))
+
+    def _get_counters_without_lock(self):
+        """Get the total counters to save in the checkpoint."""
+        return {'items_processed':
+                self.total_items_processed + self.items_processed,
+                'errors': self.total_errors + self.errors}
+
+    def _set_counters_without_lock(self, counters):
+        """Restore the total counters saved in the checkpoint."""
+        self.total_items_processed = counters.get('items_processed', 0)
+        self.total_errors = counters.get('errors', 0)
+
+    def _checkpoint_entries(self, item):
+        """
+        :returns: a `list` of (key, JSON serializable item) tuples
+            to record in the checkpoint for a queue item
+        """
+        return [(str(item), item)]
+
+    def _pending_items(self):
+        """
+        :returns: the items queued but not processed by the pass
+            being resumed (to put in the queue first)
+        """
+        if self.checkpoint is None or not self.resume:
+            return list()
+        return self.checkpoint.pending_items()
+
+    def _resume_marker(self):
+        """
+        :returns: the marker passed to `_queue_item()` with the last item
+            queued by the pass being resumed, or None
+        """
+        if self.checkpoint is None or not self.resume:
+            return None
+        return self.checkpoint.marker
+
+    def _seen_keys(self):
+        """
+        :returns: the `set` of keys recorded by `_seen()` during
+            the pass being resumed
+        """
+        if self.checkpoint is None or not self.resume:
+            return set()
+        return self.checkpoint.seen_keys()
+
+    def _seen(self, key):
+        """Record in the checkpoint that an item has been seen."""
+        if self.checkpoint is not None:
+            self.checkpoint.seen(key)
+
+    def _update_marker(self, marker):
+        """Record where to resume the listing of items from."""
+        if self.checkpoint is not None and marker is not None:
+            self.checkpoint.queued([], marker=marker)
+
+    def _queue_item(self, queue, item, marker=None, **kwargs):
+        """
+        Put an item in the queue, and record it in the checkpoint.
+
+        :param marker: JSON serializable value telling where to resume
+            the listing of items from, after this one
+        """
+        if self.checkpoint is not None:
+            self.checkpoint.queued(self._checkpoint_entries(item),
+                                   marker=marker)
+        queue.put(item, **kwargs)
+
+    def item_done(self, item):
+        """Remove an item which has been processed from the checkpoint."""
+        if self.checkpoint is None:
+            return
+        with self.lock_counters:
+            counters = self._get_counters_without_lock()
+        self.checkpoint.done([key for key, _ in
+                              self._checkpoint_entries(item)])
+        self.checkpoint.set('counters', counters)
+
+    def _get_progress_report(self, total_items_processed, end_time):
+        """
+        :returns: the progress of the pass and its estimated time
+            of completion, if the number of items is known
+        """
+        if self.total_expected_items is None:
+            return ''
+        rate = (total_items_processed - self.resumed_items) / \
+            ((end_time - self.start_time) or 0.00001)
+        remaining = max(self.total_expected_items - total_items_processed, 0)
+        return ' progress=%d/%d %.2f%% eta=%s' % (
+            total_items_processed, self.total_expected_items,
+            100 * total_items_processed /
+            float(self.total_expected_items or 1),
+            '%ds' % (remaining / rate) if rate > 0 else 'unknown')
+
+    def _create_rate_controller(self):
+        """
+        Create the `RateController` shared by the workers,
+        or None to limit the number of items per second of each worker.
+        """
+        return None
+
+    def _create_queue(self, **kwargs):
+        """
+        Create the queue of items shared by the workers
+        (a FIFO `RebuildScheduler` by default).
+        """
+        return RebuildScheduler(self.nworkers * 10)
+
     def _create_worker(self, **kwargs):
         raise NotImplementedError()
 
@@ -144,6 +309,7 @@ class RebuilderWorker(object):
         self.max_items_per_second = int_value(
             rebuilder.conf.get('items_per_second'), 30)
         self.random_wait = rebuilder.conf.get('random_wait')
+        self.rate_controller = rebuilder.rate_controller
 
     def update_processed(self, item, info, error=None, **kwargs):
         return self.rebuilder.update_processed(item, info, error=error,
@@ -157,20 +323,60 @@ class RebuilderWorker(object):
             info = None
             err = None
             item = queue.get()
+            services = queue.services(item)
+            start = time.time()
             try:
                 info = self._rebuild_one(item, **kwargs)
             except Exception as exc:
                 err = str(exc)
-            queue.task_done()
-
-            self.update_processed(item, info, error=err, **kwargs)
+            duration = time.time() - start
+            try:
+                self.update_processed(item, info, error=err, **kwargs)
+                self.rebuilder.item_done(item)
+            finally:
+                queue.task_done(item)
             self.log_report(**kwargs)
 
-            self.items_run_time = ratelimit(self.items_run_time,
-                                            self.max_items_per_second)
+            if self.rate_controller is not None:
+                nbytes = self._count_bytes(item, info)
+                failures = self._count_failures(item, info, err)
+                self.rate_controller.update(
+                    nbytes, duration,
+                    items=self._count_items(item) - failures,
+                    failures=failures)
+                self.rate_controller.wait(nbytes, services,
+                                          failures=failures)
+                continue
+            self.items_run_time = ratelimit(
+                self.items_run_time, self.max_items_per_second,
+                increment=self._count_items(item))
             if self.random_wait:
                 eventlet.sleep(random.randint(0, self.random_wait) / 1.0e6)
 
+    def _count_items(self, item):
+        """
+        Number of items to account for the rate limiting, when
+        a queue item groups several of them.
+        """
+        return 1
+
+    def _count_bytes(self, item, info):
+        """
+        Number of bytes moved to rebuild `item`, for the rate controller.
+
+        :param info: what `_rebuild_one()` returned (None on error)
+        """
+        return 0
+
+    def _count_failures(self, item, info, error):
+        """
+        Number of items which could not be rebuilt,
+        for the rate controller.
+        """
+        if error is not None:
+            return self._count_items(item)
+        return 0
+
     def _rebuild_one(self, item, **kwargs):
         """
         Rebuild one item from the queue previously filled
@@ -0,0 +1,121 @@
+# Copyright (C) 2018 OpenIO SAS, as part of OpenIO SDS
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as
+# published by the Free Software Foundation, either version 3 of the
+# License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+from oio.common.green import threading
+
+import heapq
+from collections import defaultdict
+from itertools import count
+
+
+class RebuildScheduler(object):
+    """
+    Bounded queue of items to rebuild, used by rebuilder workers
+    in place of a FIFO queue.
+
+    Items are served by priority (the lowest first), then in the order
+    they have been put. An item can be associated with a list of
+    services (e.g. the rawx services it will read from): it is not served
+    while one of these services already has `max_per_service` items
+    in progress.
+    """
+
+    def __init__(self, maxsize=0, max_per_service=0):
+        self.maxsize = maxsize
+        self.max_per_service = max_per_service
+        self._heap = list()
+        self._counter = count()
+        self._cond = threading.Condition()
+        self._unfinished = 0
+        # Number of items in progress, by service
+        self.running = defaultdict(int)
+        # Services involved by each item in progress
+        self._in_progress = dict()
+
+    def __len__(self):
+        return len(self._heap)
+
+    def put(self, item, priority=0, services=None):
+        """
+        Add an item, blocking while the queue is full.
+
+        :param priority: lower values are served first
+        :param services: `list` of services involved by `item`
+        """
+        with self._cond:
+            while self.maxsize > 0 and len(self._heap) >= self.maxsize:
+                self._cond.wait()
+            heapq.heappush(self._heap, (priority, next(self._counter), item,
+                                        tuple(services or ())))
+            self._unfinished += 1
+            self._cond.notify_all()
+
+    def _can_start(self, services):
+        if self.max_per_service <= 0:
+            return True
+        return all(self.running.get(service, 0) < self.max_per_service
+                   for service in services)
+
+    def _pop(self):
+        if not self._heap:
+            return None
+        if self._can_start(self._heap[0][3]):
+            return heapq.heappop(self._heap)
+        for entry in sorted(self._heap):
+            if self._can_start(entry[3]):
+                self._heap.remove(entry)
+                heapq.heapify(self._heap)
+                return entry
+        return None
+
+    def get(self):
+        """
+        Get the next item to rebuild, blocking until there is one that
+        does not exceed the limit of items in progress per service.
+        `task_done()` must be called with this item when it is processed.
+        """
+        with self._cond:
+            while True:
+                entry = self._pop()
+                if entry is not None:
+                    break
+                self._cond.wait()
+            _, _, item, services = entry
+            for service in services:
+                self.running[service] += 1
+            self._in_progress[id(item)] = services
+            self._cond.notify_all()
+            return item
+
+    def services(self, item):
+        """Get the services involved by an item in progress."""
+        with self._cond:
+            return self._in_progress.get(id(item), ())
+
+    def task_done(self, item=None):
+        """Tell that `item`, obtained by `get()`, has been processed."""
+        with self._cond:
+            for service in self._in_progress.pop(id(item), ()):
+                self.running[service] -= 1
+                if self.running[service] <= 0:
+                    del self.running[service]
+            self._unfinished -= 1
+            self._cond.notify_all()
+
+    def join(self):
+        """Block until all items have been processed."""
+        with self._cond:
+            while self._unfinished > 0:
+                self._cond.wait()
@@ -460,6 +460,21 @@ class TestAccountBackend(BaseTestCase):
         self.assertEqual([c[0] for c in listing],
                          ['3-0049-', '3-0049-0049'])
 
+    def test_list_containers_counters(self):
+        backend = AccountBackend({}, self.conn)
+        account_id = 'test'
+        backend.create_account(account_id)
+        mtime = Timestamp(time()).normal
+        for name, objects in (('a/1', 1), ('a0', 2), ('b', 3)):
+            backend.update_container(account_id, name, mtime, 0,
+                                     objects, objects * 10)
+
+        listing = backend.list_containers(account_id, delimiter='/',
+                                          limit=10)
+        self.assertEqual([['a/', 0, 0, 1, 0.0],
+                          ['a0', 2, 20, 0, float(mtime)],
+                          ['b', 3, 30, 0, float(mtime)]], listing)
+
     def test_refresh_account(self):
         backend = AccountBackend({}, self.conn)
         account_id = random_str(16)
@@ -493,6 +508,100 @@ class TestAccountBackend(BaseTestCase):
         self.assertEqual(self.conn.hget(account_key, 'objects'),
                          str(total_objects))
 
+    def test_refresh_account_batch(self):
+        backend = AccountBackend({}, self.conn)
+        account_id = random_str(16)
+        account_key = 'account:%s' % account_id
+        self.assertEqual(backend.create_account(account_id), account_id)
+
+        for i in range(10):
+            backend.update_container(account_id, "container%d" % i,
+                                     Timestamp(time()).normal, 0, 1, 10)
+        self.conn.hset(account_key, 'bytes', 1)
+        self.conn.hset(account_key, 'objects', 2)
+
+        progress = backend.refresh_account_batch(account_id, batch_size=4)
+        self.assertEqual({'batch': 4, 'scanned': 4, 'total': 10,
+                          'done': False}, progress)
+        status = backend.status()
+        self.assertEqual(4, status['refreshing'][account_id]['scanned'])
+        self.assertEqual(10, status['refreshing'][account_id]['total'])
+        # counters are only swapped at the end
+        self.assertEqual(self.conn.hget(account_key, 'bytes'), '1')
+
+        # update an already summed container, and a new one
+        backend.update_container(account_id, "container0",
+                                 Timestamp(time()).normal, 0, 5, 50)
+        backend.update_container(account_id, "container99",
+                                 Timestamp(time()).normal, 0, 1, 10)
+
+        progress = backend.refresh_account_batch(account_id, batch_size=4)
+        self.assertFalse(progress['done'])
+        progress = backend.refresh_account_batch(account_id, batch_size=4)
+        self.assertEqual({'batch': 3, 'scanned': 11, 'total': 10,
+                          'done': True}, progress)
+        self.assertEqual(self.conn.hget(account_key, 'objects'), '15')
+        self.assertEqual(self.conn.hget(account_key, 'bytes'), '150')
+        self.assertNotIn(account_id, backend.status()['refreshing'])
+        self.assertFalse(self.conn.exists('refresh:%s' % account_id))
+
+    def test_refresh_account_batch_byte_order(self):
+        backend = AccountBackend({}, self.conn)
+        account_id = random_str(16)
+        account_key = 'account:%s' % account_id
+        self.assertEqual(backend.create_account(account_id), account_id)
+
+        # In byte order, 'B' < 'a' < 'c' (not with most locales)
+        for name in ('B', 'a', 'c'):
+            backend.update_container(account_id, name,
+                                     Timestamp(time()).normal, 0, 1, 10)
+        progress = backend.refresh_account_batch(account_id, batch_size=2)
+        self.assertFalse(progress['done'])
+
+        # 'B' has already been summed
+        backend.update_container(account_id, 'B',
+                                 Timestamp(time()).normal, 0, 5, 50)
+        progress = backend.refresh_account_batch(account_id, batch_size=2)
+        self.assertTrue(progress['done'])
+        self.assertEqual(self.conn.hget(account_key, 'objects'), '7')
+        self.assertEqual(self.conn.hget(account_key, 'bytes'), '70')
+
+    def test_update_containers(self):
+        backend = AccountBackend({}, self.conn)
+        account_id = 'test'
+        self.assertEqual(backend.create_account(account_id), account_id)
+
+        mtime = Timestamp(time()).normal
+        updates = [{'name': 'c1', 'mtime': mtime, 'objects': 1, 'bytes': 10},
+                   {'name': 'c2', 'mtime': mtime, 'objects': 2, 'bytes': 20},
+                   {'mtime': mtime}]
+        results = backend.update_containers(account_id, updates)
+        self.assertEqual(['c1', 'c2', None], [r['name'] for r in results])
+        self.assertEqual([200, 200, 400], [r['status'] for r in results])
+
+        res = self.conn.zrangebylex('containers:%s' % account_id, '-', '+')
+        self.assertEqual(['c1', 'c2'], res)
+        account = self.conn.hgetall('account:%s' % account_id)
+        self.assertEqual('3', account['objects'])
+        self.assertEqual('30', account['bytes'])
+
+        # one outdated update, one new
+        sleep(.00001)
+        updates = [{'name': 'c1', 'mtime': mtime, 'objects': 5, 'bytes': 50},
+                   {'name': 'c2', 'mtime': Timestamp(time()).normal,
+                    'objects': 0, 'bytes': 0}]
+        results = backend.update_containers(account_id, updates)
+        self.assertEqual([409, 200], [r['status'] for r in results])
+        self.assertIn('No update needed', results[0]['message'])
+        account = self.conn.hgetall('account:%s' % account_id)
+        self.assertEqual('1', account['objects'])
+        self.assertEqual('10', account['bytes'])
+
+        # no account autocreation
+        results = backend.update_containers('missing', updates[1:],
+                                            autocreate_account=False)
+        self.assertEqual(404, results[0]['status'])
+
     def test_update_container_wrong_timestamp_format(self):
         backend = AccountBackend({}, self.conn)
         account_id = 'test'
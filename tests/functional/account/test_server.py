@@ -77,6 +77,26 @@ class TestAccountServer(BaseTestCase):
                              data=data, query_string={'id': self.account_id})
         self.assertEqual(resp.status_code, 200)
 
+    def test_account_container_update_many(self):
+        mtime = Timestamp(time()).normal
+        data = [{'name': 'foo', 'mtime': mtime, 'objects': 1, 'bytes': 2},
+                {'name': 'bar', 'mtime': mtime, 'objects': 3, 'bytes': 4}]
+        resp = self.app.post('/v1.0/account/container/update_many',
+                             data=json.dumps(data),
+                             query_string={'id': self.account_id})
+        self.assertEqual(resp.status_code, 200)
+        results = self.json_loads(resp.data)
+        self.assertEqual([{'name': 'foo', 'status': 200},
+                          {'name': 'bar', 'status': 200}], results)
+
+        # same event again
+        resp = self.app.post('/v1.0/account/container/update_many',
+                             data=json.dumps(data[:1]),
+                             query_string={'id': self.account_id})
+        self.assertEqual(resp.status_code, 200)
+        results = self.json_loads(resp.data)
+        self.assertEqual(409, results[0]['status'])
+
     def test_account_containers(self):
         args = {'id': self.account_id}
         resp = self.app.post('/v1.0/account/containers',
@@ -31,6 +31,9 @@ def set_http_requests(cb):
             self.resp = cb(self.req)
             return self.resp
 
+        def release(self):
+            pass
+
     class ConnectionRecord(object):
         def __init__(self):
             self.records = []
@@ -38,7 +41,7 @@ def set_http_requests(cb):
         def __len__(self):
             return len(self.records)
 
-        def __call__(self, host, method, path, headers):
+        def __call__(self, host, method, path, headers, **_kwargs):
             req = {'host': host,
                    'method': method,
                    'path': path,
@@ -124,6 +127,9 @@ def fake_http_connect(*status_iter, **kwargs):
         def close(self):
             self.closed = True
 
+        def release(self):
+            self.close()
+
     if isinstance(kwargs.get('headers'), (list, tuple)):
         headers_iter = iter(kwargs['headers'])
     else:
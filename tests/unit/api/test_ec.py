@@ -24,8 +24,9 @@ import hashlib
 from copy import deepcopy
 from mock import patch
 from oio.common.storage_method import STORAGE_METHODS
+from oio.api import io
 from oio.api.ec import EcMetachunkWriter, ECChunkDownloadHandler, \
-    ECRebuildHandler
+    ECRebuildHandler, ECSegmenter, get_coding_pool
 from oio.common import exceptions as exc, green
 from oio.common.constants import CHUNK_HEADERS
 from tests.unit.api import empty_stream, decode_chunked_body, \
@@ -239,7 +240,7 @@ class TestEC(unittest.TestCase):
             self.assertRaises(Exception, handler.stream, source,
                               size)
 
-    def test_write_transfer(self):
+    def _test_write_transfer(self, **kwargs):
         checksum = self.checksum()
         segment_size = self.storage_method.ec_segment_size
         test_data = ('1234' * segment_size)[:-10]
@@ -258,7 +259,8 @@ class TestEC(unittest.TestCase):
 
         with set_http_connect(*resps, cb_body=cb_body):
             handler = EcMetachunkWriter(self.sysmeta, self.meta_chunk(),
-                                        checksum, self.storage_method)
+                                        checksum, self.storage_method,
+                                        **kwargs)
             bytes_transferred, checksum, chunks = handler.stream(source, size)
 
         self.assertEqual(len(test_data), bytes_transferred)
@@ -296,6 +298,12 @@ class TestEC(unittest.TestCase):
         self.assertEqual(
             test_data_checksum, self.checksum(final_data).hexdigest())
 
+    def test_write_transfer(self):
+        self._test_write_transfer()
+
+    def test_write_transfer_coding_pool(self):
+        self._test_write_transfer(coding_pool=get_coding_pool(3))
+
     def _test_write_checksum_algo(self, expected_checksum, **kwargs):
         global_checksum = self.checksum()
         source = empty_stream()
@@ -344,6 +352,50 @@ class TestEC(unittest.TestCase):
             # Should be called only once for the metachunk
             algo_new.assert_called_once_with('md5')
 
+    def _test_segmenter(self, coding_pool=None):
+        segment_size = self.storage_method.ec_segment_size
+        nb = self.storage_method.ec_nb_data + self.storage_method.ec_nb_parity
+        test_data = ('1234' * segment_size)[:-777]
+        expected = self._make_ec_chunks(test_data)
+
+        # feed the segmenter with pieces of various sizes,
+        # some of them spanning several segments
+        sizes = [1, 65536, segment_size - 3, 2 * segment_size + 5, 1000]
+        segmenter = ECSegmenter(self.storage_method, nb,
+                                coding_pool=coding_pool)
+        chunks = [[] for _ in range(nb)]
+        offset = 0
+        while offset < len(test_data):
+            size = sizes[offset % len(sizes)]
+            result = segmenter.feed(test_data[offset:offset + size])
+            offset += size
+            if result is None:
+                continue
+            self.assertEqual(nb, len(result))
+            for i, frags in enumerate(result):
+                chunks[i].extend(frags)
+        for i, frags in enumerate(segmenter.flush()):
+            chunks[i].extend(frags)
+
+        self.assertEqual(expected, [''.join(frags) for frags in chunks])
+
+    def test_segmenter(self):
+        self._test_segmenter()
+
+    def test_segmenter_coding_pool(self):
+        self._test_segmenter(coding_pool=get_coding_pool(3))
+
+    def test_get_coding_pool(self):
+        self.assertIsNone(get_coding_pool(None))
+        self.assertIsNone(get_coding_pool('1'))
+        self.assertEqual(4, get_coding_pool('4').size)
+        self.assertRaises(ValueError, get_coding_pool, 'four')
+
+    def test_segmenter_empty(self):
+        nb = self.storage_method.ec_nb_data + self.storage_method.ec_nb_parity
+        segmenter = ECSegmenter(self.storage_method, nb)
+        self.assertEqual([[]] * nb, segmenter.flush())
+
     def _make_ec_chunks(self, data):
         segment_size = self.storage_method.ec_segment_size
 
@@ -361,7 +413,7 @@ class TestEC(unittest.TestCase):
         ec_chunks = [''.join(frag) for frag in zip(*fragments_data)]
         return ec_chunks
 
-    def test_read(self):
+    def _test_read(self, **kwargs):
         segment_size = self.storage_method.ec_segment_size
 
         data = ('1234' * segment_size)[:-10]
@@ -399,7 +451,7 @@ class TestEC(unittest.TestCase):
         with set_http_connect(*resps, body_iter=body_iter):
             handler = ECChunkDownloadHandler(self.storage_method,
                                              meta_chunk, meta_start,
-                                             meta_end, headers)
+                                             meta_end, headers, **kwargs)
             stream = handler.get_stream()
             body = ''
             for part in stream:
@@ -408,6 +460,76 @@ class TestEC(unittest.TestCase):
             self.assertEqual(len(data), len(body))
             self.assertEqual(data, body)
 
+    def test_read(self):
+        self._test_read()
+
+    def test_read_coding_pool(self):
+        self._test_read(ec_coding_threads=3)
+
+    def _test_read_extra_fragments(self, slow_reads=1, **kwargs):
+        segment_size = self.storage_method.ec_segment_size
+        data = ('1234' * segment_size)[:-10]
+        ec_chunks = self._make_ec_chunks(data)
+        meta_chunk = self.meta_chunk_copy()
+        meta_chunk[0]['size'] = len(data)
+        reads = defaultdict(int)
+
+        class SlowResponse(FakeResponse):
+            def read(self, amt=0):
+                reads[self.host] += 1
+                if self.host == '127.0.0.1:7000' and reads[self.host] > 1:
+                    green.sleep(slow_reads)
+                return super(SlowResponse, self).read(amt)
+
+        def get_response(req):
+            resp = SlowResponse(200, ec_chunks[int(req['path'][-1])])
+            resp.host = req['host']
+            return resp
+
+        with set_http_requests(get_response) as conn_record:
+            handler = ECChunkDownloadHandler(self.storage_method,
+                                             meta_chunk, None, None, {},
+                                             **kwargs)
+            start = io.monotonic_time()
+            stream = handler.get_stream()
+            body = ''
+            for part in stream:
+                for body_chunk in part['iter']:
+                    body += body_chunk
+            elapsed = io.monotonic_time() - start
+            stream.close()
+        self.assertEqual(data, body)
+        return elapsed, len(conn_record), reads
+
+    def test_read_extra_fragments(self):
+        elapsed, nb_conns, _ = self._test_read_extra_fragments(
+            ec_extra_fragments=1)
+        self.assertEqual(7, nb_conns)
+        # the slow fragment has not been waited for
+        self.assertLess(elapsed, 1.0)
+
+    def test_read_extra_fragments_drop_slow(self):
+        with patch('oio.api.ec.EC_MAX_FRAGMENT_LAG', 0):
+            _, _, reads = self._test_read_extra_fragments(
+                slow_reads=0.1, ec_extra_fragments=2)
+        # the slow source has been dropped before the end
+        self.assertLess(reads['127.0.0.1:7000'], reads['127.0.0.1:7001'])
+
+    def test_read_extra_fragments_latency(self):
+        latency = io.LatencyTracker()
+        latency.record('127.0.0.1:7000', 1.0)
+        latency.record('127.0.0.1:7001', 0.5)
+        latency.record('127.0.0.1:7002', 0.1)
+        meta_chunk = self.meta_chunk_copy()
+        meta_chunk[0]['size'] = 1024
+        handler = ECChunkDownloadHandler(self.storage_method,
+                                         meta_chunk, None, None, {},
+                                         ec_extra_fragments=1,
+                                         latency=latency)
+        ranked = [c['num'] for c in handler._ranked_chunks()]
+        # services never measured are ranked with the median
+        self.assertEqual([2, 1, 3, 4, 5, 6, 7, 0], ranked)
+
     def test_read_advanced(self):
         segment_size = self.storage_method.ec_segment_size
         test_data = ('1234' * segment_size)[:-657]
@@ -754,6 +876,101 @@ class TestEC(unittest.TestCase):
                              self.checksum(missing_chunk_body).hexdigest())
             self.assertEqual(len(conn_record), nb - 1)
 
+    def _test_rebuild_several(self, coding_pool=None):
+        test_data = ('1234' * self.storage_method.ec_segment_size)[:-777]
+
+        ec_chunks = self._make_ec_chunks(test_data)
+
+        # lose one data and one parity fragment
+        missing_bodies = [ec_chunks.pop(-1), ec_chunks.pop(1)]
+
+        meta_chunk = self.meta_chunk_copy()
+        missing = [meta_chunk.pop(-1)['num'], meta_chunk.pop(1)['num']]
+
+        responses = [FakeResponse(200, ec_chunk, {})
+                     for ec_chunk in ec_chunks]
+
+        def get_response(req):
+            return responses.pop(0) if responses else FakeResponse(404)
+
+        with set_http_requests(get_response) as conn_record:
+            handler = ECRebuildHandler(
+                meta_chunk, missing, self.storage_method,
+                coding_pool=coding_pool)
+            results = ['', '']
+            for frags in handler.rebuild():
+                self.assertEqual(2, len(frags))
+                for i, frag in enumerate(frags):
+                    results[i] += frag
+            for result, missing_body in zip(results, missing_bodies):
+                self.assertEqual(self.checksum(missing_body).hexdigest(),
+                                 self.checksum(result).hexdigest())
+            # The remaining fragments have been read only once
+            self.assertEqual(len(conn_record), len(meta_chunk))
+
+    def test_rebuild_several(self):
+        self._test_rebuild_several()
+
+    def test_rebuild_several_coding_pool(self):
+        coding_pool = get_coding_pool(2)
+        with patch.object(coding_pool, 'map',
+                          wraps=coding_pool.map) as coding_map:
+            self._test_rebuild_several(coding_pool=coding_pool)
+        self.assertGreater(coding_map.call_count, 1)
+
+    def test_rebuild_read_error(self):
+        test_data = ('1234' * self.storage_method.ec_segment_size)[:-777]
+        ec_chunks = self._make_ec_chunks(test_data)
+        ec_chunks.pop(1)
+        meta_chunk = self.meta_chunk_copy()
+        missing = meta_chunk.pop(1)['num']
+
+        responses = [FakeResponse(200, ec_chunk, {})
+                     for ec_chunk in ec_chunks]
+        # The second fragment of a source cannot be read
+        broken = responses[2]
+        reads = [0]
+
+        def _read(amt=0):
+            reads[0] += 1
+            if reads[0] > 1:
+                raise IOError('disk failure')
+            return broken.stream.read(amt)
+        broken.read = _read
+
+        def get_response(req):
+            return responses.pop(0) if responses else FakeResponse(404)
+
+        with set_http_requests(get_response):
+            handler = ECRebuildHandler(
+                meta_chunk, missing, self.storage_method)
+            stream = handler.rebuild()
+            # The rebuilt data must not be silently truncated
+            self.assertRaises(IOError, ''.join, stream)
+
+    def test_rebuild_premature_close(self):
+        test_data = ('1234' * self.storage_method.ec_segment_size)[:-777]
+        ec_chunks = self._make_ec_chunks(test_data)
+        ec_chunks.pop(1)
+        meta_chunk = self.meta_chunk_copy()
+        missing = meta_chunk.pop(1)['num']
+
+        responses = [FakeResponse(200, ec_chunk, {})
+                     for ec_chunk in ec_chunks]
+        # A source is closed after its first fragment, like httplib
+        # does when the connection is closed early
+        fragment_size = self.storage_method.ec_fragment_size
+        responses[2] = FakeResponse(200, ec_chunks[2][:fragment_size], {})
+
+        def get_response(req):
+            return responses.pop(0) if responses else FakeResponse(404)
+
+        with set_http_requests(get_response):
+            handler = ECRebuildHandler(
+                meta_chunk, missing, self.storage_method)
+            stream = handler.rebuild()
+            self.assertRaises(exc.SourceReadError, ''.join, stream)
+
     def test_rebuild_errors(self):
         test_data = ('1234' * self.storage_method.ec_segment_size)[:-777]
 
@@ -13,9 +13,12 @@
 # You should have received a copy of the GNU Lesser General Public
 # License along with this library.
 
+import tempfile
 import unittest
-from mock import patch
-from oio.api.io import ChunkReader, discard_bytes, MetachunkWriter
+from io import BytesIO
+from mock import patch, MagicMock as Mock
+from oio.api.io import ChunkReader, discard_bytes, MetachunkWriter, \
+    MetachunkPreparer, LatencyTracker, LATENCY_MIN_SAMPLES, MappedFile
 from oio.common import exceptions
 from oio.common import green
 from oio.common.storage_method import STORAGE_METHODS
@@ -197,3 +200,101 @@ class MetachunkWriterTest(unittest.TestCase):
         self.assertRaises(exceptions.SourceReadError,
                           self.mcw.quorum_or_fail, successes, failures)
         self._check_message(successes, failures)
+
+
+class MetachunkPreparerTest(unittest.TestCase):
+    """Test oio.api.io.MetachunkPreparer class."""
+
+    def _prepare(self, size):
+        nb_metachunks = max(size // 1024, 1)
+        chunks = [{'url': 'http://127.0.0.1:7000/%d.%d' % (pos, i),
+                   'pos': str(pos)}
+                  for i in range(2) for pos in range(nb_metachunks)]
+        return {'chunk_method': 'plain/nb_copy=2',
+                'chunk_size': 1024}, chunks
+
+    def _make_preparer(self, **kwargs):
+        container = Mock()
+        container.content_prepare.side_effect = \
+            lambda _a, _c, _o, size, **_kw: self._prepare(size)
+        return container, MetachunkPreparer(
+            container, 'acct', 'ct', 'obj', **kwargs)
+
+    def _check_metachunks(self, prep, nb_metachunks):
+        it = prep()
+        for pos in range(nb_metachunks):
+            meta_chunk = next(it)
+            self.assertEqual(2, len(meta_chunk))
+            for chunk in meta_chunk:
+                self.assertEqual(str(pos), chunk['pos'])
+        self.assertEqual(2 * nb_metachunks, len(prep.all_chunks_so_far()))
+
+    def test_prepare_one_by_one(self):
+        container, prep = self._make_preparer()
+        self._check_metachunks(prep, 5)
+        self.assertEqual(5, container.content_prepare.call_count)
+
+    def test_prepare_prefetch(self):
+        container, prep = self._make_preparer(metachunk_prefetch=3)
+        self._check_metachunks(prep, 5)
+        # 1 for the first metachunk, then 3 metachunks per request
+        self.assertEqual(3, container.content_prepare.call_count)
+        self.assertEqual(3 * 1024,
+                         container.content_prepare.call_args[0][3])
+
+
+class LatencyTrackerTest(unittest.TestCase):
+
+    def test_percentile(self):
+        latency = LatencyTracker()
+        for i in range(1, 101):
+            latency.record('127.0.0.1:600%d' % (i % 2), i / 1000.0)
+        self.assertEqual(0.05, latency.percentile(50))
+        self.assertEqual(0.095, latency.percentile(95))
+        self.assertEqual(0.1, latency.percentile(100))
+        self.assertEqual(0.1, latency.percentile(100, '127.0.0.1:6000'))
+        self.assertEqual(0.099, latency.percentile(100, '127.0.0.1:6001'))
+
+    def test_not_enough_samples(self):
+        latency = LatencyTracker()
+        for _ in range(LATENCY_MIN_SAMPLES - 1):
+            latency.record('127.0.0.1:6000', 0.1)
+        self.assertIsNone(latency.percentile(50))
+        self.assertIsNone(latency.percentile(50, '127.0.0.1:6001'))
+
+    def test_window(self):
+        latency = LatencyTracker(window=2)
+        self.assertIsNone(latency.mean('127.0.0.1:6000'))
+        for val in (10.0, 1.0, 3.0):
+            latency.record('127.0.0.1:6000', val)
+        self.assertEqual(2.0, latency.mean('127.0.0.1:6000'))
+
+    def test_estimate(self):
+        latency = LatencyTracker()
+        self.assertEqual(0.0, latency.estimate('127.0.0.1:6000'))
+        for i, val in enumerate((0.3, 0.1, 0.2)):
+            latency.record('127.0.0.1:600%d' % i, val)
+        self.assertEqual(0.1, latency.estimate('127.0.0.1:6001'))
+        # never measured: the median of the others
+        self.assertEqual(0.2, latency.estimate('127.0.0.1:6009'))
+
+
+class MappedFileTest(unittest.TestCase):
+
+    def test_not_mappable(self):
+        self.assertIsNone(MappedFile.from_source(BytesIO('data')))
+        with tempfile.TemporaryFile() as empty:
+            self.assertIsNone(MappedFile.from_source(empty))
+
+    def test_read(self):
+        with tempfile.TemporaryFile() as source:
+            source.write('0123456789')
+            source.seek(2)
+            mapped = MappedFile.from_source(source)
+        self.assertEqual(8, mapped.remaining)
+        self.assertEqual('2', str(mapped.peek()))
+        self.assertEqual('2345', str(mapped.read(4)))
+        self.assertEqual('6789', str(mapped.read()))
+        self.assertEqual('', str(mapped.peek()))
+        self.assertEqual('', str(mapped.read(4)))
+        mapped.close()
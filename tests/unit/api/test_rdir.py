@@ -15,6 +15,7 @@
 
 from mock import MagicMock as Mock
 
+from oio.common.exceptions import OioNetworkException, VolumeException
 from oio.rdir.client import RdirClient
 from tests.utils import random_id
 import unittest
@@ -41,6 +42,47 @@ class TestRdirClient(unittest.TestCase):
         super(TestRdirClient, self).tearDown()
         del self.rdir_client
 
+    def test_chunk_push_many(self):
+        def _direct_request(method, uri, json=None, params=None, **kwargs):
+            if json['chunk_id'] == self.chunk_id_2:
+                raise OioNetworkException('oops')
+            return Mock(), None
+        self.rdir_client._direct_request = Mock(side_effect=_direct_request)
+        entries = [
+            {'volume_id': 'vol1', 'container_id': self.container_id_1,
+             'content_id': self.content_id_1, 'chunk_id': self.chunk_id_1,
+             'mtime': 10},
+            {'volume_id': 'vol2', 'container_id': self.container_id_2,
+             'content_id': self.content_id_2, 'chunk_id': self.chunk_id_2},
+            {'volume_id': 'vol1', 'container_id': self.container_id_3,
+             'content_id': self.content_id_3, 'chunk_id': self.chunk_id_3}]
+        failures = self.rdir_client.chunk_push_many(entries, batch_size=1)
+
+        self.assertEqual(1, len(failures))
+        self.assertIs(entries[1], failures[0][0])
+        self.assertIsInstance(failures[0][1], OioNetworkException)
+        # one lookup per volume
+        self.assertEqual(2, self.rdir_client._get_rdir_addr.call_count)
+        self.assertEqual(3, self.rdir_client._direct_request.call_count)
+        _, kwargs = self.rdir_client._direct_request.call_args_list[0]
+        self.assertEqual({'create': '1', 'vol': 'vol1'}, kwargs['params'])
+        self.assertEqual({'container_id': self.container_id_1,
+                          'content_id': self.content_id_1,
+                          'chunk_id': self.chunk_id_1, 'mtime': 10},
+                         kwargs['json'])
+
+    def test_chunk_delete_many_no_rdir(self):
+        self.rdir_client._get_rdir_addr = Mock(
+            side_effect=VolumeException('no rdir'))
+        self.rdir_client._direct_request = Mock()
+        entries = [{'volume_id': 'vol1', 'container_id': self.container_id_1,
+                    'content_id': self.content_id_1,
+                    'chunk_id': self.chunk_id_1}]
+        failures = self.rdir_client.chunk_delete_many(entries)
+        self.assertEqual(1, len(failures))
+        self.assertIsInstance(failures[0][1], VolumeException)
+        self.assertFalse(self.rdir_client._direct_request.called)
+
     def test_fetch_one_req_post(self):
         self.rdir_client._direct_request = Mock(
             side_effect=[
@@ -20,11 +20,13 @@ import unittest
 from collections import defaultdict
 from io import BytesIO
 import hashlib
+import tempfile
 from mock import patch
 
 from oio.common import exceptions as exc
 from oio.common import green
-from oio.api.replication import ReplicatedMetachunkWriter
+from oio.api.replication import ReplicatedMetachunkWriter, \
+    ReplicatedWriteHandler
 from oio.common.storage_method import STORAGE_METHODS
 from tests.unit.api import CHUNK_SIZE, EMPTY_MD5, EMPTY_SHA256, \
     empty_stream, decode_chunked_body, FakeResponse
@@ -262,6 +264,73 @@ class TestReplication(unittest.TestCase):
             self.assertEqual(len(test_data), len(body))
             self.assertEqual(self.checksum(body).hexdigest(), final_checksum)
 
+    def _test_write_handler(self, source=None, **kwargs):
+        chunk_size = 4096
+        test_data = ('1234' * 2560)[:-10]
+        if source is None:
+            source = BytesIO(test_data)
+        else:
+            source.write(test_data)
+            source.seek(0)
+        nb_metachunks = 3
+        sysmeta = dict(self.sysmeta, chunk_size=chunk_size)
+        chunk_prep = {
+            pos: [{'url': 'http://127.0.0.1:700%d/%d' % (i, pos),
+                   'pos': str(pos)} for i in range(3)]
+            for pos in range(nb_metachunks)}
+        resps = [201] * 3 * nb_metachunks
+
+        put_reqs = defaultdict(lambda: {'parts': []})
+
+        def cb_body(conn_id, part):
+            put_reqs[conn_id]['parts'].append(str(part))
+
+        with set_http_connect(*resps, cb_body=cb_body) as fake_connect:
+            put_headers = dict()
+
+            def _connect(host, method, path, headers, **kwargs):
+                put_headers[path] = headers
+                return fake_connect(host, method, path, headers, **kwargs)
+
+            with patch('oio.api.io.http_connect', new=_connect):
+                handler = ReplicatedWriteHandler(
+                    source, sysmeta, chunk_prep,
+                    self.storage_method, **kwargs)
+                chunks, bytes_transferred, checksum = handler.stream()
+
+        self.assertEqual(len(test_data), bytes_transferred)
+        self.assertEqual(self.checksum(test_data).hexdigest(), checksum)
+        self.assertEqual(3 * nb_metachunks, len(chunks))
+        for pos in range(nb_metachunks):
+            expected = test_data[pos * chunk_size:(pos + 1) * chunk_size]
+            for conn_id in range(pos * 3, (pos + 1) * 3):
+                body = ''.join(put_reqs[conn_id]['parts'])
+                if 'Content-Length' not in put_headers['/%d' % pos]:
+                    body, _ = decode_chunked_body(body)
+                self.assertEqual(expected, body)
+        return put_headers
+
+    def test_write_handler(self):
+        put_headers = self._test_write_handler()
+        for headers in put_headers.values():
+            self.assertEqual('chunked', headers['transfer-encoding'])
+
+    def test_write_handler_mapped_file(self):
+        with tempfile.TemporaryFile() as source:
+            put_headers = self._test_write_handler(source)
+        self.assertEqual([4096, 4096, 2038],
+                         [put_headers['/%d' % pos]['Content-Length']
+                          for pos in range(3)])
+        for headers in put_headers.values():
+            self.assertNotIn('transfer-encoding', headers)
+
+    def test_write_handler_mapped_file_pipelined(self):
+        with tempfile.TemporaryFile() as source:
+            self._test_write_handler(source, metachunks_in_flight=2)
+
+    def test_write_handler_pipelined(self):
+        self._test_write_handler(metachunks_in_flight=2)
+
     def _test_write_checksum_algo(self, expected_checksum, **kwargs):
         global_checksum = self.checksum()
         source = empty_stream()
@@ -359,6 +428,42 @@ class TestReplication(unittest.TestCase):
         self.assertEqual(data_checksum, self.checksum(data).hexdigest())
         self.assertEqual(len(conn_record), 1)
 
+    def _test_read_hedged(self, slow_hosts):
+        test_data = ('1234' * 1024)[:-10]
+        meta_chunk = self.meta_chunk()
+
+        def get_response(req):
+            if req['host'] in slow_hosts:
+                green.sleep(1.0)
+            return FakeResponse(200, test_data)
+
+        latency = io.LatencyTracker()
+        with set_http_requests(get_response) as conn_record:
+            reader = io.ChunkReader(iter(meta_chunk), None, {},
+                                    hedge_percentile=95, latency=latency)
+            start = io.monotonic_time()
+            data = ''.join(reader.stream())
+            elapsed = io.monotonic_time() - start
+        self.assertEqual(test_data, data)
+        return elapsed, conn_record, latency
+
+    def test_read_hedged(self):
+        elapsed, conn_record, latency = self._test_read_hedged(
+            ['127.0.0.1:7000'])
+        # the second copy answered first
+        self.assertEqual(2, len(conn_record))
+        self.assertLess(elapsed, 0.5)
+        # the slow request has been cancelled,
+        # and recorded as slower than the hedge delay
+        self.assertGreaterEqual(latency.mean('127.0.0.1:7000'),
+                                io.HEDGE_DEFAULT_DELAY)
+        self.assertLess(latency.mean('127.0.0.1:7001'),
+                        latency.mean('127.0.0.1:7000'))
+
+    def test_read_hedged_fast(self):
+        elapsed, conn_record, latency = self._test_read_hedged([])
+        self.assertEqual(1, len(conn_record))
+
     def test_read_range(self):
         test_data = ('1024' * 1024)[:-10]
         meta_chunk = self.meta_chunk()
@@ -14,9 +14,15 @@
 # License along with this library.
 
 import unittest
-from oio.common.exceptions import DeadlineReached
-from oio.common.storage_functions import obj_range_to_meta_chunk_range
+from oio.common import green
+from oio.common.exceptions import DeadlineReached, ServiceUnavailable
+from oio.common.storage_method import STORAGE_METHODS
+from oio.api.io import LatencyTracker
+from oio.common.storage_functions import obj_range_to_meta_chunk_range, \
+    _sort_chunks, _stream_with_readahead, fetch_stream
 from oio.common.utils import deadline_to_timeout, monotonic_time
+from tests.unit import set_http_requests
+from tests.unit.api import FakeResponse
 
 
 class TestUtils(unittest.TestCase):
@@ -129,6 +135,24 @@ class TestUtils(unittest.TestCase):
                 c['start'], c['end'], c['sizes'])
             self.assertEqual(result, c['expected'])
 
+    def test_sort_chunks_latency(self):
+        raw_chunks = [
+            {'url': 'http://127.0.0.1:6000/AA', 'pos': '0',
+             'size': 10, 'score': 100},
+            {'url': 'http://127.0.0.1:6001/AA', 'pos': '0',
+             'size': 10, 'score': 90},
+            {'url': 'http://127.0.0.1:6002/AA', 'pos': '0',
+             'size': 10, 'score': 80},
+        ]
+        latency = LatencyTracker()
+        latency.record('127.0.0.1:6000', 0.2)
+        latency.record('127.0.0.1:6001', 0.1)
+        chunks = _sort_chunks(raw_chunks, False, latency=latency)
+        # never measured ranked with the median
+        self.assertEqual(['127.0.0.1:6001', '127.0.0.1:6000',
+                          '127.0.0.1:6002'],
+                         [c['url'][7:21] for c in chunks[0]])
+
     def test_deadline_to_timeout(self):
         self.assertRaises(DeadlineReached,
                           deadline_to_timeout, monotonic_time() - 0.001, True)
@@ -138,3 +162,90 @@ class TestUtils(unittest.TestCase):
         to = deadline_to_timeout(deadline, True)
         self.assertLessEqual(to, 1.0)
         self.assertGreater(to, 0.9)
+
+
+class ReadaheadTest(unittest.TestCase):
+
+    def setUp(self):
+        super(ReadaheadTest, self).setUp()
+        self.started = list()
+        self.closed = list()
+
+    def _stream(self, num, blocks, fail=False):
+        self.started.append(num)
+        try:
+            for block in blocks:
+                green.sleep(0)
+                yield block
+            if fail:
+                raise ServiceUnavailable('metachunk %d' % num)
+        finally:
+            self.closed.append(num)
+
+    def _streams(self, nb, fail=None):
+        return iter([self._stream(i, ['%d' % i] * 4, fail=(i == fail))
+                     for i in range(nb)])
+
+    def test_no_readahead(self):
+        stream = _stream_with_readahead(self._streams(3))
+        self.assertEqual('0', next(stream))
+        green.sleep(0.01)
+        self.assertEqual([0], self.started)
+        self.assertEqual('00011112222', ''.join(stream))
+
+    def test_readahead(self):
+        stream = _stream_with_readahead(self._streams(4), 2)
+        self.assertEqual('0', next(stream))
+        green.sleep(0.01)
+        self.assertEqual([0, 1, 2], self.started)
+        self.assertEqual('000111122223333', ''.join(stream))
+        self.assertEqual([0, 1, 2, 3], sorted(self.closed))
+
+    def test_readahead_max_bytes(self):
+        stream = _stream_with_readahead(self._streams(3), 2, max_bytes=4)
+        next(stream)
+        green.sleep(0.01)
+        # 2 bytes for each metachunk read in advance
+        self.assertEqual([], self.closed)
+        self.assertEqual('00011112222', ''.join(stream))
+
+    def test_readahead_error(self):
+        stream = _stream_with_readahead(self._streams(3, fail=1), 2)
+        data = ''
+        try:
+            for block in stream:
+                data += block
+        except ServiceUnavailable:
+            pass
+        else:
+            self.fail('should have raised ServiceUnavailable')
+        self.assertEqual('00001111', data)
+        # readers of next metachunks are stopped
+        self.assertEqual([0, 1, 2], sorted(self.closed))
+
+    def test_readahead_close(self):
+        stream = _stream_with_readahead(self._streams(4), 2)
+        next(stream)
+        stream.close()
+        green.sleep(0)
+        self.assertEqual([0, 1, 2], sorted(self.closed))
+
+    def test_fetch_stream_readahead(self):
+        storage_method = STORAGE_METHODS.load('plain/nb_copy=1')
+        chunks = dict()
+        for pos in range(3):
+            chunks[pos] = [{'url': 'http://127.0.0.1:600%d/AA' % pos,
+                            'pos': str(pos), 'size': 8}]
+
+        def get_response(req):
+            return FakeResponse(200, req['host'][-1] * 8)
+
+        with set_http_requests(get_response) as conn_record:
+            stream = fetch_stream(chunks, None, storage_method,
+                                  metachunk_readahead=2)
+            self.assertEqual('00000000', next(stream))
+            green.sleep(0.01)
+            self.assertEqual(3, len(conn_record))
+            self.assertEqual('1111111122222222', ''.join(stream))
+        ranges = [conn.req['headers']['Range'] for conn in conn_record.records]
+        self.assertEqual(['bytes=0-7'] * 3, ranges)
@@ -0,0 +1,219 @@
+# Copyright (C) 2018 OpenIO SAS, as part of OpenIO SDS
+#
+# This library is free software; you can redistribute it and/or
+# modify it under the terms of the GNU Lesser General Public
+# License as published by the Free Software Foundation; either
+# version 3.0 of the License, or (at your option) any later version.
+#
+# This library is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# Lesser General Public License for more details.
+#
+# You should have received a copy of the GNU Lesser General Public
+# License along with this library.
+
+import hashlib
+import os
+import shutil
+import tempfile
+import unittest
+
+from mock import MagicMock as Mock, patch
+
+from oio.blob.auditor import BlobAuditorWorker, ChunkReader
+from oio.common import exceptions as exc
+from oio.common.green import sleep
+from oio.common.logger import get_logger
+from oio.common.volume_scanner import VolumeScanner
+from tests.utils import random_id
+
+
+class TestBlobAuditorWorker(unittest.TestCase):
+    def setUp(self):
+        self.volume = tempfile.mkdtemp()
+        self.conf = {'namespace': 'NS',
+                     'proxyd_url': 'http://127.0.0.1:6000',
+                     'concurrency': '4'}
+        self.container_id = random_id(64)
+        self.metas = dict()
+
+    def tearDown(self):
+        shutil.rmtree(self.volume)
+
+    def _add_chunk(self, content_id, pos):
+        chunk_id = random_id(64)
+        path = os.path.join(self.volume, chunk_id[:3])
+        if not os.path.isdir(path):
+            os.mkdir(path)
+        with open(os.path.join(path, chunk_id), 'w') as chunk:
+            chunk.write('x' * 8)
+        self.metas[chunk_id] = {
+            'chunk_id': chunk_id, 'chunk_pos': str(pos), 'chunk_size': '8',
+            'container_id': self.container_id, 'content_id': content_id}
+        return {'url': 'http://127.0.0.1:6010/' + chunk_id,
+                'pos': str(pos), 'size': 8, 'hash': 'A' * 32}
+
+    def _worker(self):
+        worker = BlobAuditorWorker(self.conf, get_logger(None), self.volume)
+        worker.chunk_read = lambda path, chunk_id: self.metas[chunk_id]
+        return worker
+
+    def test_audit_pass_shares_locate(self):
+        content_1 = random_id(32)
+        content_2 = random_id(32)
+        chunks = {
+            content_1: [self._add_chunk(content_1, i) for i in range(3)],
+            content_2: [self._add_chunk(content_2, i) for i in range(2)],
+        }
+        calls = list()
+
+        def _content_locate(cid=None, content=None, **_kwargs):
+            calls.append(content)
+            sleep(0.01)
+            return {}, chunks[content]
+
+        worker = self._worker()
+        worker.container_client.content_locate = Mock(
+            side_effect=_content_locate)
+        with patch('oio.blob.auditor.check_volume',
+                   Mock(return_value=('NS', '127.0.0.1:6010'))):
+            worker.audit_pass()
+        self.assertEqual(5, worker.total_chunks_processed)
+        self.assertEqual(40, worker.total_bytes_processed)
+        self.assertEqual(0, worker.errors)
+        self.assertEqual(0, worker.orphan_chunks)
+        self.assertEqual(sorted([content_1, content_2]), sorted(calls))
+
+    def test_bytes_accounted_before_read(self):
+        content_id = random_id(32)
+        chunks = [self._add_chunk(content_id, i) for i in range(4)]
+        worker = self._worker()
+        accounted = list()
+
+        def _chunk_read(path, chunk_id):
+            accounted.append(worker.total_bytes_processed)
+            return self.metas[chunk_id]
+        worker.chunk_read = _chunk_read
+        worker.container_client.content_locate = Mock(
+            return_value=({}, chunks))
+        with patch('oio.blob.auditor.check_volume',
+                   Mock(return_value=('NS', '127.0.0.1:6010'))):
+            worker.audit_pass()
+        self.assertEqual(4, len(accounted))
+        # Each chunk has been accounted for before being read
+        for i, total in enumerate(accounted):
+            self.assertGreaterEqual(total, 8 * (i + 1))
+
+    def test_audit_pass_orphan(self):
+        content_id = random_id(32)
+        self._add_chunk(content_id, 0)
+        self._add_chunk(content_id, 1)
+        worker = self._worker()
+        worker.container_client.content_locate = Mock(
+            side_effect=exc.NotFound('content not found'))
+        with patch('oio.blob.auditor.check_volume',
+                   Mock(return_value=('NS', '127.0.0.1:6010'))):
+            worker.audit_pass()
+        self.assertEqual(2, worker.orphan_chunks)
+        self.assertEqual(1, worker.container_client.content_locate.call_count)
+
+    def test_incremental_audit(self):
+        content_id = random_id(32)
+        chunks = [self._add_chunk(content_id, i) for i in range(3)]
+        state_dir = tempfile.mkdtemp()
+        self.conf['audit_state_file'] = os.path.join(state_dir, 'state.db')
+        self.conf['full_audit_fraction'] = '0'
+
+        def _audit_pass():
+            worker = self._worker()
+            read = list()
+
+            def _chunk_read(path, chunk_id):
+                read.append(chunk_id)
+                return self.metas[chunk_id]
+            worker.chunk_read = _chunk_read
+            worker.chunk_read_metadata = \
+                lambda path, chunk_id: self.metas[chunk_id]
+            worker.container_client.content_locate = Mock(
+                return_value=({}, chunks))
+            with patch('oio.blob.auditor.check_volume',
+                       Mock(return_value=('NS', '127.0.0.1:6010'))):
+                worker.audit_pass()
+            self.assertEqual(0, worker.errors)
+            return read, worker
+
+        try:
+            read, _ = _audit_pass()
+            self.assertEqual(3, len(read))
+            read, worker = _audit_pass()
+            self.assertEqual([], read)
+            self.assertEqual(3, worker.total_chunks_skipped)
+            self.assertEqual(0, worker.total_bytes_processed)
+
+            touched = sorted(self.metas)[1]
+            path = os.path.join(self.volume, touched[:3], touched)
+            os.utime(path, (1, 1))
+            read, _ = _audit_pass()
+            self.assertEqual([touched], read)
+
+            self.conf['full_audit_fraction'] = '1.0'
+            read, _ = _audit_pass()
+            self.assertEqual(3, len(read))
+        finally:
+            shutil.rmtree(state_dir)
+
+    def test_incremental_audit_resumed_scan(self):
+        content_id = random_id(32)
+        chunks = [self._add_chunk(content_id, i) for i in range(3)]
+        state_dir = tempfile.mkdtemp()
+        self.conf['audit_state_file'] = os.path.join(state_dir, 'state.db')
+        self.conf['scan_checkpoint_file'] = os.path.join(state_dir, 'scan')
+        self.conf['full_audit_fraction'] = '0'
+
+        def _audit_pass():
+            worker = self._worker()
+            read = list()
+
+            def _chunk_read(path, chunk_id):
+                read.append(chunk_id)
+                return self.metas[chunk_id]
+            worker.chunk_read = _chunk_read
+            worker.chunk_read_metadata = \
+                lambda path, chunk_id: self.metas[chunk_id]
+            worker.container_client.content_locate = Mock(
+                return_value=({}, chunks))
+            with patch('oio.blob.auditor.check_volume',
+                       Mock(return_value=('NS', '127.0.0.1:6010'))):
+                worker.audit_pass()
+            return read
+
+        try:
+            self.assertEqual(3, len(_audit_pass()))
+            # Resume the scan from the directory of the last chunk:
+            # the state of the chunks before it must be kept.
+            last = sorted(self.metas)[-1]
+            VolumeScanner(self.volume,
+                          checkpoint_file=self.conf['scan_checkpoint_file']
+                          ).save_checkpoint(last[:3])
+            self.assertEqual([], _audit_pass())
+            self.assertEqual([], _audit_pass())
+        finally:
+            shutil.rmtree(state_dir)
+
+    def test_chunk_reader_buffer_size(self):
+        data = os.urandom(1000)
+        path = os.path.join(self.volume, 'chunk')
+        with open(path, 'wb') as f:
+            f.write(data)
+        with open(path, 'rb') as f:
+            reader = ChunkReader(f, len(data), hashlib.md5(data).hexdigest(),
+                                 buffer_size=128)
+            bufs = list(reader)
+            reader.close()
+        self.assertEqual(8, len(bufs))
+        self.assertEqual(data, ''.join(bufs))
+        with open(path, 'rb') as f:
+            reader = ChunkReader(f, len(data), 'A' * 32, buffer_size=128)
+            list(reader)
+            self.assertRaises(exc.CorruptedChunk, reader.close)
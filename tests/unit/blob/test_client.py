@@ -0,0 +1,164 @@
+# Copyright (C) 2018 OpenIO SAS, as part of OpenIO SDS
+#
+# This library is free software; you can redistribute it and/or
+# modify it under the terms of the GNU Lesser General Public
+# License as published by the Free Software Foundation; either
+# version 3.0 of the License, or (at your option) any later version.
+#
+# This library is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# Lesser General Public License for more details.
+#
+# You should have received a copy of the GNU Lesser General Public
+# License along with this library.
+
+import hashlib
+import os
+import unittest
+
+from mock import MagicMock as Mock, patch
+
+from oio.api.io import PUT_QUEUE_DEPTH, WRITE_CHUNK_SIZE
+from oio.blob.client import BlobClient, ChecksumReader
+from oio.common import exceptions as exc
+from oio.common.green import sleep
+from tests.unit import set_http_connect
+
+
+class FakeWriter(object):
+    """Read the source like ReplicatedMetachunkWriter does."""
+
+    def __init__(self, sysmeta, meta_chunk, *_args, **_kwargs):
+        self.meta_chunk = meta_chunk
+        FakeWriter.last = self
+
+    def stream(self, source, size=None):
+        total = 0
+        while True:
+            data = source.read(WRITE_CHUNK_SIZE)
+            if not data:
+                break
+            total += len(data)
+        for chunk in self.meta_chunk:
+            chunk['size'] = total
+        return total, None, self.meta_chunk
+
+
+class TestChecksumReader(unittest.TestCase):
+    def test_read(self):
+        blocks = [os.urandom(1000), '', os.urandom(10), os.urandom(100)]
+        data = ''.join(blocks)
+        reader = ChecksumReader(iter(blocks),
+                                hashlib.md5(data).hexdigest().upper(),
+                                len(data))
+        parts = [reader.read(64)]
+        parts.append(reader.read())
+        self.assertEqual('', reader.read(64))
+        self.assertEqual(64, len(parts[0]))
+        self.assertEqual(data, ''.join(parts))
+        self.assertEqual(len(data), reader.bytes_read)
+
+    def test_corrupted(self):
+        data = os.urandom(1000)
+        reader = ChecksumReader([data], 'A' * 32, len(data))
+        self.assertEqual(data, reader.read(4096))
+        self.assertRaises(exc.CorruptedChunk, reader.read, 4096)
+
+        reader = ChecksumReader([data], hashlib.md5(data).hexdigest(), 1001)
+        self.assertRaises(exc.CorruptedChunk, reader.read)
+
+
+class TestBlobClientCopy(unittest.TestCase):
+    def setUp(self):
+        self.blob_client = BlobClient(
+            {'namespace': 'NS', 'proxyd_url': 'http://127.0.0.1:6000'})
+        self.blob_client.resolve_url = lambda url: url
+        self.meta = {'chunk_id': 'A' * 64, 'chunk_pos': '0',
+                     'full_path': 'acct/ct/obj/1/C0', 'container_id': 'B' * 64,
+                     'content_path': 'obj', 'content_version': '1',
+                     'content_id': 'C' * 32,
+                     'content_chunkmethod': 'plain/nb_copy=3',
+                     'content_policy': 'THREECOPIES'}
+
+    def _copy(self, blocks, size, checksum, to_url):
+        self.meta['chunk_size'] = str(size)
+        self.meta['chunk_hash'] = checksum
+        stream = Mock()
+        stream.__iter__.return_value = blocks
+        self.blob_client.chunk_get = Mock(return_value=(self.meta, stream))
+        with patch('oio.blob.client.ReplicatedMetachunkWriter', FakeWriter):
+            chunks = self.blob_client.chunk_copy(
+                'http://127.0.0.1:6010/' + 'A' * 64, to_url)
+        stream.close.assert_called_once_with()
+        return chunks
+
+    def test_copy_several_destinations(self):
+        data = os.urandom(10000)
+        to_urls = ['http://127.0.0.1:601%d/%s' % (i, 'D' * 64)
+                   for i in range(1, 3)]
+        chunks = self._copy(iter([data]), len(data),
+                            hashlib.md5(data).hexdigest().upper(), to_urls)
+        self.assertEqual(to_urls, [c['url'] for c in chunks])
+        for chunk in chunks:
+            self.assertEqual(len(data), chunk['size'])
+
+        chunks = self._copy(iter([data]), len(data),
+                            hashlib.md5(data).hexdigest(), to_urls[0])
+        self.assertEqual(1, len(chunks))
+
+    def test_copy_corrupted(self):
+        self.assertRaises(exc.CorruptedChunk, self._copy,
+                          iter(['x' * 100]), 100, 'A' * 32,
+                          'http://127.0.0.1:6011/' + 'D' * 64)
+
+    def test_put_truncated(self):
+        self.meta['chunk_hash'] = 'A' * 32
+        with patch('oio.blob.client.ReplicatedMetachunkWriter', FakeWriter):
+            self.assertRaises(
+                exc.CorruptedChunk, self.blob_client.chunk_put,
+                'http://127.0.0.1:6011/' + 'D' * 64, self.meta,
+                iter(['x' * 100]), size=1000)
+
+    def test_copy_large_chunk(self):
+        block = os.urandom(1024 * 1024)
+        nb_blocks = 16
+        checksum = hashlib.md5()
+        for _ in range(nb_blocks):
+            checksum.update(block)
+        size = len(block) * nb_blocks
+        read = [0]
+        received = [0, 0]
+        lag = [0]
+
+        def _source():
+            for _ in range(nb_blocks):
+                read[0] += len(block)
+                yield block
+
+        def _cb_body(conn_id, data):
+            if conn_id == 1:
+                # The second destination is slower
+                sleep(0.001)
+            received[conn_id] += len(data)
+            lag[0] = max(lag[0], read[0] - min(received))
+
+        self.meta['chunk_size'] = str(size)
+        self.meta['chunk_hash'] = checksum.hexdigest()
+        stream = Mock()
+        stream.__iter__.return_value = _source()
+        self.blob_client.chunk_get = Mock(return_value=(self.meta, stream))
+        with set_http_connect(201, 201, cb_body=_cb_body):
+            chunks = self.blob_client.chunk_copy(
+                'http://127.0.0.1:6010/' + 'A' * 64,
+                ['http://127.0.0.1:6011/' + 'D' * 64,
+                 'http://127.0.0.1:6012/' + 'D' * 64])
+        self.assertEqual([size, size], [c['size'] for c in chunks])
+        # With chunked transfer encoding, the destinations receive
+        # a few more bytes than the size of the chunk
+        for nbytes in received:
+            self.assertGreaterEqual(nbytes, size)
+        # The source is not read much further than what the slowest
+        # destination has received
+        self.assertLess(
+            lag[0], len(block) + (PUT_QUEUE_DEPTH + 2) * WRITE_CHUNK_SIZE)
@@ -0,0 +1,119 @@
+# Copyright (C) 2018 OpenIO SAS, as part of OpenIO SDS
+#
+# This library is free software; you can redistribute it and/or
+# modify it under the terms of the GNU Lesser General Public
+# License as published by the Free Software Foundation; either
+# version 3.0 of the License, or (at your option) any later version.
+#
+# This library is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# Lesser General Public License for more details.
+#
+# You should have received a copy of the GNU Lesser General Public
+# License along with this library.
+
+import os
+import shutil
+import tempfile
+import time
+import unittest
+
+from mock import MagicMock as Mock, patch
+
+from oio.blob.mover import BlobMoverWorker
+from oio.common.green import sleep
+from oio.common.logger import get_logger
+from tests.utils import random_id
+
+
+class TestBlobMoverWorker(unittest.TestCase):
+    def setUp(self):
+        self.volume = tempfile.mkdtemp()
+        self.conf = {'namespace': 'NS',
+                     'proxyd_url': 'http://127.0.0.1:6000',
+                     'concurrency': '3',
+                     'usage_target': '40'}
+        self.sizes = dict()
+        for size in (10, 60, 30, 50):
+            chunk_id = random_id(64)
+            path = os.path.join(self.volume, chunk_id[:3])
+            if not os.path.isdir(path):
+                os.mkdir(path)
+            with open(os.path.join(path, chunk_id), 'w') as chunk:
+                chunk.write('x' * size)
+            self.sizes[chunk_id] = size
+
+    def tearDown(self):
+        shutil.rmtree(self.volume)
+
+    def _worker(self):
+        with patch('oio.blob.mover.check_volume',
+                   Mock(return_value=('NS', '127.0.0.1:6010'))):
+            worker = BlobMoverWorker(self.conf, get_logger(None),
+                                     self.volume)
+
+        def _check_usage():
+            # 50% of a 1000 bytes volume is used
+            worker.volume_size = 1000
+            worker.usage = 50.0
+            worker.bytes_at_usage_check = worker.bytes_scheduled
+            worker.last_usage_check = time.time()
+        worker.check_usage = _check_usage
+        return worker
+
+    def test_mover_pass_largest_first(self):
+        worker = self._worker()
+        moved = list()
+        in_flight = [0, 0]
+
+        def _chunk_move(path, chunk_id):
+            in_flight[0] += 1
+            in_flight[1] = max(in_flight)
+            sleep(0.01)
+            in_flight[0] -= 1
+            moved.append(self.sizes[chunk_id])
+        worker.chunk_move = _chunk_move
+        worker.mover_pass()
+        # 100 bytes must be moved to reach the target
+        self.assertEqual([60, 50], sorted(moved, reverse=True))
+        self.assertEqual(110, worker.total_bytes_processed)
+        self.assertEqual(2, in_flight[1])
+
+    def test_mover_pass_failed_moves(self):
+        worker = self._worker()
+        calls = list()
+
+        def _chunk_move(path, chunk_id):
+            calls.append(self.sizes[chunk_id])
+            if self.sizes[chunk_id] == 60:
+                raise Exception('no spare chunk')
+        worker.chunk_move = _chunk_move
+        worker.mover_pass()
+        # The failed move does not count
+        self.assertEqual([60, 50, 30, 10], calls)
+        self.assertEqual(1, worker.errors)
+        self.assertEqual(90, worker.total_bytes_processed)
+
+    def test_mover_pass_not_chunks(self):
+        for name in ('not-a-chunk', 'Z' * 64):
+            with open(os.path.join(self.volume, name), 'w') as not_chunk:
+                not_chunk.write('x' * 100)
+        worker = self._worker()
+        moved = list()
+
+        def _chunk_move(path, chunk_id):
+            moved.append(self.sizes[chunk_id])
+        worker.chunk_move = _chunk_move
+        worker.mover_pass()
+        # The other files neither count as moved nor are moved
+        self.assertEqual([60, 50], sorted(moved, reverse=True))
+        self.assertEqual(110, worker.bytes_scheduled)
+
+    def test_safe_chunk_move_not_chunk(self):
+        worker = self._worker()
+        worker.chunk_move = Mock()
+        worker.bytes_scheduled = 100
+        worker.safe_chunk_move(os.path.join(self.volume, 'Z' * 64), 100)
+        self.assertEqual(0, worker.bytes_scheduled)
+        worker.chunk_move.assert_not_called()
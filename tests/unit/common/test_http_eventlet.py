@@ -0,0 +1,181 @@
+# Copyright (C) 2018 OpenIO SAS
+
+# This library is free software; you can redistribute it and/or
+# modify it under the terms of the GNU Lesser General Public
+# License as published by the Free Software Foundation; either
+# version 3.0 of the License, or (at your option) any later version.
+# This library is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# Lesser General Public License for more details.
+# You should have received a copy of the GNU Lesser General Public
+# License along with this library.
+
+
+import os
+import unittest
+
+import eventlet
+from mock import MagicMock as Mock
+
+from oio.common.http_eventlet import ConnectionPool, http_connect
+
+
+class FakeRawx(object):
+    """
+    Minimal HTTP/1.1 server answering 'ok' to every request,
+    keeping connections open unless `close_after` is set.
+    """
+
+    def __init__(self, close_after=False):
+        self.close_after = close_after
+        self.accepted = 0
+        self.sock = eventlet.listen(('127.0.0.1', 0))
+        self.host = '127.0.0.1:%d' % self.sock.getsockname()[1]
+        self.thread = eventlet.spawn(self._accept)
+
+    def _accept(self):
+        while True:
+            conn, _ = self.sock.accept()
+            self.accepted += 1
+            eventlet.spawn(self._handle, conn)
+
+    def _handle(self, conn):
+        fp = conn.makefile('rb')
+        while True:
+            line = fp.readline()
+            if not line:
+                break
+            while fp.readline() not in ('\r\n', ''):
+                pass
+            conn.sendall('HTTP/1.1 200 OK\r\nContent-Length: 2\r\n\r\nok')
+            if self.close_after:
+                break
+        fp.close()
+        conn.close()
+
+    def stop(self):
+        self.thread.kill()
+        self.sock.close()
+
+
+class ConnectionPoolTest(unittest.TestCase):
+
+    def setUp(self):
+        super(ConnectionPoolTest, self).setUp()
+        self.rawx = None
+
+    def tearDown(self):
+        super(ConnectionPoolTest, self).tearDown()
+        if self.rawx:
+            self.rawx.stop()
+
+    def _request(self, pool, perfdata=None):
+        conn = http_connect(self.rawx.host, 'GET', '/chunk', pool=pool,
+                            perfdata=perfdata)
+        resp = conn.getresponse()
+        self.assertEqual('ok', resp.read())
+        conn.release()
+        return conn
+
+    def test_reuse(self):
+        self.rawx = FakeRawx()
+        pool = ConnectionPool()
+        perfdata = dict()
+        conn = self._request(pool, perfdata)
+        self.assertIs(conn, self._request(pool, perfdata))
+        self.assertEqual(1, self.rawx.accepted)
+        self.assertEqual(1, pool.hits)
+        self.assertEqual(1, pool.misses)
+        self.assertEqual({'rawx_pool_hits': 1, 'rawx_pool_misses': 1},
+                         perfdata)
+
+    def test_no_pool(self):
+        self.rawx = FakeRawx()
+        self._request(None)
+        self._request(None)
+        self.assertEqual(2, self.rawx.accepted)
+
+    def test_unread_response(self):
+        self.rawx = FakeRawx()
+        pool = ConnectionPool()
+        conn = http_connect(self.rawx.host, 'GET', '/chunk', pool=pool)
+        conn.getresponse()
+        conn.release()
+        self._request(pool)
+        self.assertEqual(2, self.rawx.accepted)
+        self.assertEqual(0, pool.hits)
+
+    def test_max_idle_per_host(self):
+        self.rawx = FakeRawx()
+        pool = ConnectionPool(max_idle_per_host=1)
+        conns = [http_connect(self.rawx.host, 'GET', '/chunk', pool=pool)
+                 for _ in range(2)]
+        for conn in conns:
+            conn.getresponse().read()
+            conn.release()
+        self.assertEqual(1, len(pool._idle[self.rawx.host]))
+        self.assertIsNone(conns[1].sock)
+
+    def test_idle_eviction(self):
+        self.rawx = FakeRawx()
+        pool = ConnectionPool(max_idle_time=0.0)
+        self._request(pool)
+        eventlet.sleep(0.01)
+        self._request(pool)
+        self.assertEqual(0, pool.hits)
+        self.assertEqual(2, self.rawx.accepted)
+
+    def test_idle_sweep(self):
+        self.rawx = FakeRawx()
+        other_rawx = FakeRawx()
+        try:
+            pool = ConnectionPool(max_idle_time=0.0)
+            conn = self._request(pool)
+            eventlet.sleep(0.01)
+            # Using another host closes the idle connection to the first
+            other_conn = http_connect(other_rawx.host, 'GET', '/chunk',
+                                      pool=pool)
+            other_conn.getresponse().read()
+            other_conn.release()
+            self.assertIsNone(conn.sock)
+            self.assertNotIn(self.rawx.host, pool._idle)
+        finally:
+            other_rawx.stop()
+
+    def test_health_check(self):
+        self.rawx = FakeRawx(close_after=True)
+        pool = ConnectionPool()
+        self._request(pool)
+        # let the server close its side of the connection
+        eventlet.sleep(0.01)
+        self._request(pool)
+        self.assertEqual(0, pool.hits)
+        self.assertEqual(2, self.rawx.accepted)
+
+    def test_clear(self):
+        self.rawx = FakeRawx()
+        pool = ConnectionPool()
+        conn = self._request(pool)
+        pool.clear()
+        self.assertIsNone(conn.sock)
+        self._request(pool)
+        self.assertEqual(2, self.rawx.accepted)
+
+    def test_health_check_high_fd(self):
+        self.rawx = FakeRawx()
+        pool = ConnectionPool()
+        conn = self._request(pool)
+        # Move the socket above FD_SETSIZE, where select() fails
+        high_fd = 2000
+        try:
+            os.dup2(conn.sock.fileno(), high_fd)
+        except OSError:
+            self.skipTest('cannot open a file descriptor above 1024')
+        real_sock = conn.sock
+        conn.sock = Mock(fileno=Mock(return_value=high_fd))
+        try:
+            self.assertTrue(ConnectionPool._is_healthy(conn))
+        finally:
+            conn.sock = real_sock
+            os.close(high_fd)
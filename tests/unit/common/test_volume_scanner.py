@@ -0,0 +1,89 @@
+# Copyright (C) 2018 OpenIO SAS, as part of OpenIO SDS
+#
+# This library is free software; you can redistribute it and/or
+# modify it under the terms of the GNU Lesser General Public
+# License as published by the Free Software Foundation; either
+# version 3.0 of the License, or (at your option) any later version.
+#
+# This library is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# Lesser General Public License for more details.
+#
+# You should have received a copy of the GNU Lesser General Public
+# License along with this library.
+
+import os
+import shutil
+import tempfile
+import unittest
+
+from oio.common import volume_scanner
+from oio.common.utils import paths_gen
+from oio.common.volume_scanner import VolumeScanner
+
+
+class TestVolumeScanner(unittest.TestCase):
+    def setUp(self):
+        self.volume = tempfile.mkdtemp()
+        self.checkpoint = os.path.join(tempfile.mkdtemp(), 'checkpoint')
+        self.files = set()
+        for top in ('000', '001', '002', '003'):
+            for sub in ('A', 'B'):
+                path = os.path.join(self.volume, top, sub)
+                os.makedirs(path)
+                for name in ('x', 'y'):
+                    self._touch(os.path.join(path, name))
+        self._touch(os.path.join(self.volume, 'root_file'))
+
+    def tearDown(self):
+        shutil.rmtree(self.volume)
+        shutil.rmtree(os.path.dirname(self.checkpoint))
+
+    def _touch(self, path):
+        open(path, 'w').close()
+        self.files.add(path)
+
+    def test_walk_like_os_walk(self):
+        expected = set()
+        for root, _dirs, files in os.walk(self.volume):
+            expected.update(os.path.join(root, name) for name in files)
+        self.assertEqual(expected, self.files)
+        for workers in (1, 3):
+            paths = list(VolumeScanner(self.volume, workers=workers))
+            self.assertEqual(len(paths), len(self.files))
+            self.assertEqual(set(paths), self.files)
+        paths = list(VolumeScanner(self.volume, inode_order=True))
+        self.assertEqual(set(paths), self.files)
+
+    def test_walk_without_scandir(self):
+        orig_scandir = volume_scanner.scandir
+        volume_scanner.scandir = None
+        try:
+            self.assertEqual(set(paths_gen(self.volume)), self.files)
+        finally:
+            volume_scanner.scandir = orig_scandir
+
+    def test_checkpoint(self):
+        conf = {'scan_workers': '1',
+                'scan_checkpoint_file': self.checkpoint,
+                'scan_checkpoint_interval': '0'}
+        paths = paths_gen(self.volume, conf=conf)
+        seen = set()
+        # Consume the root file and the whole first directory,
+        # then the first file of the second one.
+        for path in paths:
+            seen.add(path)
+            if '/001/' in path:
+                break
+        paths.close()
+        scanner = VolumeScanner.from_conf(self.volume, conf)
+        self.assertEqual('001', scanner.load_checkpoint())
+
+        resumed = set(scanner)
+        self.assertEqual('001', scanner.resumed_from)
+        self.assertFalse([p for p in resumed if '/000/' in p])
+        self.assertEqual(self.files, seen | resumed)
+        # A complete pass removes the checkpoint
+        self.assertFalse(os.path.exists(self.checkpoint))
+        self.assertIsNone(scanner.load_checkpoint())
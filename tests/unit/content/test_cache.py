@@ -0,0 +1,91 @@
+# Copyright (C) 2018 OpenIO SAS, as part of OpenIO SDS
+#
+# This library is free software; you can redistribute it and/or
+# modify it under the terms of the GNU Lesser General Public
+# License as published by the Free Software Foundation; either
+# version 3.0 of the License, or (at your option) any later version.
+#
+# This library is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# Lesser General Public License for more details.
+#
+# You should have received a copy of the GNU Lesser General Public
+# License along with this library.
+
+import unittest
+
+from mock import MagicMock as Mock
+
+from oio.common.exceptions import NotFound
+from oio.common.green import GreenPile, sleep
+from oio.content.cache import LocateCache
+
+
+class TestLocateCache(unittest.TestCase):
+    def setUp(self):
+        self.container_client = Mock()
+        self.container_client.content_locate = Mock(
+            side_effect=self._content_locate)
+
+    def _content_locate(self, cid=None, content=None, **_kwargs):
+        if content == 'missing':
+            raise NotFound('content not found')
+        return ({'id': content},
+                [{'url': 'http://127.0.0.1:6010/%s%d' % (content, i),
+                  'pos': '0.%d' % i} for i in range(3)])
+
+    def test_hit_and_copy(self):
+        cache = LocateCache(self.container_client)
+        meta, chunks = cache.content_locate('cid', 'A')
+        chunks[0]['url'] = 'modified'
+        meta2, chunks2 = cache.content_locate('cid', 'A')
+        self.assertEqual(meta, meta2)
+        self.assertNotEqual('modified', chunks2[0]['url'])
+        self.assertEqual(1, self.container_client.content_locate.call_count)
+        stats = cache.stats()
+        self.assertEqual(1, stats['hits'])
+        self.assertEqual(1, stats['misses'])
+        self.assertEqual(0.5, stats['hit_rate'])
+        self.assertEqual(1, stats['size'])
+        self.assertEqual(3, stats['chunks'])
+
+    def test_not_found(self):
+        cache = LocateCache(self.container_client)
+        self.assertRaises(NotFound, cache.content_locate, 'cid', 'missing')
+        self.assertRaises(NotFound, cache.content_locate, 'cid', 'missing')
+        self.assertEqual(1, self.container_client.content_locate.call_count)
+
+    def test_lru_and_ttl(self):
+        cache = LocateCache(self.container_client, size=2)
+        cache.content_locate('cid', 'A')
+        cache.content_locate('cid', 'B')
+        cache.content_locate('cid', 'A')
+        cache.content_locate('cid', 'C')
+        self.assertIsNotNone(cache.get('cid', 'A'))
+        self.assertIsNone(cache.get('cid', 'B'))
+        self.assertEqual(1, cache.stats()['evicted'])
+        self.assertEqual(6, cache.stats()['chunks'])
+
+        cache.invalidate('cid', 'A')
+        self.assertIsNone(cache.get('cid', 'A'))
+        self.assertEqual(3, cache.stats()['chunks'])
+
+        cache.ttl = -1
+        cache.content_locate('cid', 'D')
+        self.assertIsNone(cache.get('cid', 'D'))
+        self.assertEqual(1, cache.stats()['expired'])
+
+    def test_concurrent_requests(self):
+        def _slow_locate(*args, **kwargs):
+            sleep(0.01)
+            return self._content_locate(*args, **kwargs)
+        self.container_client.content_locate.side_effect = _slow_locate
+        cache = LocateCache(self.container_client, size=0)
+        pile = GreenPile(4)
+        for _ in range(4):
+            pile.spawn(cache.content_locate, 'cid', 'A')
+        results = list(pile)
+        self.assertEqual(4, len(results))
+        self.assertEqual(1, self.container_client.content_locate.call_count)
+        self.assertEqual(0, len(cache))
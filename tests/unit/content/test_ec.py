@@ -0,0 +1,104 @@
+# Copyright (C) 2018 OpenIO SAS, as part of OpenIO SDS
+#
+# This library is free software; you can redistribute it and/or
+# modify it under the terms of the GNU Lesser General Public
+# License as published by the Free Software Foundation; either
+# version 3.0 of the License, or (at your option) any later version.
+#
+# This library is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# Lesser General Public License for more details.
+#
+# You should have received a copy of the GNU Lesser General Public
+# License along with this library.
+
+import unittest
+
+from mock import MagicMock as Mock, patch
+
+from oio.common.exceptions import OrphanChunk
+from oio.common.logger import get_logger
+from oio.common.storage_method import STORAGE_METHODS
+from oio.content.ec import ECContent
+from tests.utils import random_id
+
+
+class FakeRebuildHandler(object):
+    instances = list()
+
+    def __init__(self, meta_chunk, missing, storage_method, **_kwargs):
+        self.meta_chunk = meta_chunk
+        self.missing = missing
+        FakeRebuildHandler.instances.append(self)
+
+    def rebuild(self):
+        for i in range(3):
+            yield ['%d-%d|' % (index, i) for index in self.missing]
+
+
+class TestECContent(unittest.TestCase):
+    def setUp(self):
+        self.chunk_method = 'ec/algo=liberasurecode_rs_vand,k=6,m=2'
+        self.chunks = [
+            {'url': 'http://127.0.0.1:600%d/%s' % (i, random_id(64)),
+             'pos': '0.%d' % i, 'size': 18, 'hash': 'A' * 32}
+            for i in range(8)]
+        self.metadata = {'id': random_id(32), 'name': 'obj', 'length': '100',
+                         'version': '1', 'hash': 'B' * 32, 'policy': 'EC',
+                         'chunk_method': self.chunk_method}
+        self.container_client = Mock()
+        self.container_client.content_spare = Mock(return_value={
+            'chunks': [{'id': 'http://127.0.0.1:6010/' + random_id(64)},
+                       {'id': 'http://127.0.0.1:6011/' + random_id(64)}]})
+        self.uploaded = dict()
+
+        def _chunk_put(url, meta, data, **_kwargs):
+            self.uploaded[url] = (meta['chunk_pos'], ''.join(data))
+        self.blob_client = Mock()
+        self.blob_client.chunk_put = Mock(side_effect=_chunk_put)
+        FakeRebuildHandler.instances = list()
+
+    def _content(self):
+        return ECContent(
+            {'namespace': 'NS'}, random_id(64), self.metadata, self.chunks,
+            STORAGE_METHODS.load(self.chunk_method), 'acct', 'ct',
+            blob_client=self.blob_client,
+            container_client=self.container_client,
+            logger=get_logger(None))
+
+    @patch('oio.content.ec.ECRebuildHandler', FakeRebuildHandler)
+    def test_rebuild_chunks_single_pass(self):
+        content = self._content()
+        errors = content.rebuild_chunks(
+            [(self.chunks[4]['url'].split('/')[-1], None),
+             ('invalid', None),
+             (None, '0.1')])
+        self.assertIsNone(errors[0])
+        self.assertIsInstance(errors[1], OrphanChunk)
+        self.assertIsNone(errors[2])
+
+        # The remaining fragments are read once to rebuild both chunks
+        self.assertEqual(1, len(FakeRebuildHandler.instances))
+        handler = FakeRebuildHandler.instances[0]
+        self.assertEqual([4, 1], handler.missing)
+        self.assertEqual(6, len(handler.meta_chunk))
+        self.assertEqual(
+            sorted([('0.4', '4-0|4-1|4-2|'), ('0.1', '1-0|1-1|1-2|')]),
+            sorted(self.uploaded.values()))
+        self.assertEqual(
+            2, self.container_client.container_raw_update.call_count)
+
+    @patch('oio.content.ec.ECRebuildHandler', FakeRebuildHandler)
+    def test_rebuild_chunks_upload_failure(self):
+        def _chunk_put(url, meta, data, **_kwargs):
+            if meta['chunk_pos'] == '0.1':
+                raise Exception('upload failed')
+            self.uploaded[url] = (meta['chunk_pos'], ''.join(data))
+        self.blob_client.chunk_put.side_effect = _chunk_put
+        content = self._content()
+        errors = content.rebuild_chunks(
+            [(None, '0.1'), (None, '0.4')])
+        self.assertIsNotNone(errors[0])
+        self.assertIsNone(errors[1])
+        self.assertEqual([('0.4', '4-0|4-1|4-2|')], self.uploaded.values())
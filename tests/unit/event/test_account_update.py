@@ -0,0 +1,118 @@
+# Copyright (C) 2018 OpenIO SAS
+
+# This library is free software; you can redistribute it and/or
+# modify it under the terms of the GNU Lesser General Public
+# License as published by the Free Software Foundation; either
+# version 3.0 of the License, or (at your option) any later version.
+# This library is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# Lesser General Public License for more details.
+# You should have received a copy of the GNU Lesser General Public
+# License along with this library.
+
+
+import unittest
+
+from mock import MagicMock as Mock
+
+from oio.common.exceptions import ClientException
+from oio.common.green import GreenPile
+from oio.event.consumer import EventTypes
+from oio.event.filters.account_update import AccountUpdateFilter, \
+    PendingUpdate
+
+
+def container_event(account, container, when):
+    return {'event': EventTypes.CONTAINER_STATE, 'when': when * 1000000,
+            'url': {'ns': 'NS', 'account': account, 'user': container},
+            'data': {'bytes-count': when, 'object-count': 1}}
+
+
+class TestAccountUpdateFilter(unittest.TestCase):
+
+    def setUp(self):
+        self.conf = {'namespace': 'NS',
+                     'proxyd_url': 'http://127.0.0.1:6000'}
+        self.filter = AccountUpdateFilter(Mock(app_env=dict()), self.conf)
+        self.updates = [PendingUpdate('acct', 'ct%d' % i, {'mtime': i})
+                        for i in range(3)]
+
+    def test_send_updates(self):
+        self.filter.account.container_update_many = Mock(
+            return_value=[{'status': 200}, {'status': 409, 'message': 'no'},
+                          {'status': 200}])
+        self.filter._send_updates('acct', self.updates)
+        self.assertEqual([(200, None), (409, 'no'), (200, None)],
+                         [u.wait() for u in self.updates])
+
+    def test_send_updates_missing_results(self):
+        self.filter.account.container_update_many = Mock(
+            return_value=[{'status': 200}])
+        self.filter._send_updates('acct', self.updates)
+        self.assertEqual((200, None), self.updates[0].wait())
+        # The updates without result are not left waiting
+        for update in self.updates[1:]:
+            self.assertTrue(update.result.ready())
+            self.assertEqual(500, update.wait()[0])
+
+    def test_update_container_not_coalesced(self):
+        self.filter.account.container_update = Mock(
+            side_effect=[None,
+                         ClientException(409, message='No update needed')])
+        self.filter.account.container_update_many = Mock()
+        self.assertEqual((200, None), self.filter._update_container(
+            'acct', 'ct', {'name': 'ct', 'mtime': 1}))
+        self.assertEqual((409, 'No update needed'),
+                         self.filter._update_container(
+                             'acct', 'ct', {'name': 'ct', 'mtime': 2}))
+        self.filter.account.container_update_many.assert_not_called()
+
+    def test_update_container_coalesced(self):
+        self.conf['coalesce_window'] = '10'
+        self.conf['concurrency'] = '3'
+        self.filter = AccountUpdateFilter(Mock(app_env=dict()), self.conf)
+        self.filter.account.container_update_many = Mock(
+            side_effect=lambda account, updates, **kwargs:
+                [{'status': 200}] * len(updates))
+        pile = GreenPile(3)
+        for name, mtime in (('ct0', 1), ('ct1', 1), ('ct0', 2)):
+            pile.spawn(self.filter._update_container,
+                       'acct', name, {'name': name, 'mtime': mtime})
+        # The updates are sent when the 3 events are waiting,
+        # long before the end of the window
+        self.assertEqual([(200, None)] * 3, list(pile))
+        self.filter.account.container_update_many.assert_called_once()
+        updates = self.filter.account.container_update_many.call_args[0][1]
+        self.assertEqual({'ct0': 2, 'ct1': 1},
+                         {u['name']: u['mtime'] for u in updates})
+
+    def test_process_batch(self):
+        app = Mock(app_env=dict())
+        self.conf['coalesce_window'] = '10'
+        self.filter = AccountUpdateFilter(app, self.conf)
+
+        def _update_many(account, updates, **kwargs):
+            return [{'status': 500 if u['name'] == 'bad' else 200}
+                    for u in updates]
+        self.filter.account.container_update_many = Mock(
+            side_effect=_update_many)
+        envs = [container_event('acct1', 'ct', 1),
+                container_event('acct2', 'ct', 1),
+                container_event('acct1', 'ct', 2),
+                container_event('acct1', 'bad', 1)]
+        statuses = dict()
+        cbs = [lambda status, _msg, i=i: statuses.__setitem__(i, status)
+               for i in range(len(envs))]
+        self.filter.process_batch(envs, cbs)
+
+        # One request per account, without waiting for the window
+        calls = self.filter.account.container_update_many.call_args_list
+        self.assertEqual(2, len(calls))
+        updates = {call[0][0]: call[0][1] for call in calls}
+        self.assertEqual([('ct', 2), ('bad', 1)],
+                         [(u['name'], u['bytes']) for u in updates['acct1']])
+        self.assertEqual(['ct'], [u['name'] for u in updates['acct2']])
+        # The failed event is answered, the others go on
+        self.assertEqual([3], statuses.keys())
+        app.process_batch.assert_called_once_with(envs[:3], cbs[:3])
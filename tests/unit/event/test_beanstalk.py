@@ -0,0 +1,197 @@
+# Copyright (C) 2018 OpenIO SAS
+
+# This library is free software; you can redistribute it and/or
+# modify it under the terms of the GNU Lesser General Public
+# License as published by the Free Software Foundation; either
+# version 3.0 of the License, or (at your option) any later version.
+# This library is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# Lesser General Public License for more details.
+# You should have received a copy of the GNU Lesser General Public
+# License along with this library.
+
+
+import logging
+import unittest
+from collections import deque
+
+import eventlet
+
+from oio.common.json import json
+from oio.event.beanstalk import Beanstalk, ResponseError
+from oio.event.consumer import EventWorker, StopServe
+
+
+class FakeBeanstalkd(object):
+    """
+    Minimal beanstalkd, with a single tube, counting the commands
+    and the network reads it handles.
+    """
+
+    def __init__(self):
+        self.ready = deque()
+        self.reserved = dict()
+        self.deleted = list()
+        self.buried = list()
+        self.commands = 0
+        self.reads = 0
+        self.next_id = 1
+        self.sock = eventlet.listen(('127.0.0.1', 0))
+        self.url = 'beanstalk://127.0.0.1:%d' % self.sock.getsockname()[1]
+        self.thread = eventlet.spawn(self._accept)
+
+    def put(self, body):
+        self.ready.append((str(self.next_id), body))
+        self.next_id += 1
+
+    def _accept(self):
+        while True:
+            conn, _ = self.sock.accept()
+            eventlet.spawn(self._handle, conn)
+
+    def _reserve(self, timeout):
+        deadline = None if timeout is None else \
+            eventlet.hubs.get_hub().clock() + timeout
+        while not self.ready:
+            if deadline is not None and \
+                    eventlet.hubs.get_hub().clock() >= deadline:
+                return 'TIMED_OUT\r\n'
+            eventlet.sleep(0.001)
+        job_id, body = self.ready.popleft()
+        self.reserved[job_id] = body
+        return 'RESERVED %s %d\r\n%s\r\n' % (job_id, len(body), body)
+
+    def _command(self, args):
+        self.commands += 1
+        if args[0] in ('use', 'watch'):
+            return '%s %s\r\n' % ('USING' if args[0] == 'use' else
+                                  'WATCHING', args[1])
+        if args[0] == 'reserve':
+            return self._reserve(None)
+        if args[0] == 'reserve-with-timeout':
+            return self._reserve(float(args[1]))
+        body = self.reserved.pop(args[1], None)
+        if body is None:
+            return 'NOT_FOUND\r\n'
+        if args[0] == 'delete':
+            self.deleted.append(args[1])
+            return 'DELETED\r\n'
+        if args[0] == 'bury':
+            self.buried.append(args[1])
+            return 'BURIED\r\n'
+        if args[0] == 'release':
+            self.ready.append((args[1], body))
+            return 'RELEASED\r\n'
+        return 'UNKNOWN_COMMAND\r\n'
+
+    def _handle(self, conn):
+        buf = ''
+        while True:
+            data = conn.recv(65536)
+            if not data:
+                break
+            self.reads += 1
+            buf += data
+            out = list()
+            while '\r\n' in buf:
+                line, buf = buf.split('\r\n', 1)
+                out.append(self._command(line.split()))
+            conn.sendall(''.join(out))
+        conn.close()
+
+    def stop(self):
+        self.thread.kill()
+        self.sock.close()
+
+
+class BeanstalkTest(unittest.TestCase):
+
+    def setUp(self):
+        super(BeanstalkTest, self).setUp()
+        self.server = FakeBeanstalkd()
+        self.beanstalk = Beanstalk.from_url(self.server.url)
+
+    def tearDown(self):
+        super(BeanstalkTest, self).tearDown()
+        self.beanstalk.close()
+        self.server.stop()
+
+    def test_reserve_many(self):
+        for i in range(3):
+            self.server.put('job%d' % i)
+        jobs = self.beanstalk.reserve_many(5, timeout=0)
+        self.assertEqual([('1', 'job0'), ('2', 'job1'), ('3', 'job2')], jobs)
+        self.assertEqual(1, self.server.reads)
+        self.assertEqual([], self.beanstalk.reserve_many(5, timeout=0))
+
+    def test_execute_many(self):
+        for i in range(2):
+            self.server.put('job%d' % i)
+        self.beanstalk.reserve_many(2, timeout=0)
+        results = self.beanstalk.execute_many(
+            [('delete', '1'), ('delete', '42'), ('bury', '2', 1)])
+        self.assertEqual(('DELETED', []), results[0])
+        self.assertIsInstance(results[1], ResponseError)
+        self.assertEqual(('BURIED', []), results[2])
+        self.assertEqual(['1'], self.server.deleted)
+        self.assertEqual(['2'], self.server.buried)
+
+
+class BatchHandler(object):
+
+    def __init__(self):
+        self.processed = list()
+        self.batches = list()
+
+    def __call__(self, event, cb):
+        self.processed.append(event['job_id'])
+        if event['data'] == 'bury':
+            raise Exception('oops')
+        cb(200, None)
+
+    def process_batch(self, events, cbs):
+        eventlet.sleep(0.001)
+        self.batches.append(len(events))
+        for event, cb in zip(events, cbs):
+            self(event, cb)
+
+
+class BatchedEventWorkerTest(unittest.TestCase):
+
+    def setUp(self):
+        super(BatchedEventWorkerTest, self).setUp()
+        self.server = FakeBeanstalkd()
+        self.worker = EventWorker.__new__(EventWorker)
+        self.worker.logger = logging.getLogger('test')
+        self.worker.tube = None
+        self.worker.concurrency = 8
+        self.worker.reserve_batch_size = 4
+        self.handler = BatchHandler()
+        self.worker.handlers = {'test.event': self.handler}
+
+    def tearDown(self):
+        super(BatchedEventWorkerTest, self).tearDown()
+        self.server.stop()
+
+    def test_handle_batched(self):
+        for i in range(20):
+            self.server.put(json.dumps({'event': 'test.event', 'data': i}))
+        self.server.put(json.dumps({'event': 'test.event', 'data': 'bury'}))
+        self.server.put('not json')
+        beanstalk = Beanstalk.from_url(self.server.url)
+        gt = eventlet.spawn(self.worker.handle_batched, beanstalk)
+        while len(self.server.deleted) + len(self.server.buried) < 22:
+            eventlet.sleep(0.01)
+        gt.kill(StopServe())
+        beanstalk.close()
+
+        self.assertEqual(21, len(self.handler.processed))
+        self.assertEqual(20, len(self.server.deleted))
+        self.assertEqual(['21', '22'], sorted(self.server.buried))
+        self.assertEqual({}, self.server.reserved)
+        # reservations and acknowledgements are sent by batches,
+        # events are passed to the handler by batches
+        self.assertLess(self.server.reads, 22)
+        self.assertLess(len(self.handler.batches), 21)
+        self.assertTrue(all(size <= 4 for size in self.handler.batches))
@@ -0,0 +1,81 @@
+# Copyright (C) 2018 OpenIO SAS
+
+# This library is free software; you can redistribute it and/or
+# modify it under the terms of the GNU Lesser General Public
+# License as published by the Free Software Foundation; either
+# version 3.0 of the License, or (at your option) any later version.
+# This library is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# Lesser General Public License for more details.
+# You should have received a copy of the GNU Lesser General Public
+# License along with this library.
+
+
+import unittest
+
+from oio.event.consumer import EventTypes
+from oio.event.filters.volume_index import VolumeIndexFilter
+from oio.event.loader import _batch_capable
+
+
+class FakeRdir(object):
+
+    def __init__(self):
+        self.calls = list()
+
+    def chunk_push_many(self, entries, batch_size=None):
+        self.calls.extend(('push', e['volume_id'], e['chunk_id'])
+                          for e in entries)
+        return list()
+
+    def chunk_delete_many(self, entries, batch_size=None):
+        self.calls.extend(('delete', e['volume_id'], e['chunk_id'])
+                          for e in entries)
+        return [(entries[0], Exception('oops'))]
+
+
+class FakeApp(object):
+
+    def __init__(self):
+        self.app_env = dict()
+        self.rdir = FakeRdir()
+        self.events = list()
+
+    def __call__(self, env, cb):
+        self.events.append(env)
+        cb(200, None)
+
+
+def chunk_event(event_type, volume_id, chunk_id):
+    return {'event': event_type, 'when': 1000000, 'request_id': 'req',
+            'data': {'volume_id': volume_id, 'container_id': 'cid',
+                     'content_id': 'content', 'chunk_id': chunk_id}}
+
+
+class VolumeIndexFilterTest(unittest.TestCase):
+
+    def setUp(self):
+        super(VolumeIndexFilterTest, self).setUp()
+        self.app = FakeApp()
+        self.filter = VolumeIndexFilter(_batch_capable(self.app),
+                                        {'rdir_concurrency': '2'})
+
+    def test_process_batch(self):
+        envs = [chunk_event(EventTypes.CHUNK_NEW, 'vol1', 'A'),
+                chunk_event(EventTypes.CHUNK_NEW, 'vol2', 'B'),
+                chunk_event(EventTypes.CHUNK_NEW, 'vol1', 'C'),
+                chunk_event(EventTypes.CHUNK_DELETED, 'vol1', 'A'),
+                {'event': 'storage.unknown', 'when': 1000000}]
+        statuses = list()
+        cbs = [lambda status, _msg: statuses.append(status)
+               for _ in envs]
+        self.filter.process_batch(envs, cbs)
+
+        self.assertEqual([200] * 5, statuses)
+        self.assertEqual(5, len(self.app.events))
+        self.assertEqual(4, len(self.app.rdir.calls))
+        vol1 = [call for call in self.app.rdir.calls if call[1] == 'vol1']
+        # the deletion comes after both pushes of the volume
+        self.assertEqual(('delete', 'vol1', 'A'), vol1[-1])
+        self.assertIn(('push', 'vol2', 'B'), self.app.rdir.calls)
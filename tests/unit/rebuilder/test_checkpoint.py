@@ -0,0 +1,197 @@
+# Copyright (C) 2018 OpenIO SAS, as part of OpenIO SDS
+#
+# This library is free software; you can redistribute it and/or
+# modify it under the terms of the GNU Lesser General Public
+# License as published by the Free Software Foundation; either
+# version 3.0 of the License, or (at your option) any later version.
+#
+# This library is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# Lesser General Public License for more details.
+#
+# You should have received a copy of the GNU Lesser General Public
+# License along with this library.
+
+import os
+import shutil
+import tempfile
+import unittest
+
+from mock import MagicMock as Mock, patch
+
+from oio.common.exceptions import NotFound
+from oio.common.green import Queue
+from oio.common.logger import get_logger
+from oio.common.utils import cid_from_name
+from oio.rebuilder.blob_rebuilder import BlobRebuilder, BlobRebuilderWorker
+from oio.rebuilder.checkpoint import RebuilderCheckpoint
+from oio.rebuilder.meta1_rebuilder import Meta1Rebuilder
+from tests.utils import random_id
+
+
+class TestRebuilderCheckpoint(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.path = os.path.join(self.tmpdir, 'checkpoint.db')
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def test_queued_and_done(self):
+        checkpoint = RebuilderCheckpoint(self.path)
+        checkpoint.queued([('a', ['a', 1]), ('b', ['b', 2])], marker='b')
+        checkpoint.queued([('c', ['c', 3])], marker='c')
+        checkpoint.done(['b'])
+        checkpoint.set('counters', {'items_processed': 1})
+        checkpoint.close()
+
+        checkpoint = RebuilderCheckpoint(self.path)
+        self.assertEqual('c', checkpoint.marker)
+        self.assertEqual([['a', 1], ['c', 3]], checkpoint.pending_items())
+        self.assertEqual({'items_processed': 1}, checkpoint.get('counters'))
+        checkpoint.reset()
+        self.assertIsNone(checkpoint.marker)
+        self.assertEqual(0, len(checkpoint))
+        checkpoint.close()
+
+    def test_seen(self):
+        checkpoint = RebuilderCheckpoint(self.path)
+        checkpoint.seen('a')
+        checkpoint.seen('b')
+        checkpoint.seen('a')
+        checkpoint.close()
+
+        checkpoint = RebuilderCheckpoint(self.path)
+        self.assertEqual({'a', 'b'}, checkpoint.seen_keys())
+        checkpoint.reset()
+        self.assertEqual(set(), checkpoint.seen_keys())
+        checkpoint.close()
+
+
+class TestMeta1RebuilderResume(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.conf = {'namespace': 'NS',
+                     'proxyd_url': 'http://127.0.0.1:6000',
+                     'checkpoint_file':
+                         os.path.join(self.tmpdir, 'checkpoint.db')}
+        # Containers whose CIDs start with a few prefixes, several times
+        self.containers = [('AUTH_test', 'container-%03d' % i)
+                           for i in range(200)]
+        self.prefixes = sorted(set(
+            cid_from_name(*container)[:1] for container in self.containers))
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def _fill_queue(self, containers):
+        with patch('oio.rebuilder.meta1_rebuilder.load_namespace_conf',
+                   Mock(return_value={})), \
+                patch('oio.rebuilder.meta_rebuilder.ObjectStorageApi'):
+            rebuilder = Meta1Rebuilder(self.conf, get_logger(None))
+        rebuilder.meta1_digits = 1
+        rebuilder.conscience = Mock(all_services=Mock(return_value=[]))
+        rebuilder._full_account_container_list = Mock(
+            return_value=iter(containers))
+        rebuilder.checkpoint = RebuilderCheckpoint(
+            self.conf['checkpoint_file'])
+        queue = Queue()
+        rebuilder._fill_queue(queue)
+        queued = list()
+        while not queue.empty():
+            prefix = queue.get()
+            queued.append(prefix[:1])
+            rebuilder.item_done(prefix)
+        rebuilder.checkpoint.close()
+        return queued
+
+    def test_resume(self):
+        queued = self._fill_queue(self.containers[:100])
+        checkpoint = RebuilderCheckpoint(self.conf['checkpoint_file'])
+        # The marker follows the listing, even when no prefix is queued
+        self.assertEqual(list(self.containers[99]), checkpoint.marker)
+        checkpoint.close()
+
+        self.conf['resume'] = 'true'
+        queued += self._fill_queue(self.containers[100:])
+        # Each prefix is queued once over both runs
+        self.assertEqual(self.prefixes, sorted(queued))
+
+
+class TestBlobRebuilderResume(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.conf = {'namespace': 'NS',
+                     'proxyd_url': 'http://127.0.0.1:6000',
+                     'workers': '2',
+                     'checkpoint_file':
+                         os.path.join(self.tmpdir, 'checkpoint.db')}
+        self.input_file = os.path.join(self.tmpdir, 'chunks')
+        self.chunks = list()
+        for _ in range(3):
+            cid, content_id = random_id(64), random_id(32)
+            for _ in range(2):
+                self.chunks.append([cid, content_id, random_id(64)])
+        with open(self.input_file, 'w') as ifile:
+            ifile.write('# broken chunks\n')
+            for chunk in self.chunks:
+                ifile.write('|'.join(chunk) + '\n')
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def _rebuilder_pass(self):
+        rebuilt = list()
+
+        def _chunks_rebuild(_self, cid, content_id, chunk_ids, **kwargs):
+            rebuilt.extend(chunk_ids)
+            return [(8, None)] * len(chunk_ids)
+
+        rebuilder = BlobRebuilder(self.conf, get_logger(None), None,
+                                  input_file=self.input_file)
+        rebuilder.locate_cache.content_locate = Mock(
+            side_effect=NotFound('content not found'))
+        with patch.object(BlobRebuilderWorker, 'chunks_rebuild',
+                          _chunks_rebuild):
+            self.assertTrue(rebuilder.rebuilder_pass())
+        return rebuilder, rebuilt
+
+    def test_checkpoint(self):
+        rebuilder, rebuilt = self._rebuilder_pass()
+        self.assertEqual(6, len(rebuilt))
+        self.assertEqual(6, rebuilder.total_expected_items)
+        checkpoint = RebuilderCheckpoint(self.conf['checkpoint_file'])
+        self.assertEqual('|'.join(self.chunks[-1]), checkpoint.marker)
+        self.assertEqual([], checkpoint.pending_items())
+        self.assertEqual(
+            {'items_processed': 6, 'errors': 0, 'bytes_processed': 48},
+            checkpoint.get('counters'))
+        checkpoint.close()
+
+    def test_resume(self):
+        # The first content has been rebuilt, the second one was in
+        # progress when the rebuilder has been interrupted.
+        checkpoint = RebuilderCheckpoint(self.conf['checkpoint_file'])
+        checkpoint.set('expected', 6)
+        checkpoint.set('counters', {'items_processed': 2, 'errors': 0,
+                                    'bytes_processed': 16})
+        checkpoint.queued([('|'.join(chunk), chunk)
+                           for chunk in self.chunks[2:4]],
+                          marker='|'.join(self.chunks[3]))
+        checkpoint.close()
+
+        self.conf['resume'] = 'true'
+        rebuilder, rebuilt = self._rebuilder_pass()
+        self.assertEqual([chunk[2] for chunk in self.chunks[2:]], rebuilt)
+        self.assertEqual(6, rebuilder.total_items_processed)
+        self.assertEqual(48, rebuilder.total_bytes_processed)
+        self.assertIn(' progress=6/6 100.00%',
+                      rebuilder._get_report('DONE', rebuilder.start_time,
+                                            rebuilder.update_totals()))
+
+        # Without --resume, everything is rebuilt again
+        self.conf['resume'] = 'false'
+        rebuilder, rebuilt = self._rebuilder_pass()
+        self.assertEqual(6, len(rebuilt))
+        self.assertEqual(6, rebuilder.total_items_processed)
@@ -0,0 +1,119 @@
+# Copyright (C) 2018 OpenIO SAS, as part of OpenIO SDS
+#
+# This library is free software; you can redistribute it and/or
+# modify it under the terms of the GNU Lesser General Public
+# License as published by the Free Software Foundation; either
+# version 3.0 of the License, or (at your option) any later version.
+#
+# This library is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# Lesser General Public License for more details.
+#
+# You should have received a copy of the GNU Lesser General Public
+# License along with this library.
+
+import time
+import unittest
+
+from mock import MagicMock as Mock, patch
+
+from oio.rebuilder.rate_controller import MIB, RateController
+
+
+def _at(hour):
+    return time.mktime((2018, 6, 1, hour, 30, 0, 0, 0, -1))
+
+
+class TestRateController(unittest.TestCase):
+    def test_from_conf(self):
+        self.assertIsNone(RateController.from_conf({'namespace': 'NS'}))
+        controller = RateController.from_conf(
+            {'namespace': 'NS', 'proxyd_url': 'http://127.0.0.1:6000',
+             'bytes_per_second': '1000', 'off_peak_hours': '22-6'})
+        self.assertEqual(1000, controller.rate)
+        self.assertEqual(100, controller.min_bytes_per_second)
+        self.assertEqual((22, 6), controller.off_peak_hours)
+        self.assertIsNotNone(controller.conscience)
+
+    def test_latency(self):
+        controller = RateController(10 * MIB)
+        now = _at(12)
+        # Stable latency: ramp up to the maximum
+        controller.rate = 5 * MIB
+        for i in range(20):
+            controller.update(4 * MIB, 0.4, now=now + i)
+        self.assertEqual(10 * MIB, controller.rate)
+        # The rawx services are getting slower: back off
+        for i in range(20, 30):
+            controller.update(4 * MIB, 4.0, now=now + i)
+        self.assertLess(controller.rate, 3 * MIB)
+        self.assertGreaterEqual(controller.rate, MIB)
+        # Several updates in the same second adjust the rate once
+        controller.rate = rate = 5 * MIB
+        controller.update(4 * MIB, 4.0, now=now + 30)
+        controller.update(4 * MIB, 4.0, now=now + 30.5)
+        self.assertEqual(rate * 0.7, controller.rate)
+
+    def test_failures(self):
+        controller = RateController(10 * MIB)
+        now = _at(12)
+        # Only failures (e.g. timeouts): back off
+        controller.update(0, 5.0, items=0, failures=1, now=now)
+        self.assertEqual(7 * MIB, controller.rate)
+        for i in range(1, 5):
+            controller.update(4 * MIB, 0.4, now=now + i)
+        rate = controller.rate
+        for i in range(5, 10):
+            controller.update(0, 0.01, items=0, failures=2, now=now + i)
+        self.assertLess(controller.rate, rate)
+
+        # Failed items cost as much as the average item
+        self.assertEqual(4 * MIB, controller.item_size)
+        controller.rate = MIB
+        slept = list()
+        with patch('oio.rebuilder.rate_controller.sleep', slept.append):
+            controller.wait(0, failures=1)
+            controller.wait(0, failures=1)
+        self.assertAlmostEqual(4.0, slept[0], delta=0.1)
+
+    def test_off_peak(self):
+        controller = RateController(10 * MIB, off_peak_hours='22-6',
+                                    off_peak_factor=3.0)
+        self.assertEqual(10 * MIB, controller.max_rate(_at(12)))
+        self.assertEqual(30 * MIB, controller.max_rate(_at(23)))
+        self.assertEqual(30 * MIB, controller.max_rate(_at(2)))
+        self.assertEqual(10 * MIB, controller.max_rate(_at(6)))
+        for i in range(50):
+            controller.update(MIB, 0.1, now=_at(23) + i)
+        self.assertEqual(30 * MIB, controller.rate)
+        # Back to the daytime limit
+        controller.update(MIB, 0.1, now=_at(8) + 86400)
+        self.assertEqual(10 * MIB, controller.rate)
+
+    def test_scores(self):
+        conscience = Mock()
+        conscience.all_services = Mock(return_value=[
+            {'addr': '127.0.0.1:6010', 'score': 80},
+            {'addr': '127.0.0.1:6011', 'score': 20},
+            {'addr': '127.0.0.1:6012', 'score': 100},
+            {'addr': '127.0.0.1:6013', 'score': 100},
+            {'addr': '127.0.0.1:6014', 'score': 100},
+            {'addr': '127.0.0.1:6015', 'score': 100}])
+        controller = RateController(1000, conscience=conscience)
+        controller.refresh_scores()
+        controller.refresh_scores()
+        self.assertEqual(1, conscience.all_services.call_count)
+        self.assertEqual(0.8, controller.score_factor(['127.0.0.1:6010']))
+        self.assertEqual(0.2, controller.score_factor(
+            ['127.0.0.1:6010', '127.0.0.1:6011']))
+        # Not below the minimum rate
+        controller.scores['127.0.0.1:6011'] = 0
+        self.assertEqual(0.1, controller.score_factor(['127.0.0.1:6011']))
+
+        slept = list()
+        with patch('oio.rebuilder.rate_controller.sleep', slept.append):
+            controller.wait(800, ['127.0.0.1:6010'])
+            controller.wait(100)
+        self.assertEqual(1, len(slept))
+        self.assertAlmostEqual(1.0, slept[0], delta=0.1)
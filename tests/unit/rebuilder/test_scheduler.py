@@ -0,0 +1,140 @@
+# Copyright (C) 2018 OpenIO SAS, as part of OpenIO SDS
+#
+# This library is free software; you can redistribute it and/or
+# modify it under the terms of the GNU Lesser General Public
+# License as published by the Free Software Foundation; either
+# version 3.0 of the License, or (at your option) any later version.
+#
+# This library is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# Lesser General Public License for more details.
+#
+# You should have received a copy of the GNU Lesser General Public
+# License along with this library.
+
+import unittest
+
+from mock import MagicMock as Mock
+
+from oio.common.exceptions import NotFound
+from oio.common.green import GreenPool, sleep
+from oio.common.logger import get_logger
+from oio.rebuilder.blob_rebuilder import BlobRebuilder, \
+    UNKNOWN_RISK_PRIORITY
+from oio.rebuilder.scheduler import RebuildScheduler
+from tests.utils import random_id
+
+
+class TestRebuildScheduler(unittest.TestCase):
+    def test_priority(self):
+        queue = RebuildScheduler()
+        for item, priority in (('a', 2), ('b', 0), ('c', 2), ('d', 1)):
+            queue.put(item, priority=priority)
+        items = list()
+        while len(queue):
+            items.append(queue.get())
+            queue.task_done(items[-1])
+        self.assertEqual(['b', 'd', 'a', 'c'], items)
+        queue.join()
+
+    def test_max_per_service(self):
+        queue = RebuildScheduler(max_per_service=1)
+        queue.put('a', services=['rawx1', 'rawx2'])
+        queue.put('b', services=['rawx2'])
+        queue.put('c', services=['rawx3'])
+        self.assertEqual('a', queue.get())
+        # 'b' would be the second item to read from rawx2
+        self.assertEqual('c', queue.get())
+        self.assertEqual({'rawx1': 1, 'rawx2': 1, 'rawx3': 1},
+                         dict(queue.running))
+        queue.task_done('a')
+        self.assertEqual('b', queue.get())
+        queue.task_done('b')
+        queue.task_done('c')
+        self.assertEqual({}, dict(queue.running))
+
+    def test_workers(self):
+        queue = RebuildScheduler(maxsize=2, max_per_service=2)
+        running = dict()
+        peak = dict()
+
+        def _worker():
+            while True:
+                item = queue.get()
+                service = item[1]
+                running[service] = running.get(service, 0) + 1
+                peak[service] = max(peak.get(service, 0), running[service])
+                sleep(0.001)
+                running[service] -= 1
+                queue.task_done(item)
+
+        pool = GreenPool(5)
+        for _ in range(5):
+            pool.spawn(_worker)
+        for i in range(30):
+            item = (i, 'rawx%d' % (i % 2))
+            queue.put(item, services=[item[1]])
+        queue.join()
+        for greenthread in list(pool.coroutines_running):
+            greenthread.kill()
+        self.assertEqual({'rawx0': 2, 'rawx1': 2}, peak)
+
+
+class TestBlobRebuilderScheduling(unittest.TestCase):
+    def setUp(self):
+        self.rebuilder = BlobRebuilder(
+            {'namespace': 'NS', 'proxyd_url': 'http://127.0.0.1:6000'},
+            get_logger(None), '127.0.0.1:6010')
+        self.cid = random_id(64)
+
+    def _locate(self, chunk_method, hosts):
+        chunks = [{'url': 'http://%s/%s' % (host, random_id(64)),
+                   'pos': pos, 'size': 1, 'hash': 'A' * 32}
+                  for pos, host in hosts]
+        self.rebuilder.locate_cache.content_locate = Mock(
+            return_value=({'chunk_method': chunk_method}, chunks))
+        return chunks
+
+    def test_replicated(self):
+        chunks = self._locate('plain/nb_copy=3',
+                              [('0', '127.0.0.1:6010'),
+                               ('0', '127.0.0.1:6011'),
+                               ('0', '127.0.0.1:6012')])
+        batch = [[self.cid, random_id(32), chunks[0]['url'], None]]
+        self.assertEqual(
+            (1, ['127.0.0.1:6011', '127.0.0.1:6012']),
+            self.rebuilder._schedule_batch(batch))
+
+        # Down to a single copy
+        chunks = self._locate('plain/nb_copy=3',
+                              [('0', '127.0.0.1:6010'),
+                               ('0', '127.0.0.1:6012')])
+        self.assertEqual(
+            (0, ['127.0.0.1:6012']),
+            self.rebuilder._schedule_batch(batch))
+
+    def test_ec(self):
+        hosts = [('0.%d' % i, '127.0.0.1:60%d' % (10 + i)) for i in range(9)]
+        self._locate('ec/algo=liberasurecode_rs_vand,k=6,m=3', hosts)
+        batch = [[self.cid, random_id(32), '0.1', None],
+                 [self.cid, random_id(32), '0.4', None]]
+        priority, sources = self.rebuilder._schedule_batch(batch)
+        # One chunk is on the rebuilt volume, 2 others are broken
+        self.assertEqual(0, priority)
+        self.assertEqual(6, len(sources))
+        self.assertNotIn('127.0.0.1:6011', sources)
+
+    def test_unknown_risk(self):
+        batch = [[self.cid, random_id(32), '0.1', None]]
+        self.rebuilder.locate_cache.content_locate = Mock(
+            side_effect=NotFound('content not found'))
+        self.assertEqual((UNKNOWN_RISK_PRIORITY, ()),
+                         self.rebuilder._schedule_batch(batch))
+
+        # No chunk of the content is broken anymore
+        self._locate('plain/nb_copy=3',
+                     [('0', '127.0.0.1:6011'), ('0', '127.0.0.1:6012')])
+        batch = [[self.cid, random_id(32), random_id(64), None]]
+        self.assertEqual((UNKNOWN_RISK_PRIORITY, ()),
+                         self.rebuilder._schedule_batch(batch))
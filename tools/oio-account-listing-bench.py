@@ -0,0 +1,187 @@
+#!/usr/bin/env python
+
+# oio-account-listing-bench.py
+# Copyright (C) 2018 OpenIO SAS, as part of OpenIO SDS
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as
+# published by the Free Software Foundation, either version 3 of the
+# License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+"""
+Benchmark of the container listing of the account service.
+
+Fills an account with containers named "dirXXXX-YYYYYY" (1M by default,
+spread over 1000 "directories"), then pages through the listing with
+several prefix/delimiter combinations, with the server-side listing
+script of AccountBackend and with the former client-side algorithm,
+which needed one ZRANGEBYLEX per rolled up prefix plus an HMGET
+pipeline per page.
+
+Use a dedicated Redis database: it is flushed before and after the test.
+"""
+
+import time
+from optparse import OptionParser
+
+import redis
+
+from oio.account.backend import AccountBackend
+from oio.common.easy_value import float_value, int_value
+from oio.common.timestamp import Timestamp
+
+ACCOUNT = 'listing-bench'
+NB_DIRS = 1000
+FILL_BATCH_SIZE = 10000
+
+
+def fill_account(backend, nb_containers):
+    backend.create_account(ACCOUNT)
+    per_dir = max(nb_containers // NB_DIRS, 1)
+    mtime = Timestamp(time.time()).normal
+    updates = list()
+    for i in xrange(nb_containers):
+        updates.append({'name': 'dir%04d-%06d' % (i // per_dir, i % per_dir),
+                        'mtime': mtime, 'objects': 1, 'bytes': 1024})
+        if len(updates) >= FILL_BATCH_SIZE:
+            backend.update_containers(ACCOUNT, updates)
+            updates = list()
+    if updates:
+        backend.update_containers(ACCOUNT, updates)
+
+
+def legacy_raw_listing(conn, account_id, limit, marker, prefix, delimiter):
+    """Client-side prefix skip and delimiter rollup, as done before."""
+    if delimiter and not prefix:
+        prefix = ''
+    orig_marker = marker
+    results = []
+    while len(results) < limit:
+        min_ = '-'
+        if marker and marker >= prefix:
+            min_ = '(' + marker
+        elif prefix:
+            min_ = '[' + prefix
+        container_ids = conn.zrangebylex('containers:%s' % account_id, min_,
+                                         '+', 0, limit - len(results))
+        if not delimiter:
+            return [[c, 0, 0, 0, 0] for c in container_ids
+                    if c.startswith(prefix or '')]
+        count = 0
+        for container_id in container_ids:
+            count += 1
+            marker = container_id
+            if not container_id.startswith(prefix):
+                return results
+            end = container_id.find(delimiter, len(prefix))
+            if end > 0:
+                marker = container_id[:end] + chr(ord(delimiter) + 1)
+                dir_name = container_id[:end + 1]
+                if dir_name != orig_marker:
+                    results.append([dir_name, 0, 0, 1, 0])
+                break
+            results.append([container_id, 0, 0, 0, 0])
+        if not count:
+            break
+    return results
+
+
+def legacy_listing(conn, account_id, limit, marker, prefix, delimiter):
+    """Listing in two steps, as AccountBackend did it before."""
+    results = legacy_raw_listing(conn, account_id, limit, marker, prefix,
+                                 delimiter)
+    pipeline = conn.pipeline(True)
+    for container in [entry for entry in results if not entry[3]]:
+        pipeline.hmget(AccountBackend.ckey(account_id, container[0]),
+                       'objects', 'bytes', 'mtime')
+    res = iter(pipeline.execute())
+    for container in results:
+        if not container[3]:
+            counters = next(res)
+            container[1] = int_value(counters[0], 0)
+            container[2] = int_value(counters[1], 0)
+            container[4] = float_value(counters[2], 0.0)
+    return results
+
+
+def bench_listing(list_func, limit, max_pages, prefix, delimiter):
+    """
+    Page through the listing.
+
+    :returns: a tuple (elapsed seconds, number of pages, number of entries)
+    """
+    marker = None
+    pages = 0
+    entries = 0
+    start = time.time()
+    while pages < max_pages:
+        page = list_func(limit=limit, marker=marker, prefix=prefix,
+                         delimiter=delimiter)
+        pages += 1
+        entries += len(page)
+        if len(page) < limit:
+            break
+        marker = page[-1][0]
+    return time.time() - start, pages, entries
+
+
+def main():
+    parser = OptionParser()
+    parser.add_option("--redis-host", dest="redis_host", default="127.0.0.1")
+    parser.add_option("--redis-port", dest="redis_port", type="int",
+                      default=6379)
+    parser.add_option("--redis-db", dest="redis_db", type="int", default=15,
+                      help="Redis database to use, flushed (15)")
+    parser.add_option("-n", "--containers", dest="containers", type="int",
+                      default=1000000,
+                      help="Number of containers in the account (1000000)")
+    parser.add_option("-l", "--limit", dest="limit", type="int",
+                      default=1000, help="Size of listing pages (1000)")
+    parser.add_option("-p", "--pages", dest="pages", type="int", default=20,
+                      help="Maximum number of pages per test (20)")
+    options, _args = parser.parse_args()
+
+    conn = redis.StrictRedis(host=options.redis_host,
+                             port=options.redis_port, db=options.redis_db)
+    conn.flushdb()
+    backend = AccountBackend({}, conn)
+    start = time.time()
+    fill_account(backend, options.containers)
+    print "Filled %d containers in %.1fs" % (
+        options.containers, time.time() - start)
+
+    def new_listing(**kwargs):
+        return backend.list_containers(ACCOUNT, **kwargs)
+
+    def old_listing(**kwargs):
+        return legacy_listing(conn, ACCOUNT, **kwargs)
+
+    cases = (('no delimiter', None, None),
+             ('prefix', 'dir0500-', None),
+             ('delimiter', None, '-'),
+             ('sparse prefix', 'dir05', '-'))
+    print "%-14s %-8s %8s %8s %10s %10s" % (
+        "case", "listing", "pages", "entries", "seconds", "pages/s")
+    try:
+        for name, prefix, delimiter in cases:
+            for label, func in (('legacy', old_listing),
+                                ('script', new_listing)):
+                elapsed, pages, entries = bench_listing(
+                    func, options.limit, options.pages, prefix, delimiter)
+                print "%-14s %-8s %8d %8d %10.3f %10.1f" % (
+                    name, label, pages, entries, elapsed,
+                    pages / max(elapsed, 0.000001))
+    finally:
+        conn.flushdb()
+
+
+if __name__ == '__main__':
+    main()
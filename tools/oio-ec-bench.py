@@ -0,0 +1,104 @@
+#!/usr/bin/env python
+
+# oio-ec-bench.py
+# Copyright (C) 2018 OpenIO SAS, as part of OpenIO SDS
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as
+# published by the Free Software Foundation, either version 3 of the
+# License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+"""
+Micro-benchmark of the EC encoding path used by uploads.
+
+Feeds WRITE_CHUNK_SIZE blocks to the EC segmenter, like
+EcMetachunkWriter does, and reports the throughput and the growth
+of the peak resident memory per encoded segment. With several
+thread counts, shows how encoding scales with an EC coding pool.
+"""
+
+import os
+import resource
+import time
+from optparse import OptionParser
+
+from oio.api.ec import ECSegmenter, get_coding_pool
+from oio.api.io import WRITE_CHUNK_SIZE
+from oio.common.storage_method import STORAGE_METHODS
+
+DEFAULT_POLICIES = ('6+3', '12+3')
+EC_ALGO = 'liberasurecode_rs_vand'
+
+
+def max_rss():
+    """Peak resident memory of the process, in KiB."""
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+
+def load_method(policy, algo=EC_ALGO):
+    k, m = policy.split('+')
+    return STORAGE_METHODS.load('ec/algo=%s,k=%s,m=%s' % (algo, k, m))
+
+
+def bench_segmenter(storage_method, size, coding_pool=None):
+    """
+    Encode `size` bytes of random data.
+
+    :returns: a tuple (elapsed seconds, number of segments,
+        peak RSS growth in KiB)
+    """
+    nb_chunks = storage_method.ec_nb_data + storage_method.ec_nb_parity
+    blocks = [os.urandom(WRITE_CHUNK_SIZE) for _ in range(16)]
+    segmenter = ECSegmenter(storage_method, nb_chunks,
+                            coding_pool=coding_pool)
+    nb_segments = 0
+    rss_before = max_rss()
+    start = time.time()
+    sent = 0
+    while sent < size:
+        result = segmenter.feed(blocks[(sent // WRITE_CHUNK_SIZE) % 16])
+        sent += WRITE_CHUNK_SIZE
+        if result:
+            nb_segments += len(result[0])
+    nb_segments += len(segmenter.flush()[0])
+    elapsed = time.time() - start
+    return elapsed, nb_segments, max_rss() - rss_before
+
+
+def main():
+    parser = OptionParser(usage="%prog [options] [K+M ...]")
+    parser.add_option("-s", "--size", type="int", dest="size",
+                      default=256,
+                      help="Amount of data to encode, in MiB (256)")
+    parser.add_option("-a", "--algo", dest="algo", default=EC_ALGO,
+                      help="Erasure coding algorithm (%s)" % EC_ALGO)
+    parser.add_option("-t", "--threads", dest="threads", default="1",
+                      help="Comma-separated list of EC coding thread "
+                           "counts to try (1)")
+    options, args = parser.parse_args()
+    policies = args or DEFAULT_POLICIES
+    size = options.size * 1024 * 1024
+    threads = [int(x) for x in options.threads.split(',')]
+
+    print "%-8s %8s %10s %10s %16s" % ("policy", "threads", "MB/s",
+                                       "segments", "RSS KiB/segment")
+    for policy in policies:
+        storage_method = load_method(policy, options.algo)
+        for nb_threads in threads:
+            elapsed, nb_segments, rss_growth = bench_segmenter(
+                storage_method, size, get_coding_pool(nb_threads))
+            print "%-8s %8d %10.1f %10d %16.2f" % (
+                policy, nb_threads, size / elapsed / 1000000.0, nb_segments,
+                float(rss_growth) / max(nb_segments, 1))
+
+
+if __name__ == '__main__':
+    main()